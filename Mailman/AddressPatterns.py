@@ -0,0 +1,154 @@
+# Copyright (C) 2026 by the Free Software Foundation, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+
+"""Compiled address pattern lists.
+
+ban_list, GLOBAL_BAN_LIST, the *_these_nonmembers options and
+dmarc_moderation_addresses are lists of plain addresses, regular expressions
+starting with `^', and (for the *_these_nonmembers options) `@listname'
+references to the members of another list.  MailList.GetPattern() matches
+addresses against them with the compiled AddressPatterns kept here, which are
+cached until the pattern list changes.  The members of referenced lists are
+kept in an index which is refreshed when the list's config.pck changes.
+"""
+
+import os
+import re
+
+from Mailman import Utils
+from Mailman import Site
+from Mailman import Errors
+from Mailman.Logging.Syslog import syslog
+
+# The compiled pattern lists are forgotten when there are more than this many
+# of them, e.g. after a lot of changes in a long running process.
+MAXCACHED = 1000
+
+# Maps (listname, at_list, patterns) to the compiled AddressPatterns.
+_matchers = {}
+# Maps list names to (config.pck mtime, set of member addresses).
+_members = {}
+
+
+
+class AddressPatterns(object):
+    def __init__(self, listname, patterns, at_list=None):
+        self.listname = listname
+        self.at_list = at_list
+        self.addresses = set()
+        # The @listname references, as (position, pattern, listname).
+        self.lists = []
+        self._positions = {}
+        compiled = []
+        for position, pattern in enumerate(patterns):
+            if not pattern.strip():
+                continue
+            if pattern.startswith('^'):
+                try:
+                    cre = re.compile(pattern, re.IGNORECASE)
+                except re.error as e:
+                    # BAW: we should probably remove this pattern
+                    # The GUI won't add a bad regexp, but at least log it.
+                    # The following kludge works because the ban_list stuff
+                    # is the only caller with no at_list.
+                    syslog('error', '%s in %s has bad regexp "%s": %s',
+                           at_list or 'ban_list', listname, pattern, e)
+                    continue
+                compiled.append((pattern, cre))
+                self._positions.setdefault(pattern, position)
+            elif pattern.startswith('@'):
+                if not at_list:
+                    continue
+                # XXX Needs to be reviewed for list@domain names.
+                mname = pattern[1:].lower().strip()
+                if mname == listname:
+                    # don't reference your own list
+                    syslog('error', '%s in %s references own list',
+                           at_list, listname)
+                    continue
+                self.lists.append((position, pattern, mname))
+            else:
+                self.addresses.add(pattern.strip().lower())
+        self._regexps = Utils.PatternSet(compiled, re.IGNORECASE)
+
+    def match(self, email):
+        """Return the entry matching email, or None.
+
+        Plain addresses are checked first, and email itself is returned if
+        one matches.  Otherwise the first regular expression or @listname
+        entry, in order, that matches email is returned.
+        """
+        if email.lower() in self.addresses:
+            return email
+        matched = self._regexps.first(email)
+        if self.lists:
+            if matched is None:
+                limit = None
+            else:
+                limit = self._positions[matched]
+            for position, pattern, mname in self.lists:
+                if limit is not None and position > limit:
+                    break
+                members = list_members(mname)
+                if members is None:
+                    syslog('error',
+                           '%s in %s references non-existent list %s',
+                           self.at_list, self.listname, mname)
+                    continue
+                if email.lower() in members:
+                    return pattern
+        return matched
+
+
+
+def get_patterns(listname, patterns, at_list=None):
+    """Return the compiled AddressPatterns for a list's pattern list."""
+    key = (listname, at_list, tuple(patterns))
+    matcher = _matchers.get(key)
+    if matcher is None:
+        if len(_matchers) >= MAXCACHED:
+            _matchers.clear()
+        matcher = _matchers[key] = AddressPatterns(listname, patterns,
+                                                   at_list)
+    return matcher
+
+
+def list_members(listname):
+    """Return the set of listname's member addresses, lower cased.
+
+    Returns None if there is no such list.  The set is cached until the
+    list's config.pck changes.
+    """
+    path = os.path.join(Site.get_listpath(listname), 'config.pck')
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    cached = _members.get(listname)
+    if cached is not None and mtime is not None and cached[0] == mtime:
+        return cached[1]
+    # Avoid circular imports
+    from Mailman.MailList import MailList
+    try:
+        mlist = MailList(listname, lock=False)
+    except Errors.MMUnknownListError:
+        _members.pop(listname, None)
+        return None
+    members = set([member.lower() for member in mlist.getMembers()])
+    if mtime is not None:
+        _members[listname] = (mtime, members)
+    return members
@@ -34,7 +34,9 @@ import time
 import os
 import types
 from . import HyperDatabase
+from . import SearchIndex
 from . import pipermail
+import sqlite3
 import weakref
 import binascii
 
@@ -166,6 +168,76 @@ nohtmlpat = re.compile(r'^\s*</HTML>\s*$', re.IGNORECASE)
 # Match quoted text
 quotedpat = re.compile(r'^([>|:]|&gt;)+')
 
+# URLs and e-mail addresses combined, so that a body line can be linkified in
+# a single scan.  This is urlpat and emailpat joined; the URL terminator is a
+# lookahead so that, like the old search-and-slice loop, it is not consumed
+# and the next match may start on it.  The two alternatives can never match
+# at the same position since a URL scheme is followed by `:' which is not
+# allowed in the local part of an address.
+linkpat = re.compile(r'(?P<url>[a-z]+://.*?)(?=_\s|_$|$|[]})>\'"\s])'
+                     r'|(?P<email>[-+,.\w]+@[-+.\w]+)', re.IGNORECASE)
+
+
+
+def quote_body_lines(lines, lang=None, iquotes=1, showhtml=0,
+                     listinfo_url=None, atmark=' at '):
+    """HTML-ify message body lines in place.
+
+    URLs and e-mail addresses are turned into links, quoted text is
+    italicized and everything else is escaped.  Lines that are None (e.g.
+    those already handled by <HTML> processing) are left alone.  If
+    listinfo_url is given, e-mail addresses are obscured with atmark and
+    linked to that URL instead of to a mailto: URL.
+    """
+    if listinfo_url is not None:
+        listinfo_url = html_quote(listinfo_url)
+    last_line_was_quoted = 0
+    for i in range(len(lines)):
+        L = lines[i]
+        if L is None:
+            continue
+        pieces = []
+        suffix = ''
+        pos = 0
+        # Italicise quoted text
+        if iquotes:
+            quoted = quotedpat.match(L)
+            if quoted is None:
+                last_line_was_quoted = 0
+            else:
+                pos = quoted.end(0)
+                if showhtml and not last_line_was_quoted:
+                    pieces.append('<BR>')
+                pieces.append(CGIescape(L[:pos], lang))
+                pieces.append('<i>')
+                suffix = '</I>'
+                if showhtml:
+                    suffix += '<BR>'
+                last_line_was_quoted = 1
+        for mo in linkpat.finditer(L, pos):
+            start = mo.start()
+            text = mo.group('url')
+            if text is not None:
+                url = html_quote(text)
+            else:
+                text = mo.group('email')
+                if listinfo_url is None:
+                    url = html_quote('mailto:' + text)
+                else:
+                    url = listinfo_url
+                    text = text.replace('@', atmark)
+            pieces.append(CGIescape(L[pos:start], lang))
+            pieces.append('<A HREF="')
+            pieces.append(url)
+            pieces.append('">')
+            pieces.append(CGIescape(text, lang))
+            pieces.append('</A>')
+            pos = mo.end()
+        pieces.append(CGIescape(L[pos:], lang))
+        pieces.append(suffix)
+        lines[i] = EMPTYSTRING.join(pieces)
+
+
 
 
 # Like Utils.maketext() but with caching to improve performance.
@@ -628,6 +700,7 @@ class Article(pipermail.Article):
 class HyperArchive(pipermail.T):
     __super_init = pipermail.T.__init__
     __super_update_archive = pipermail.T.update_archive
+    __super_close = pipermail.T.close
     __super_update_dirty_archives = pipermail.T.update_dirty_archives
     __super_add_article = pipermail.T.add_article
 
@@ -639,7 +712,9 @@ class HyperArchive(pipermail.T):
     DEFAULTINDEX = 'thread'
     ARCHIVE_PERIOD = 'month'
 
-    THREADLAZY = 0
+    # HyperDatabase maintains the thread index incrementally through its
+    # thread graph, so there is no need to rebuild it for every index update.
+    THREADLAZY = 1
     THREADLEVELS = 3
 
     ALLOWHTML = 1             # "Lines between <html></html>" handled as is.
@@ -658,6 +733,7 @@ class HyperArchive(pipermail.T):
 
         self.maillist = maillist
         self._lock_file = None
+        self._search_index = None
         self.lang = maillist.preferred_language
         self.charset = Utils.GetCharSet(maillist.preferred_language)
 
@@ -1134,6 +1210,70 @@ class HyperArchive(pipermail.T):
         f.write(article.as_text())
         f.close()
 
+    def close(self):
+        self.__super_close()
+        if self._search_index is not None:
+            self._search_index.close()
+            self._search_index = None
+
+    def __open_search_index(self):
+        if self._search_index is None:
+            path = SearchIndex.index_path(self.basedir)
+            try:
+                self._search_index = SearchIndex.SearchIndex(path)
+            except sqlite3.Error as e:
+                syslog('error', 'Cannot open archive search index %s: %s',
+                       path, e)
+        return self._search_index
+
+    def index_article(self, archive, article):
+        if not mm_cfg.ARCHIVE_SEARCH_INDEX:
+            return
+        index = self.__open_search_index()
+        if index is None:
+            return
+        try:
+            index.add(archive, article)
+        except sqlite3.Error as e:
+            syslog('error', 'Cannot index article %s for %s: %s',
+                   article.msgid, self.maillist.internal_name(), e)
+
+    def rebuild_search_index(self):
+        """Rebuild the search index from the archive's HTML articles.
+
+        The pipermail database doesn't keep message bodies, so they are
+        recovered from the article pages written for each volume.
+        """
+        index = self.__open_search_index()
+        if index is None:
+            return
+        index.clear()
+        count = 0
+        for archive in self.archives:
+            self.message(C_('Indexing archive [%(archive)s]'))
+            arcdir = os.path.join(self.basedir, archive)
+            msgid = self.database.first(archive, 'date')
+            while msgid is not None:
+                try:
+                    article = self.database.getArticle(archive, msgid)
+                    fp = open(os.path.join(arcdir, article.filename),
+                              encoding='utf-8', errors='replace')
+                except (KeyError, IOError):
+                    pass
+                else:
+                    try:
+                        article.loadbody_fromHTML(fp)
+                    finally:
+                        fp.close()
+                    index.add(archive, article,
+                              SearchIndex.text_from_html(article.body))
+                    article.finished_update_article()
+                    count += 1
+                    if count % 1000 == 0:
+                        index.commit()
+                msgid = self.database.next(archive, 'date')
+        index.commit()
+
     def update_archive(self, archive):
         self.__super_update_archive(archive)
         # only do this if the gzip module was imported globally, and
@@ -1174,7 +1314,7 @@ class HyperArchive(pipermail.T):
                 pass
             os.unlink(txtfile)
 
-    _skip_attrs = ('maillist', '_lock_file', 'charset')
+    _skip_attrs = ('maillist', '_lock_file', '_search_index', 'charset')
 
     def getstate(self):
         d={}
@@ -1187,80 +1327,13 @@ class HyperArchive(pipermail.T):
     # Add <A HREF="..."> tags around URLs and e-mail addresses.
 
     def __processbody_URLquote(self, lines):
-        # XXX a lot to do here:
-        # 1. use lines directly, rather than source and dest
-        # 2. make it clearer
-        # 3. make it faster
+        if mm_cfg.ARCHIVER_OBSCURES_EMAILADDRS:
+            listinfo_url = self.maillist.GetScriptURL('listinfo', absolute=1)
+        else:
+            listinfo_url = None
         # TK: Prepare for unicode obscure.
-        atmark = _(' at ')
-        source = lines[:]
-        dest = lines
-        last_line_was_quoted = 0
-        for i in range(0, len(source)):
-            Lorig = L = source[i]
-            prefix = suffix = ""
-            if L is None:
-                continue
-            # Italicise quoted text
-            if self.IQUOTES:
-                quoted = quotedpat.match(L)
-                if quoted is None:
-                    last_line_was_quoted = 0
-                else:
-                    quoted = quoted.end(0)
-                    prefix = CGIescape(L[:quoted], self.lang) + '<i>'
-                    suffix = '</I>'
-                    if self.SHOWHTML:
-                        suffix += '<BR>'
-                        if not last_line_was_quoted:
-                            prefix = '<BR>' + prefix
-                    L = L[quoted:]
-                    last_line_was_quoted = 1
-            # Check for an e-mail address
-            L2 = ""
-            jr = emailpat.search(L)
-            kr = urlpat.search(L)
-            while jr is not None or kr is not None:
-                if jr == None:
-                    j = -1
-                else:
-                    j = jr.start(0)
-                if kr is None:
-                    k = -1
-                else:
-                    k = kr.start(0)
-                if j != -1 and (j < k or k == -1):
-                    text = jr.group(1)
-                    length = len(text)
-                    if mm_cfg.ARCHIVER_OBSCURES_EMAILADDRS:
-                        text = re.sub('@', atmark, text)
-                        URL = self.maillist.GetScriptURL(
-                            'listinfo', absolute=1)
-                    else:
-                        URL = 'mailto:' + text
-                    pos = j
-                elif k != -1 and (j > k or j == -1):
-                    text = URL = kr.group(1)
-                    length = len(text)
-                    pos = k
-                else: # j==k
-                    raise ValueError("j==k: This can't happen!")
-                #length = len(text)
-                #self.message("URL: %s %s %s \n"
-                #             % (CGIescape(L[:pos]), URL, CGIescape(text)))
-                L2 += '%s<A HREF="%s">%s</A>' % (
-                    CGIescape(L[:pos], self.lang),
-                    html_quote(URL), CGIescape(text, self.lang))
-                L = L[pos+length:]
-                jr = emailpat.search(L)
-                kr = urlpat.search(L)
-            if jr is None and kr is None:
-                L = CGIescape(L, self.lang)
-            if isinstance(L, bytes):
-                L = L.decode('utf-8')
-            L = prefix + L2 + L + suffix
-            source[i] = None
-            dest[i] = L
+        quote_body_lines(lines, self.lang, self.IQUOTES, self.SHOWHTML,
+                         listinfo_url, _(' at '))
 
     # Perform Hypermail-style processing of <HTML></HTML> directives
     # in message bodies.  Lines between <HTML> and </HTML> will be written
@@ -21,21 +21,23 @@ from __future__ import absolute_import
 #
 from builtins import object
 import os
+import pickle
 import marshal
 import time
 import errno
+import bisect
+from collections import OrderedDict
 
 #
 # package/project modules
 #
 from . import pipermail
+from Mailman import mm_cfg
 from Mailman import LockFile
 from Mailman import Utils
 
 CACHESIZE = pipermail.CACHESIZE
 
-import pickle
-
 #
 # we're using a python dict in place of
 # of bsddb.btree database.  only defining
@@ -161,6 +163,9 @@ class DumbBTree(object):
     def __getitem__(self, item):
         return self.dict[self._resolve_key(item)]
 
+    def get(self, key, default=None):
+        return self.dict.get(self._resolve_key(key), default)
+
     def has_key(self, key):
         return self._resolve_key(key) in self.dict
 
@@ -176,13 +181,14 @@ class DumbBTree(object):
         return key, self.dict[key]
 
     def set_location(self, loc):
-        index = 0
+        # Keys are tuples whose first element is loc, so the first matching
+        # key sorts right after the 1-tuple (loc,).
         self.__sort()
-        for key in self.sorted:
-            if key[0] == loc:
-                self.current_index = index
-                return key,self.dict[key]
-            index = index + 1
+        index = bisect.bisect_left(self.sorted, (loc,))
+        if index < len(self.sorted) and self.sorted[index][0] == loc:
+            key = self.sorted[index]
+            self.current_index = index
+            return key, self.dict[key]
         raise KeyError(loc)
 
     def __setitem__(self, item, val):
@@ -265,6 +271,86 @@ def _normalize_msgid(msgid):
     return msgid
 
 
+def _thread_key_tail(threadkey):
+    """Return the last `date.sequence-' component of a thread key."""
+    return threadkey[threadkey.rfind('-', 0, -1) + 1:]
+
+
+def _load_article(buf):
+    """Unpickle a stored Article.
+
+    Articles written by Python 3 use pickle protocol 3 or higher and contain
+    no Python 2 byte strings, so they load in a single pass.  Anything older
+    goes through Utils.load_pickle(), which retries with a series of
+    encodings.
+    """
+    if isinstance(buf, bytes) and len(buf) > 1 and buf[0] == 0x80 \
+           and buf[1] >= 3:
+        try:
+            return pickle.loads(buf)
+        except Exception:
+            return None
+    return Utils.load_pickle(buf)
+
+
+
+class _ArticleCache(object):
+    """A least-recently-used cache of unpickled Article objects.
+
+    The cache is bounded by the number of entries and by the total size of
+    the serialized articles, which is a cheap approximation of the memory
+    held by the unpickled objects.  A bound of 0 disables that bound.
+    """
+
+    def __init__(self, maxcount, maxbytes):
+        self.maxcount = maxcount
+        self.maxbytes = maxbytes
+        self.__entries = OrderedDict()
+        self.__bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, key):
+        try:
+            article, size = self.__entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.__entries.move_to_end(key)
+        self.hits += 1
+        return article
+
+    def put(self, key, article, size):
+        old = self.__entries.pop(key, None)
+        if old is not None:
+            self.__bytes -= old[1]
+        self.__entries[key] = (article, size)
+        self.__bytes += size
+        # Always keep the entry just added, even if it alone is over budget.
+        while len(self.__entries) > 1 and (
+                (self.maxcount and len(self.__entries) > self.maxcount) or
+                (self.maxbytes and self.__bytes > self.maxbytes)):
+            key, (article, size) = self.__entries.popitem(last=False)
+            self.__bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        self.__entries.clear()
+        self.__bytes = 0
+
+    def stats(self):
+        return {'entries': len(self.__entries),
+                'bytes': self.__bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                }
+
+
 
 # this is lifted straight out of pipermail with
 # the bsddb.btree replaced with above class.
@@ -273,9 +359,11 @@ def _normalize_msgid(msgid):
 #
 class HyperDatabase(pipermail.Database):
     __super_addArticle = pipermail.Database.addArticle
+    __super_makeThreadKey = pipermail.Database.makeThreadKey
 
     def __init__(self, basedir, mlist):
-        self.__cache = {}
+        self.__cache = _ArticleCache(mm_cfg.ARCHIVER_ARTICLE_CACHE_SIZE,
+                                     mm_cfg.ARCHIVER_ARTICLE_CACHE_BYTES)
         self.__currentOpenArchive = None   # The currently open indices
         self._mlist = mlist
         self.basedir = os.path.expanduser(basedir)
@@ -306,6 +394,139 @@ class HyperDatabase(pipermail.Database):
                    date=None):
         self.__openIndices(archive)
         self.__super_addArticle(archive, article, subject, author, date)
+        self.__addToGraph(archive, article)
+
+    # The thread graph maps each message id to a [parentID, threadKey,
+    # children] node.  It lets us compute an article's thread key from its
+    # parent's without unpickling the parent, and in the spirit of JWZ's
+    # threading algorithm it keeps placeholder nodes (with a threadKey of
+    # None) for referenced messages that have not been archived yet.  When
+    # such a message does show up, the replies waiting for it are moved
+    # underneath it.
+    def makeThreadKey(self, archive, article):
+        self.__openIndices(archive)
+        myKey = article.date + '.' + str(article.sequence) + '-'
+        parentID = article.parentID
+        if parentID is None:
+            return myKey
+        parentID = _normalize_msgid(parentID)
+        if parentID in self.graphIndex:
+            parentKey = self.graphIndex[parentID][1]
+            if parentKey is not None:
+                return parentKey + myKey
+        return self.__super_makeThreadKey(archive, article)
+
+    def __addToGraph(self, archive, article):
+        graph = self.graphIndex
+        msgid = _normalize_msgid(article.msgid)
+        parentID = article.parentID
+        if parentID is not None:
+            parentID = _normalize_msgid(parentID)
+            parent = graph.get(parentID)
+            if parent is None or parent[1] is None:
+                parentID = None
+            elif msgid not in parent[2]:
+                parent[2].append(msgid)
+        node = graph.get(msgid)
+        if node is not None:
+            if node[1] is None:
+                # A placeholder; its children are replies waiting for us.
+                waiting = node[2]
+                node[2] = []
+            else:
+                waiting = []
+            node[0] = parentID
+            node[1] = article.threadKey
+        else:
+            waiting = []
+            graph[msgid] = [parentID, article.threadKey, []]
+        # Adopt the replies that were waiting for this message.  Only those
+        # which are still thread roots are moved, since a reply may have been
+        # attached elsewhere (e.g. by subject) in the meantime.
+        for childID in waiting:
+            child = graph.get(childID)
+            if child is None or child[0] is not None or child[1] is None:
+                continue
+            child[0] = msgid
+            graph[msgid][2].append(childID)
+            self.__rekeySubtree(archive, childID)
+        if parentID is None:
+            # Leave placeholders for the messages this one refers to, so that
+            # it can be re-parented if one of them is archived later.
+            refs = list(article.references)
+            if article.in_reply_to:
+                refs.append(article.in_reply_to)
+            for ref in refs:
+                ref = _normalize_msgid(ref)
+                if ref == msgid:
+                    continue
+                if ref not in graph:
+                    graph[ref] = [None, None, []]
+                if graph[ref][1] is None and msgid not in graph[ref][2]:
+                    graph[ref][2].append(msgid)
+
+    def __rekeySubtree(self, archive, msgid):
+        graph = self.graphIndex
+        stack = [msgid]
+        while stack:
+            msgid = stack.pop()
+            node = graph[msgid]
+            oldKey = node[1]
+            newKey = graph[node[0]][1] + _thread_key_tail(oldKey)
+            node[1] = newKey
+            try:
+                del self.threadIndex[(oldKey, msgid)]
+            except KeyError:
+                pass
+            self.threadIndex[(newKey, msgid)] = msgid
+            # The stored article carries its own copy of the thread key,
+            # which the index writers use to compute the thread depth.
+            try:
+                article = self.getArticle(archive, msgid)
+            except KeyError:
+                pass
+            else:
+                article.parentID = node[0]
+                article.threadKey = newKey
+                self.__restoreArticle(article)
+            self.changed[archive, msgid] = None
+            stack.extend(node[2])
+
+    def __restoreArticle(self, article):
+        # Like store_article(), but for an article that came out of the
+        # database and so may or may not have its bodies loaded.
+        body = article.body
+        html_body = article.__dict__.pop('html_body', None)
+        article.body = []
+        try:
+            key = self.articleIndex._resolve_key(article.msgid)
+            self.articleIndex[key] = pickle.dumps(
+                article, pipermail.ARTICLE_PICKLE_PROTOCOL)
+        finally:
+            article.body = body
+            if html_body is not None:
+                article.html_body = html_body
+
+    def __buildGraph(self):
+        # Archives created before the thread graph existed only have the
+        # thread index.  A thread key is its parent's key plus one more
+        # component, so the parent links can be recovered from the keys
+        # alone, without unpickling any article.
+        bykey = {}
+        entries = []
+        for key in self.threadIndex.keys():
+            threadkey, msgid = key[0], _normalize_msgid(key[1])
+            bykey[threadkey] = msgid
+            entries.append((threadkey, msgid))
+        graph = self.graphIndex
+        for threadkey, msgid in entries:
+            graph[msgid] = [None, threadkey, []]
+        for threadkey, msgid in entries:
+            parentKey = threadkey[:-len(_thread_key_tail(threadkey))]
+            parentID = bykey.get(parentKey)
+            if parentID is not None:
+                graph[msgid][0] = parentID
+                graph[parentID][2].append(msgid)
 
     def __openIndices(self, archive):
         if self.__currentOpenArchive == archive:
@@ -320,13 +541,15 @@ class HyperDatabase(pipermail.Database):
                 if e.errno != errno.EEXIST: raise
         finally:
             os.umask(omask)
-        for i in ('date', 'author', 'subject', 'article', 'thread'):
+        for i in ('date', 'author', 'subject', 'article', 'thread', 'graph'):
             t = DumbBTree(os.path.join(arcdir, archive + '-' + i))
             setattr(self, i + 'Index', t)
         self.__currentOpenArchive = archive
+        if not len(self.graphIndex) and len(self.threadIndex):
+            self.__buildGraph()
 
     def __closeIndices(self):
-        for i in ('date', 'author', 'subject', 'thread', 'article'):
+        for i in ('date', 'author', 'subject', 'thread', 'article', 'graph'):
             attr = i + 'Index'
             if hasattr(self, attr):
                 index = getattr(self, attr)
@@ -353,14 +576,22 @@ class HyperDatabase(pipermail.Database):
     def getArticle(self, archive, msgid):
         self.__openIndices(archive)
         resolved = self.articleIndex._resolve_key(msgid)
-        if resolved not in self.__cache:
+        # Cache keys include the archive since the same message can be filed
+        # in more than one volume.
+        key = (archive, resolved)
+        article = self.__cache.get(key)
+        if article is None:
             buf = self.articleIndex[resolved]
-            article = Utils.load_pickle(buf)
+            article = _load_article(buf)
             if article is None:
                 raise KeyError(msgid)
             article.setListIfUnset(self._mlist)
-            self.__cache[resolved] = article
-        return self.__cache[resolved]
+            self.__cache.put(key, article, len(buf))
+        return article
+
+    def cacheStats(self):
+        """Return a dictionary of article cache statistics."""
+        return self.__cache.stats()
 
     def first(self, archive, index):
         self.__openIndices(archive)
@@ -0,0 +1,175 @@
+# Copyright (C) 2026 by the Free Software Foundation, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+
+"""Full-text search index for Pipermail archives.
+
+The index is an SQLite FTS5 table kept in the archive's database directory.
+HyperArchive adds each article to it as the article is archived, the search
+CGI queries it, and bin/arch can rebuild it from the HTML article files.
+"""
+
+import os
+import re
+import html
+import errno
+import sqlite3
+
+from Mailman.Logging.Syslog import syslog
+
+INDEXFILE = 'search.db'
+
+# Markers used to delimit matched terms in snippets.  They can't appear in
+# archived text, so the snippet can be HTML-escaped and then the markers
+# turned into tags.
+HIT_START = '\x02'
+HIT_END = '\x03'
+
+# Relative weights of the subject, author and body columns when ranking.
+BM25_WEIGHTS = (10.0, 5.0, 1.0)
+
+wordpat = re.compile(r'\w+', re.UNICODE)
+tagpat = re.compile(r'<[^>]*>')
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS articles USING fts5(
+    subject, author, body,
+    archive UNINDEXED, filename UNINDEXED, date UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2');
+CREATE TABLE IF NOT EXISTS documents (
+    archive TEXT NOT NULL,
+    msgid TEXT NOT NULL,
+    docid INTEGER NOT NULL,
+    PRIMARY KEY (archive, msgid));
+"""
+
+
+
+def index_path(archive_dir):
+    return os.path.join(archive_dir, 'database', INDEXFILE)
+
+
+def make_query(text):
+    """Turn free text into an FTS5 query matching all of its words.
+
+    Each word is quoted, so that FTS5 operators and syntax characters typed
+    by users are searched for literally instead of causing query errors.
+    """
+    return ' '.join(['"%s"' % word for word in wordpat.findall(text)])
+
+
+def text_from_html(lines):
+    """Recover the plain text of an article body from its HTML page."""
+    return html.unescape(tagpat.sub('', ''.join(lines)))
+
+
+def highlight(snippet):
+    """HTML-escape a snippet and mark up its matched terms."""
+    snippet = html.escape(snippet, quote=True)
+    return snippet.replace(HIT_START, '<b>').replace(HIT_END, '</b>')
+
+
+
+class SearchIndex(object):
+    def __init__(self, path, readonly=0):
+        self._path = path
+        if readonly:
+            uri = 'file:%s?mode=ro' % path
+            self._conn = sqlite3.connect(uri, uri=True)
+        else:
+            dirname = os.path.dirname(path)
+            omask = os.umask(0o007)
+            try:
+                try:
+                    os.mkdir(dirname, 0o02770)
+                except OSError as e:
+                    if e.errno != errno.EEXIST: raise
+                self._conn = sqlite3.connect(path)
+                self._conn.executescript(SCHEMA)
+            finally:
+                os.umask(omask)
+
+    def add(self, archive, article, body=None):
+        """Add or replace an article in the index.
+
+        body is the article's plain text; it defaults to article.body.
+        """
+        if body is None:
+            body = ''.join(article.body)
+        decoded = getattr(article, 'decoded', {})
+        subject = decoded.get('subject', article.subject)
+        author = decoded.get('author', article.author)
+        cursor = self._conn.cursor()
+        row = cursor.execute(
+            'SELECT docid FROM documents WHERE archive = ? AND msgid = ?',
+            (archive, article.msgid)).fetchone()
+        if row is not None:
+            cursor.execute('DELETE FROM articles WHERE rowid = ?', row)
+        cursor.execute(
+            'INSERT INTO articles (subject, author, body, archive, filename,'
+            ' date) VALUES (?, ?, ?, ?, ?, ?)',
+            (subject, author, body, archive, article.filename,
+             article.date))
+        cursor.execute(
+            'INSERT OR REPLACE INTO documents (archive, msgid, docid)'
+            ' VALUES (?, ?, ?)',
+            (archive, article.msgid, cursor.lastrowid))
+
+    def clear(self):
+        self._conn.execute('DELETE FROM articles')
+        self._conn.execute('DELETE FROM documents')
+
+    def search(self, text, limit=20, offset=0):
+        """Return (total, hits) for the words in text, best matches first.
+
+        Each hit is a dictionary with archive, filename, subject, author,
+        date and an HTML snippet keys.
+        """
+        query = make_query(text)
+        if not query:
+            return 0, []
+        try:
+            total = self._conn.execute(
+                'SELECT count(*) FROM articles WHERE articles MATCH ?',
+                (query,)).fetchone()[0]
+            rows = self._conn.execute(
+                'SELECT archive, filename, subject, author, date,'
+                ' snippet(articles, 2, ?, ?, \'...\', 24)'
+                ' FROM articles WHERE articles MATCH ?'
+                ' ORDER BY bm25(articles, ?, ?, ?) LIMIT ? OFFSET ?',
+                (HIT_START, HIT_END, query) + BM25_WEIGHTS +
+                (limit, offset)).fetchall()
+        except sqlite3.Error as e:
+            syslog('error', 'archive search failed for %s: %s',
+                   self._path, e)
+            return 0, []
+        hits = []
+        for archive, filename, subject, author, date, snippet in rows:
+            hits.append({'archive': archive,
+                         'filename': filename,
+                         'subject': subject,
+                         'author': author,
+                         'date': date,
+                         'snippet': snippet,
+                         })
+        return total, hits
+
+    def commit(self):
+        self._conn.commit()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
@@ -14,6 +14,10 @@ from string import ascii_lowercase as lowercase
 __version__ = '0.09 (Mailman edition)'
 VERSION = __version__
 CACHESIZE = 100    # Number of slots in the cache
+# Articles are always stored with at least this pickle protocol.  Python 2
+# never wrote protocols above 2, so a stored article whose header names
+# protocol 3 or higher can be loaded without guessing string encodings.
+ARTICLE_PICKLE_PROTOCOL = 4
 
 from Mailman import mm_cfg
 from Mailman import Errors
@@ -75,6 +79,7 @@ class DatabaseInterface(object):
     def numArticles(self, archive): pass
     def newArchive(self, archive): pass
     def setThreadKey(self, archive, key, msgid): pass
+    def makeThreadKey(self, archive, article): pass
     def getOldestArticle(self, subject): pass
 
 class Database(DatabaseInterface):
@@ -113,16 +118,23 @@ class Database(DatabaseInterface):
         self.store_article(article)
         self.changed[archive, article.msgid] = None
 
+        article.threadKey = self.makeThreadKey(archive, article)
+        key = article.threadKey, article.msgid
+        self.setThreadKey(archive, key, article.msgid)
+
+    def makeThreadKey(self, archive, article):
+        """Return the thread index key for an article.
+
+        The key is the parent's key followed by the article's own date and
+        sequence number, so sorting the thread index yields threads in
+        order with replies following their parents.
+        """
+        myKey = article.date + '.' + str(article.sequence) + '-'
         parentID = article.parentID
         if parentID is not None and parentID in self.articleIndex:
             parent = self.getArticle(archive, parentID)
-            myThreadKey = (parent.threadKey + article.date + '.'
-                           + str(article.sequence) + '-')
-        else:
-            myThreadKey = article.date + '.' + str(article.sequence) + '-'
-        article.threadKey = myThreadKey
-        key = myThreadKey, article.msgid
-        self.setThreadKey(archive, key, article.msgid)
+            return parent.threadKey + myKey
+        return myKey
 
     def store_article(self, article):
         """Store article without message body to save space"""
@@ -131,7 +143,8 @@ class Database(DatabaseInterface):
         temp2 = article.html_body
         article.body = []
         del article.html_body
-        self.articleIndex[article.msgid] = pickle.dumps(article)
+        self.articleIndex[article.msgid] = pickle.dumps(
+            article, ARTICLE_PICKLE_PROTOCOL)
         article.body = temp
         article.html_body = temp2
 
@@ -367,40 +380,6 @@ class T(object):
         self.archive = archive
         self.version = __version__
 
-    # Find the message ID of an article's parent, or return None
-    # if no parent can be found.
-
-    def __findParent(self, article, children = []):
-            parentID = None
-            if article.in_reply_to:
-                parentID = article.in_reply_to
-            elif article.references:
-                # Remove article IDs that aren't in the archive
-                refs = list(filter(lambda x: x in self.articleIndex, article.references))
-                if not refs:
-                    return None
-                maxdate = self.database.getArticle(self.archive,
-                                                   refs[0])
-                for ref in refs[1:]:
-                    a = self.database.getArticle(self.archive, ref)
-                    if a.date > maxdate.date:
-                        maxdate = a
-                parentID = maxdate.msgid
-            else:
-                # Look for the oldest matching subject
-                try:
-                    key, tempid = \
-                         self.subjectIndex.set_location(article.subject)
-                    print((key, tempid))
-                    next(self.subjectIndex)
-                    [subject, date] = key.split('\0')
-                    print((article.subject, subject, date))
-                    if subject == article.subject and tempid not in children:
-                        parentID = tempid
-                except KeyError:
-                    pass
-            return parentID
-
     # Update the threaded index completely
     def updateThreadedIndex(self):
         # Erase the threaded index
@@ -638,19 +617,14 @@ class T(object):
             else:
                 subject = article.subject.lower()
 
-            article.parentID = parentID = self.get_parent_info(arch, article)
-            if parentID:
-                parent = self.database.getArticle(arch, parentID)
-                article.threadKey = (parent.threadKey + article.date + '.'
-                                     + str(article.sequence) + '-')
-            else:
-                article.threadKey = (article.date + '.'
-                                     + str(article.sequence) + '-')
+            article.parentID = self.get_parent_info(arch, article)
+            article.threadKey = self.database.makeThreadKey(arch, article)
             key = article.threadKey, article.msgid
 
             self.database.setThreadKey(arch, key, article.msgid)
             self.database.addArticle(arch, temp, author=author,
                                      subject=subject)
+            self.index_article(arch, temp)
 
             if arch not in self._dirty_archives:
                 self._dirty_archives.append(arch)
@@ -732,6 +706,8 @@ class T(object):
         pass
     def update_article(self, archivedir, article, prev, next):
         pass
+    def index_article(self, archive, article):
+        pass
     def write_TOC(self):
         pass
     def open_new_archive(self, archive, dir):
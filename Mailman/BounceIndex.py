@@ -0,0 +1,170 @@
+# Copyright (C) 2026 by the Free Software Foundation, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+
+"""Site-wide index of when bouncing and disabled members need attention.
+
+For each member with bounce information, the index records the date on which
+cron/disabled next has work to do for them: resetting the bounce information
+of an enabled member once it goes stale, or sending a disabled member their
+next notification.  The Bouncer keeps the index up to date as it registers
+bounces and sends notices, so that cron/disabled only needs to visit the
+lists and members that are due.
+
+The Bouncer only adds the members it sees bounce, so a list's entries are
+complete only once a full sweep by cron/disabled has reindexed it.  Such lists
+are recorded as indexed; cron/disabled does a full sweep of any other list,
+e.g. every list the first time it runs after the index was created.
+
+The index is advisory.  cron/disabled checks each member it visits, and
+failures to update the index are logged rather than raised.
+"""
+
+import os
+import sqlite3
+
+from Mailman import mm_cfg
+from Mailman.SQLiteStore import SQLiteStore
+from Mailman.Logging.Syslog import syslog
+
+INDEXFILE = 'bounce-due.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS due (
+    listname TEXT NOT NULL,
+    member TEXT NOT NULL,
+    due REAL NOT NULL,
+    PRIMARY KEY (listname, member));
+CREATE INDEX IF NOT EXISTS due_by_date ON due (due);
+CREATE TABLE IF NOT EXISTS indexed (
+    listname TEXT PRIMARY KEY);
+"""
+
+# Each change is committed on its own, so that a process holding a list lock
+# never keeps other processes out of the index.
+_store = SQLiteStore(INDEXFILE, SCHEMA)
+
+
+
+def index_path():
+    return _store.path()
+
+
+def exists():
+    return os.path.exists(index_path())
+
+
+def _connect():
+    return _store.connect()
+
+
+def close():
+    _store.close()
+
+
+def set_due(listname, member, due):
+    """Record that member of listname needs attention on or after due."""
+    try:
+        _connect().execute(
+            'INSERT OR REPLACE INTO due (listname, member, due)'
+            ' VALUES (?, ?, ?)', (listname, member.lower(), due))
+    except sqlite3.Error as e:
+        syslog('error', 'Cannot update bounce index for %s: %s: %s',
+               listname, member, e)
+
+
+def remove(listname, member):
+    try:
+        _connect().execute(
+            'DELETE FROM due WHERE listname = ? AND member = ?',
+            (listname, member.lower()))
+    except sqlite3.Error as e:
+        syslog('error', 'Cannot update bounce index for %s: %s: %s',
+               listname, member, e)
+
+
+def reindex(mlist):
+    """Replace the index entries of a list with its current members'.
+
+    The list is then recorded as indexed.
+    """
+    listname = mlist.internal_name()
+    rows = []
+    for member in mlist.getBouncingMembers():
+        info = mlist.getBounceInfo(member)
+        if info is not None:
+            rows.append((listname, member, mlist.bounceDueDate(member, info)))
+    try:
+        conn = _connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM due WHERE listname = ?', (listname,))
+            conn.executemany(
+                'INSERT OR REPLACE INTO due (listname, member, due)'
+                ' VALUES (?, ?, ?)', rows)
+            conn.execute('INSERT OR REPLACE INTO indexed (listname)'
+                         ' VALUES (?)', (listname,))
+        except:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+    except sqlite3.Error as e:
+        syslog('error', 'Cannot reindex bounces for %s: %s', listname, e)
+
+
+def indexed():
+    """Return the set of lists whose entries are complete."""
+    try:
+        return set(listname for (listname,) in _connect().execute(
+            'SELECT listname FROM indexed'))
+    except sqlite3.Error as e:
+        syslog('error', 'Cannot read bounce index: %s', e)
+        return set()
+
+
+def forget(listname):
+    """Remove all of listname's entries, e.g. once the list is deleted."""
+    try:
+        conn = _connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM due WHERE listname = ?', (listname,))
+            conn.execute('DELETE FROM indexed WHERE listname = ?',
+                         (listname,))
+        except:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+    except sqlite3.Error as e:
+        syslog('error', 'Cannot update bounce index for %s: %s', listname, e)
+
+
+def invalidate():
+    """Mark every list as needing a full sweep to be indexed again."""
+    try:
+        _connect().execute('DELETE FROM indexed')
+    except sqlite3.Error as e:
+        syslog('error', 'Cannot update bounce index: %s', e)
+
+
+def due(when):
+    """Return {listname: [member, ...]} for the members due by when."""
+    lists = {}
+    for listname, member in _connect().execute(
+            'SELECT listname, member FROM due WHERE due <= ?'
+            ' ORDER BY listname', (when,)):
+        lists.setdefault(listname, []).append(member)
+    return lists
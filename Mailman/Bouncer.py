@@ -29,6 +29,7 @@ from Mailman import Utils
 from Mailman import Message
 from Mailman import MemberAdaptor
 from Mailman import Pending
+from Mailman import BounceIndex
 from Mailman.Errors import MMUnknownListError
 from Mailman.Logging.Syslog import syslog
 from Mailman import i18n
@@ -109,33 +110,8 @@ class Bouncer(object):
     def registerBounce(self, member, msg, weight=1.0, day=None, sibling=False):
         if not self.isMember(member):
             # check regular_include_lists, only one level
-            if not self.regular_include_lists or sibling:
-                return
-            from Mailman.MailList import MailList
-            for listaddr in self.regular_include_lists:
-                listname, hostname = listaddr.split('@')
-                listname = listname.lower()
-                if listname == self.internal_name():
-                    syslog('error',
-                           'Bouncer: %s: Include list self reference',
-                           listname)
-                    continue
-                try:
-                    siblist = None
-                    try:
-                        siblist = MailList(listname)
-                    except MMUnknownListError:
-                        syslog('error',
-                               'Bouncer: %s: Include list "%s" not found.',
-                               self.real_name,
-                               listname)
-                        continue
-                    siblist.registerBounce(member, msg, weight, day,
-                                           sibling=True)
-                    siblist.Save()
-                finally:
-                    if siblist and siblist.Locked():
-                        siblist.Unlock()
+            if self.regular_include_lists and not sibling:
+                self.__registerSiblingBounces([(member, msg, day)], weight)
             return
         info = self.getBounceInfo(member)
         first_today = True
@@ -204,6 +180,87 @@ class Bouncer(object):
         # member wasn't removed.
         if self.isMember(member):
             self.setBounceInfo(member, info)
+            self.indexBounceInfo(member, info)
+
+    def bounceDueDate(self, member, info):
+        """Return when cron/disabled next has work to do for the member."""
+        if self.getDeliveryStatus(member) == MemberAdaptor.ENABLED:
+            # Their bounce info needs resetting once it is stale.
+            return Utils.midnight(info.date) + self.bounce_info_stale_after
+        # They're due their next disabled notification.
+        return (Utils.midnight(info.lastnotice) +
+                self.bounce_you_are_disabled_warnings_interval)
+
+    def indexBounceInfo(self, member, info):
+        """Update the site's bounce due-date index for the member."""
+        if not mm_cfg.BOUNCE_DUE_INDEX:
+            return
+        if info is None:
+            BounceIndex.remove(self.internal_name(), member)
+        else:
+            BounceIndex.set_due(self.internal_name(), member,
+                                self.bounceDueDate(member, info))
+
+    def registerBounces(self, events, weight=1.0, sibling=False):
+        """Register a batch of bounces.
+
+        events is an iterable of (member, msg, day) tuples, each registered
+        as by registerBounce().  The list must be locked, and is saved if any
+        of the bounces were for members.  Bounces for non-members are
+        registered with the regular_include_lists, locking and saving each
+        of those lists only once for the whole batch.
+
+        So that posts aren't held up behind a large batch, the list is saved
+        and unlocked every REGISTER_BOUNCES_SLICE seconds, and locked again
+        after a pause of REGISTER_BOUNCES_PAUSE seconds.
+        """
+        siblingevents = []
+        dirty = False
+        timeslice = mm_cfg.REGISTER_BOUNCES_SLICE
+        deadline = time.time() + timeslice
+        for member, msg, day in events:
+            if timeslice and time.time() >= deadline:
+                if dirty:
+                    self.Save()
+                    dirty = False
+                self.Unlock()
+                time.sleep(mm_cfg.REGISTER_BOUNCES_PAUSE)
+                self.Lock()
+                deadline = time.time() + timeslice
+            if self.isMember(member):
+                self.registerBounce(member, msg, weight, day, sibling)
+                dirty = True
+            elif self.regular_include_lists and not sibling:
+                siblingevents.append((member, msg, day))
+        if dirty:
+            self.Save()
+        if siblingevents:
+            self.__registerSiblingBounces(siblingevents, weight)
+
+    def __registerSiblingBounces(self, events, weight):
+        from Mailman.MailList import MailList
+        for listaddr in self.regular_include_lists:
+            listname, hostname = listaddr.split('@')
+            listname = listname.lower()
+            if listname == self.internal_name():
+                syslog('error',
+                       'Bouncer: %s: Include list self reference',
+                       listname)
+                continue
+            try:
+                siblist = None
+                try:
+                    siblist = MailList(listname)
+                except MMUnknownListError:
+                    syslog('error',
+                           'Bouncer: %s: Include list "%s" not found.',
+                           self.real_name,
+                           listname)
+                    continue
+                siblist.registerBounces(events, weight, sibling=True)
+            finally:
+                if siblist and siblist.Locked():
+                    siblist.Unlock()
 
     def disableBouncingMember(self, member, info, msg):
         # Initialize their confirmation cookie.  If we do it when we get the
@@ -277,6 +334,7 @@ class Bouncer(object):
             # Expunge the pending cookie for the user.  We throw away the
             # returned data.
             self.pend_confirm(info.cookie)
+            self.indexBounceInfo(member, None)
             if reason == MemberAdaptor.BYBOUNCE:
                 syslog('bounce', '%s: %s deleted after exhausting notices',
                        self.internal_name(), member)
@@ -327,6 +385,7 @@ class Bouncer(object):
         # In case the MemberAdaptor stores bounce info externally to
         # the list, we need to tell it to update
         self.setBounceInfo(member, info)
+        self.indexBounceInfo(member, info)
 
     def BounceMessage(self, msg, msgdata, e=None):
         # Bounce a message back to the sender, with an error message if
@@ -24,9 +24,16 @@ the filename containing the bounce message.
 """
 
 from builtins import object
+import io
 import sys
+import time
+import inspect
+import email.iterators
 
+from Mailman import mm_cfg
+from Mailman import Metrics
 from Mailman.Logging.Syslog import syslog
+from Mailman.Bouncers.SimpleMatch import _decoded_lines
 
 # If a bounce detector returns Stop, that means to just discard the message.
 # An example is warning messages for temporary delivery problems.  These
@@ -59,13 +66,139 @@ BOUNCE_PIPELINE = [
 
 
 
-# msg must be a mimetools.Message
-def ScanMessages(mlist, msg):
-    for module in BOUNCE_PIPELINE:
+class BounceContext(object):
+    """Per-message state shared by the bounce detectors.
+
+    The message is walked once, when the context is created.  The part index,
+    the body lines and the decoded text lines are computed on first use and
+    then handed to every detector, instead of each detector walking the MIME
+    tree and re-reading the body.  Detectors may keep their own derived
+    results in the cache dictionary.
+    """
+    def __init__(self, msg):
+        self.msg = msg
+        self.cache = {}
+        self._parts = list(msg.walk())
+        self._index = None
+        self._lines = None
+        self._decoded = None
+
+    def leaves(self):
+        """All non-multipart subparts, in depth-first order."""
+        return [part for part in self._parts if not part.is_multipart()]
+
+    def parts(self, ctype):
+        """All subparts of the given content type, in depth-first order."""
+        if self._index is None:
+            self._index = {}
+            for part in self._parts:
+                self._index.setdefault(part.get_content_type(), []).append(
+                    part)
+        return self._index.get(ctype, [])
+
+    def body_lines(self):
+        """The lines of email.iterators.body_line_iterator(msg)."""
+        if self._lines is None:
+            self._lines = lines = []
+            for part in self._parts:
+                payload = part.get_payload()
+                if isinstance(payload, str):
+                    lines.extend(io.StringIO(payload))
+        return self._lines
+
+    def decoded_lines(self):
+        """The lines of the text subparts with their transfer encoding and
+        charset decoded."""
+        if self._decoded is None:
+            self._decoded = lines = []
+            for part in self._parts:
+                if part.get_content_maintype() == 'text':
+                    lines.extend(_decoded_lines(part))
+        return self._decoded
+
+    def is_dsn(self):
+        msg = self.msg
+        return (msg.get_content_type() == 'multipart/report' and
+                msg.get_param('report-type', '').lower() == 'delivery-status')
+
+
+
+
+def body_line_iterator(msg, context=None):
+    """Like email.iterators.body_line_iterator(), but reuses the lines read
+    by the bounce context when there is one."""
+    if context is None:
+        return email.iterators.body_line_iterator(msg)
+    return iter(context.body_lines())
+
+
+
+
+# Maps detector module names to their process() function and whether it takes
+# a context argument.
+_detectors = {}
+
+# Maps detector module names to [calls, hits, seconds] in this process.
+_timings = {}
+
+
+def _get_detector(module):
+    detector = _detectors.get(module)
+    if detector is None:
         modname = 'Mailman.Bouncers.' + module
         __import__(modname)
-        addrs = sys.modules[modname].process(msg)
+        process = sys.modules[modname].process
+        try:
+            takes_context = 'context' in inspect.signature(process).parameters
+        except (TypeError, ValueError):
+            takes_context = False
+        detector = _detectors[module] = (process, takes_context)
+    return detector
+
+
+def _pipeline(context):
+    pipeline = BOUNCE_PIPELINE
+    if mm_cfg.BOUNCE_PIPELINE_AUTO_REORDER:
+        # Try the detectors that have recognized the most bounces first.
+        # The sort is stable, so ties keep their configured order.
+        pipeline = sorted(pipeline,
+                          key=lambda module: -_timings.get(module, (0, 0))[1])
+    # A delivery status notification is almost always recognized by DSN, so
+    # for those we try it first and skip it otherwise, since all it looks at
+    # are message/delivery-status parts.
+    if not context.parts('message/delivery-status'):
+        return [module for module in pipeline if module != 'DSN']
+    if context.is_dsn() and 'DSN' in pipeline:
+        return ['DSN'] + [module for module in pipeline if module != 'DSN']
+    return pipeline
+
+
+def DetectorStats():
+    """Return {module: (calls, hits, seconds)} for the bounce detectors."""
+    return dict([(module, tuple(stats))
+                 for module, stats in list(_timings.items())])
+
+
+
+# msg must be a mimetools.Message
+def ScanMessages(mlist, msg):
+    context = BounceContext(msg)
+    for module in _pipeline(context):
+        process, takes_context = _get_detector(module)
+        t0 = time.time()
+        if takes_context:
+            addrs = process(msg, context=context)
+        else:
+            addrs = process(msg)
+        elapsed = time.time() - t0
+        stats = _timings.setdefault(module, [0, 0, 0.0])
+        stats[0] += 1
+        stats[2] += elapsed
+        Metrics.observe('mailman_bounce_detector_seconds', elapsed,
+                        detector=module)
         if addrs:
+            stats[1] += 1
+            Metrics.inc('mailman_bounce_detector_hits_total', detector=module)
             # Return addrs even if it is Stop. BounceRunner needs this info.
             return addrs
     return []
@@ -18,16 +18,17 @@
 
 import re
 import email
-import email.iterators
 from io import StringIO
 
+from Mailman.Bouncers.BouncerAPI import body_line_iterator
+
 tcre = re.compile(r'the following recipients did not receive this message:',
                   re.IGNORECASE)
 acre = re.compile(r'<(?P<addr>[^>]*)>')
 
 
 
-def process(msg):
+def process(msg, context=None):
     if msg.get_content_type() != 'multipart/mixed':
         return None
     # simple state machine
@@ -35,7 +36,7 @@ def process(msg):
     #     1 == tag line seen
     state = 0
     # This format thinks it's a MIME, but it really isn't
-    for line in email.iterators.body_line_iterator(msg):
+    for line in body_line_iterator(msg, context):
         line = line.strip()
         if state == 0 and tcre.match(line):
             state = 1
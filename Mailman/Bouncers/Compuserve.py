@@ -18,20 +18,21 @@
 
 import re
 import email
-import email.iterators
+
+from Mailman.Bouncers.BouncerAPI import body_line_iterator
 
 dcre = re.compile(r'your message could not be delivered', re.IGNORECASE)
 acre = re.compile(r'Invalid receiver address: (?P<addr>.*)')
 
 
 
-def process(msg):
+def process(msg, context=None):
     # simple state machine
     #    0 = nothing seen yet
     #    1 = intro line seen
     state = 0
     addrs = []
-    for line in email.iterators.body_line_iterator(msg):
+    for line in body_line_iterator(msg, context):
         if state == 0:
             mo = dcre.search(line)
             if mo:
@@ -28,10 +28,14 @@ from io import StringIO
 from Mailman.Bouncers.BouncerAPI import Stop
 
 
-def process(msg):
+def process(msg, context=None):
     # Iterate over each message/delivery-status subpart
     addrs = []
-    for part in typed_subpart_iterator(msg, 'message', 'delivery-status'):
+    if context is None:
+        parts = typed_subpart_iterator(msg, 'message', 'delivery-status')
+    else:
+        parts = context.parts('message/delivery-status')
+    for part in parts:
         if not part.is_multipart():
             # Huh?
             continue
@@ -17,7 +17,8 @@
 """Recognizes (some) Microsoft Exchange formats."""
 
 import re
-import email.iterators
+
+from Mailman.Bouncers.BouncerAPI import body_line_iterator
 
 scre = re.compile('did not reach the following recipient')
 ecre = re.compile('MSEXCH:')
@@ -26,9 +27,9 @@ a2cre = re.compile('(?P<addr>[^ ]+) on ')
 
 
 
-def process(msg):
+def process(msg, context=None):
     addrs = {}
-    it = email.iterators.body_line_iterator(msg)
+    it = body_line_iterator(msg, context)
     # Find the start line
     for line in it:
         if scre.search(line):
@@ -18,14 +18,15 @@
 
 import re
 import email
-import email.iterators
+
+from Mailman.Bouncers.BouncerAPI import body_line_iterator
 
 acre = re.compile(r',\s*(?P<addr>\S+@[^,]+),', re.IGNORECASE)
 
 
 
-def process(msg):
-    for line in email.iterators.body_line_iterator(msg):
+def process(msg, context=None):
+    for line in body_line_iterator(msg, context):
         mo = acre.search(line)
         if mo:
             return [mo.group('addr')]
@@ -50,7 +50,7 @@ def flatten(msg, leaves):
 
 
 
-def process(msg):
+def process(msg, context=None):
     # Sigh.  Some show NMS 3.6's show
     #     multipart/report; report-type=delivery-status
     # and some show
@@ -60,8 +60,11 @@ def process(msg):
     # We're looking for a text/plain subpart occuring before a
     # message/delivery-status subpart.
     plainmsg = None
-    leaves = []
-    flatten(msg, leaves)
+    if context is None:
+        leaves = []
+        flatten(msg, leaves)
+    else:
+        leaves = context.leaves()
     for i, subpart in zip(list(range(len(leaves)-1)), leaves):
         if subpart.get_content_type() == 'text/plain':
             plainmsg = subpart
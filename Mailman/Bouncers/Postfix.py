@@ -70,13 +70,16 @@ def findaddr(msg):
 
 
 
-def process(msg):
+def process(msg, context=None):
     if msg.get_content_type() not in ('multipart/mixed', 'multipart/report'):
         return None
     # We're looking for the plain/text subpart with a Content-Description: of
     # `notification'.
-    leaves = []
-    flatten(msg, leaves)
+    if context is None:
+        leaves = []
+        flatten(msg, leaves)
+    else:
+        leaves = context.leaves()
     for subpart in leaves:
         if subpart.get_content_type() == 'text/plain' and \
            subpart.get('content-description', '').lower() == 'notification':
@@ -27,7 +27,8 @@ This module should be conformant.
 """
 
 import re
-import email.iterators
+
+from Mailman.Bouncers.BouncerAPI import body_line_iterator
 
 # Other (non-standard?) intros have been observed in the wild.
 introtags = [
@@ -43,14 +44,14 @@ acre = re.compile(r'<(?P<addr>[^>]*)>:')
 
 
 
-def process(msg):
+def process(msg, context=None):
     addrs = []
     # simple state machine
     #    0 = nothing seen yet
     #    1 = intro paragraph seen
     #    2 = recip paragraphs seen
     state = 0
-    for line in email.iterators.body_line_iterator(msg):
+    for line in body_line_iterator(msg, context):
         line = line.strip()
         if state == 0:
             for introtag in introtags:
@@ -30,7 +30,8 @@ Escape character is '^]'.
 
 import re
 import email
-import email.iterators
+
+from Mailman.Bouncers.BouncerAPI import body_line_iterator
 
 ecre = re.compile('original message follows', re.IGNORECASE)
 acre = re.compile(r'''
@@ -47,12 +48,12 @@ acre = re.compile(r'''
 
 
 
-def process(msg):
+def process(msg, context=None):
     mailer = msg.get('x-mailer', '')
     if not mailer.startswith('<SMTP32 v'):
         return
     addrs = {}
-    for line in email.iterators.body_line_iterator(msg):
+    for line in body_line_iterator(msg, context):
         if ecre.search(line):
             break
         mo = acre.search(line)
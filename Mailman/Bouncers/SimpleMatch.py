@@ -22,6 +22,22 @@ import re
 import email.iterators
 
 
+def _decoded_lines(subpart):
+    """Return the lines of a non-multipart subpart, decoded to str.
+
+    Returns an empty list if the subpart has no bytes payload.
+    """
+    payload = subpart.get_payload(decode=True)
+    if not isinstance(payload, bytes):
+        return []
+    charset = subpart.get_content_charset('us-ascii') or 'us-ascii'
+    try:
+        text = payload.decode(charset, errors='replace')
+    except LookupError:
+        text = payload.decode('us-ascii', errors='replace')
+    return io.StringIO(text)
+
+
 def _body_line_iterator(msg):
     """Iterate body lines with Content-Transfer-Encoding properly decoded.
 
@@ -30,15 +46,8 @@ def _body_line_iterator(msg):
     quoted-printable and base64 bodies are decoded before pattern matching.
     """
     for subpart in email.iterators.typed_subpart_iterator(msg):
-        payload = subpart.get_payload(decode=True)
-        if not isinstance(payload, bytes):
-            continue
-        charset = subpart.get_content_charset('us-ascii') or 'us-ascii'
-        try:
-            text = payload.decode(charset, errors='replace')
-        except LookupError:
-            text = payload.decode('us-ascii', errors='replace')
-        yield from io.StringIO(text)
+        yield from _decoded_lines(subpart)
+
 
 
 
@@ -228,34 +237,96 @@ PATTERNS = [
 
 
 
-def process(msg, patterns=None):
-    if patterns is None:
-        patterns = PATTERNS
-    # simple state machine
-    #     0 = nothing seen yet
-    #     1 = intro seen
-    addrs = {}
-    # MAS: This is a mess. The outer loop used to be over the message
-    # so we only looped through the message once.  Looping through the
-    # message for each set of patterns is obviously way more work, but
-    # if we don't do it, problems arise because scre from the wrong
-    # pattern set matches first and then acre doesn't match.  The
-    # alternative is to split things into separate modules, but then
-    # we process the message multiple times anyway.
-    for scre, ecre, acre in patterns:
-        state = 0
-        for line in _body_line_iterator(msg):
-            if state == 0:
-                if scre.search(line):
-                    state = 1
-            if state == 1:
+# Maps a tuple of start regexps to a single regexp matching any of them.
+_startcres = {}
+
+
+def _anystart(scres):
+    try:
+        return _startcres[scres]
+    except KeyError:
+        pass
+    anycre = None
+    flags = set([cre.flags for cre in scres])
+    if len(flags) == 1:
+        try:
+            anycre = re.compile(
+                '|'.join(['(?:%s)' % cre.pattern for cre in scres]),
+                flags.pop())
+        except re.error:
+            pass
+    _startcres[scres] = anycre
+    return anycre
+
+
+def scan(lines, patterns):
+    """Run all the (scre, ecre, acre) triples over lines in a single pass.
+
+    Returns a list with one dictionary of found addresses per triple, each
+    the same as if that triple had been run over the lines on its own.
+    """
+    found = [{} for triple in patterns]
+    # Triples still looking for their start line, and those in their
+    # address block.
+    waiting = list(range(len(patterns)))
+    active = []
+    anystart = _anystart(tuple([triple[0] for triple in patterns]))
+    for line in lines:
+        if waiting and (anystart is None or anystart.search(line)):
+            started = [i for i in waiting if patterns[i][0].search(line)]
+            if started:
+                waiting = [i for i in waiting if i not in started]
+                active.extend(started)
+        if active:
+            stillactive = []
+            for i in active:
+                scre, ecre, acre = patterns[i]
                 mo = acre.search(line)
                 if mo:
                     addr = mo.group('addr')
                     if addr:
-                        addrs[addr.strip('<>')] = 1
-                elif ecre.search(line):
-                    break
+                        found[i][addr.strip('<>')] = 1
+                    stillactive.append(i)
+                elif not ecre.search(line):
+                    stillactive.append(i)
+            active = stillactive
+        elif not waiting:
+            break
+    return found
+
+
+def scan_context(context):
+    """Scan for the SimpleMatch and SimpleWarning patterns together.
+
+    The result is cached in the bounce context, so the two detectors share a
+    single pass over the message body.
+    """
+    found = context.cache.get('SimpleMatch')
+    if found is None:
+        from Mailman.Bouncers import SimpleWarning
+        found = scan(context.decoded_lines(),
+                     PATTERNS + SimpleWarning.patterns)
+        context.cache['SimpleMatch'] = found
+    return found
+
+
+
+def process(msg, patterns=None, context=None):
+    if patterns is None:
+        patterns = PATTERNS
+    # All the triples are matched in one pass over the message, but the
+    # first triple (in order) that finds anything wins, since the start
+    # regexp of a later triple can match text in a bounce whose addresses
+    # only an earlier triple recognizes.
+    if context is None:
+        found = scan(_body_line_iterator(msg), patterns)
+    elif patterns is PATTERNS:
+        found = scan_context(context)[:len(PATTERNS)]
+    else:
+        found = scan(context.decoded_lines(), patterns)
+    for addrs in found:
         if addrs:
             break
+    else:
+        return []
     return [x for x in list(addrs.keys()) if VALID.match(x)]
@@ -17,11 +17,12 @@
 
 """Recognizes simple heuristically delimited warnings."""
 
-import email
-import email.iterators
-
 from Mailman.Bouncers.BouncerAPI import Stop
-from Mailman.Bouncers.SimpleMatch import _c, _body_line_iterator
+from Mailman.Bouncers.SimpleMatch import _c
+from Mailman.Bouncers.SimpleMatch import PATTERNS
+from Mailman.Bouncers.SimpleMatch import scan
+from Mailman.Bouncers.SimpleMatch import scan_context
+from Mailman.Bouncers.SimpleMatch import _body_line_iterator
 
 
 
@@ -68,25 +69,14 @@ patterns = [
 
 
 
-def process(msg):
+def process(msg, context=None):
     # We used to just import process from SimpleMatch, but with the change in
     # SimpleMatch to return only vaild addresses, that doesn't work any more.
-    # So, we copy most of the process from SimpleMatch here.
-    addrs = {}
-    for scre, ecre, acre in patterns:
-        state = 0
-        for line in _body_line_iterator(msg):
-            if state == 0:
-                if scre.search(line):
-                    state = 1
-            if state == 1:
-                mo = acre.search(line)
-                if mo:
-                    addr = mo.group('addr')
-                    if addr:
-                        addrs[addr.strip('<>')] = 1
-                elif ecre.search(line):
-                    break
+    if context is None:
+        found = scan(_body_line_iterator(msg), patterns)
+    else:
+        found = scan_context(context)[len(PATTERNS):]
+    for addrs in found:
         if addrs:
             # It's a recognized warning so stop now
             return Stop
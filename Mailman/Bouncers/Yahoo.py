@@ -19,9 +19,10 @@
 
 import re
 import email
-import email.iterators
 from email.utils import parseaddr
 
+from Mailman.Bouncers.BouncerAPI import body_line_iterator
+
 tcre = (re.compile(r'message\s+from\s+yahoo\.\S+', re.IGNORECASE),
         re.compile(r'Sorry, we were unable to deliver your message to '
                    r'the following address(\(es\))?\.',
@@ -34,7 +35,7 @@ ecre = (re.compile(r'--- Original message follows'),
 
 
 
-def process(msg):
+def process(msg, context=None):
     # Yahoo! bounces seem to have a known subject value and something called
     # an x-uidl: header, the value of which seems unimportant.
     sender = parseaddr(msg.get('from', '').lower())[1] or ''
@@ -46,7 +47,7 @@ def process(msg):
     #     1 == tag line seen
     #     2 == end line seen
     state = 0
-    for line in email.iterators.body_line_iterator(msg):
+    for line in body_line_iterator(msg, context):
         line = line.strip()
         if state == 0:
             for cre in tcre:
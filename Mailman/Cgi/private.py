@@ -20,6 +20,7 @@ from __future__ import print_function
 
 import os
 import sys
+import email.utils
 from Mailman.Utils import FieldStorage
 import mimetypes
 
@@ -38,6 +39,10 @@ i18n.set_language(mm_cfg.DEFAULT_SERVER_LANGUAGE)
 
 SLASH = '/'
 
+# Archive files are copied to the client in chunks of this many bytes, so
+# that serving a large mbox or text archive doesn't read it into memory.
+CHUNKSIZE = 64 * 1024
+
 
 
 def guess_type(url, strict):
@@ -46,6 +51,77 @@ def guess_type(url, strict):
     return mimetypes.guess_type(url)
 
 
+def accepts_gzip():
+    # RFC 7231 section 5.3.4; a q-value of 0 means `not acceptable'.
+    for coding in os.environ.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        params = coding.strip().split(';')
+        if params[0].strip().lower() not in ('gzip', 'x-gzip'):
+            continue
+        for param in params[1:]:
+            name, sep, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def etag_for(st, variant=''):
+    return '"%x-%x-%x%s"' % (st.st_ino, st.st_size, int(st.st_mtime), variant)
+
+
+def not_modified(etag, mtime):
+    # If-None-Match takes precedence over If-Modified-Since (RFC 7232).
+    inm = os.environ.get('HTTP_IF_NONE_MATCH')
+    if inm is not None:
+        if inm.strip() == '*':
+            return True
+        for tag in inm.split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag == etag:
+                return True
+        return False
+    ims = os.environ.get('HTTP_IF_MODIFIED_SINCE')
+    if ims:
+        try:
+            since = email.utils.parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return False
+        return int(mtime) <= since
+    return False
+
+
+def send_file(f, headers):
+    # Anything the CGI has printed so far (e.g. a Set-Cookie: header from
+    # authentication) was collected by the driver; flush it first, then copy
+    # the file straight to the real stdout.
+    buffered = sys.stdout.getvalue()
+    sys.stdout.truncate(0)
+    sys.stdout.seek(0)
+    orig_stdout = sys.stdout
+    sys.stdout = sys.__stdout__
+    try:
+        sys.stdout.write(buffered)
+        for header in headers:
+            sys.stdout.write(header + '\n')
+        sys.stdout.write('\n')
+        sys.stdout.flush()
+        if f is not None:
+            out = sys.stdout.buffer
+            while True:
+                chunk = f.read(CHUNKSIZE)
+                if not chunk:
+                    break
+                out.write(chunk)
+            out.flush()
+    finally:
+        sys.stdout = orig_stdout
+
+
 
 def main():
     doc = Document()
@@ -209,14 +285,10 @@ def main():
         if ctype is None:
             ctype = 'text/html'
         if mboxfile:
-            f = open(os.path.join(mlist.archive_dir() + '.mbox',
-                                  mlist.internal_name() + '.mbox'))
+            true_filename = os.path.join(mlist.archive_dir() + '.mbox',
+                                         mlist.internal_name() + '.mbox')
             ctype = 'text/plain'
-        elif true_filename.endswith('.gz'):
-            import gzip
-            f = gzip.open(true_filename, 'r')
-        else:
-            f = open(true_filename, 'rb')
+        fp = open(true_filename, 'rb')
     except IOError:
         msg = _('Private archive file not found')
         doc.SetTitle(msg)
@@ -224,17 +296,39 @@ def main():
         print('Status: 404 Not Found')
         print(doc.Format())
         syslog('error', 'Private archive file not found: %s', true_filename)
-    else:
-        content = f.read()
+        return
+    f = fp
+    try:
+        st = os.fstat(fp.fileno())
+        headers = []
+        length = st.st_size
+        variant = ''
+        if true_filename.endswith('.gz'):
+            # Hand the compressed bytes to clients that can take them, and
+            # only decompress for those that can't.
+            headers.append('Vary: Accept-Encoding')
+            if accepts_gzip():
+                headers.append('Content-Encoding: gzip')
+                variant = '-gzip'
+            else:
+                import gzip
+                f = gzip.GzipFile(fileobj=fp, mode='rb')
+                length = None
+        etag = etag_for(st, variant)
+        headers.extend([
+            'ETag: ' + etag,
+            'Last-Modified: ' + email.utils.formatdate(st.st_mtime,
+                                                       usegmt=True),
+            # The content is only for authenticated members.
+            'Cache-Control: private',
+            ])
+        if not_modified(etag, st.st_mtime):
+            send_file(None, ['Status: 304 Not Modified'] + headers)
+            return
+        headers.insert(0, 'Content-type: %s' % ctype)
+        if length is not None:
+            headers.append('Content-Length: %d' % length)
+        send_file(f, headers)
+    finally:
         f.close()
-        buffered = sys.stdout.getvalue()
-        sys.stdout.truncate(0)
-        sys.stdout.seek(0)
-        orig_stdout = sys.stdout
-        sys.stdout = sys.__stdout__
-        sys.stdout.write(buffered)
-        print('Content-type: %s\n' % ctype)
-        sys.stdout.flush()
-        sys.stdout.buffer.write(content)
-        sys.stdout.flush()
-        sys.stdout = orig_stdout
+        fp.close()
@@ -0,0 +1,207 @@
+# Copyright (C) 2026 by the Free Software Foundation, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+
+"""Search a list's Pipermail archive."""
+from __future__ import print_function
+
+import os
+import re
+import sqlite3
+import urllib.parse
+
+from Mailman import mm_cfg
+from Mailman import Utils
+from Mailman import MailList
+from Mailman import Errors
+from Mailman import i18n
+from Mailman.Archiver import SearchIndex
+from Mailman.htmlformat import *
+from Mailman.Utils import FieldStorage
+from Mailman.Logging.Syslog import syslog
+
+# Set up i18n.  Until we know which list is being requested, we use the
+# server's default.
+_ = i18n._
+i18n.set_language(mm_cfg.DEFAULT_SERVER_LANGUAGE)
+
+# Number of hits shown per page
+PAGESIZE = 20
+
+emailpat = re.compile(r'([-+,.\w]+)@([-+.\w]+)')
+
+
+
+def main():
+    doc = Document()
+    doc.set_language(mm_cfg.DEFAULT_SERVER_LANGUAGE)
+
+    parts = Utils.GetPathPieces()
+    if not parts:
+        doc.SetTitle(_('Archive Search Error'))
+        doc.AddItem(Header(3, _('You must specify a list.')))
+        print(doc.Format())
+        return
+
+    listname = parts[0].lower()
+    try:
+        mlist = MailList.MailList(listname, lock=0)
+    except Errors.MMListError as e:
+        # Avoid cross-site scripting attacks
+        safelistname = Utils.websafe(listname)
+        msg = _(f'No such list <em>{safelistname}</em>')
+        doc.SetTitle(_(f'Archive Search Error - {msg}'))
+        doc.AddItem(Header(2, msg))
+        # Send this with a 404 status.
+        print('Status: 404 Not Found')
+        print(doc.Format())
+        syslog('error', 'search: No such list "%s": %s', listname, e)
+        return
+
+    i18n.set_language(mlist.preferred_language)
+    doc.set_language(mlist.preferred_language)
+    realname = mlist.real_name
+
+    if not mm_cfg.ARCHIVE_SEARCH_INDEX or not mlist.archive:
+        msg = _(f'The {realname} archive is not searchable.')
+        doc.SetTitle(msg)
+        doc.AddItem(Header(2, msg))
+        print('Status: 404 Not Found')
+        print(doc.Format())
+        return
+
+    cgidata = FieldStorage()
+    try:
+        query = cgidata.getfirst('q', '').strip()
+        username = cgidata.getfirst('username', '').strip()
+    except TypeError:
+        # Someone crafted a POST with a bad Content-Type:.
+        doc.AddItem(Header(2, _('Error')))
+        doc.AddItem(Bold(_('Invalid options to CGI script.')))
+        # Send this with a 400 status.
+        print('Status: 400 Bad Request')
+        print(doc.Format())
+        return
+    password = cgidata.getfirst('password', '')
+    try:
+        start = max(0, int(cgidata.getfirst('start', '0')))
+    except ValueError:
+        start = 0
+
+    # Searching a private archive needs the same credentials as reading it
+    # through the private CGI, which also sets the cookie that is checked
+    # here.
+    if mlist.archive_private and not mlist.WebAuthenticate(
+            (mm_cfg.AuthUser,
+             mm_cfg.AuthListModerator,
+             mm_cfg.AuthListAdmin,
+             mm_cfg.AuthSiteAdmin),
+            password, username):
+        doc.SetTitle(_(f'{realname} Private Archive Search'))
+        if 'submit' in cgidata:
+            doc.AddItem(Bold(FontSize('+1', _('Authorization failed.'))))
+            remote = os.environ.get('HTTP_FORWARDED_FOR',
+                     os.environ.get('HTTP_X_FORWARDED_FOR',
+                     os.environ.get('REMOTE_ADDR',
+                                    'unidentified origin')))
+            syslog('security',
+                  'Authorization failed (search): user=%s: list=%s: remote=%s',
+                   username, listname, remote)
+            print('Status: 401 Unauthorized')
+        doc.AddItem(login_form(mlist, query))
+        doc.AddItem(mlist.GetMailmanFooter())
+        print(doc.Format())
+        return
+
+    lang = mlist.getMemberLanguage(username)
+    i18n.set_language(lang)
+    doc.set_language(lang)
+
+    doc.SetTitle(_(f'{realname} Archive Search'))
+    doc.AddItem(Header(2, _(f'Search the {realname} archive')))
+    doc.AddItem(search_form(mlist, query))
+    if query:
+        show_results(mlist, doc, query, start)
+    doc.AddItem(mlist.GetMailmanFooter())
+    print(doc.Format())
+
+
+
+def search_form(mlist, query):
+    form = Form(mlist.GetScriptURL('search', absolute=1), method='GET')
+    form.AddItem(TextBox('q', query, size=40))
+    form.AddItem(' ')
+    form.AddItem(SubmitButton('search', _('Search')))
+    return form
+
+
+def login_form(mlist, query):
+    form = Form(mlist.GetScriptURL('search', absolute=1))
+    form.AddItem(Hidden('q', Utils.websafe(query)))
+    table = Table(border=0)
+    table.AddRow([_('Email address:'), TextBox('username', size=30)])
+    table.AddRow([_('Password:'), PasswordBox('password', size=30)])
+    table.AddRow([SubmitButton('submit', _("Let me in..."))])
+    form.AddItem(table)
+    return form
+
+
+def obscure(s):
+    if mm_cfg.ARCHIVER_OBSCURES_EMAILADDRS:
+        return emailpat.sub(r'\g<1>' + _(' at ') + r'\g<2>', s)
+    return s
+
+
+def show_results(mlist, doc, query, start):
+    path = SearchIndex.index_path(mlist.archive_dir())
+    try:
+        index = SearchIndex.SearchIndex(path, readonly=1)
+        try:
+            total, hits = index.search(query, PAGESIZE, start)
+        finally:
+            index.close()
+    except sqlite3.Error as e:
+        syslog('error', 'search: cannot open index %s: %s', path, e)
+        doc.AddItem(Bold(_('The archive search index is not available.')))
+        return
+    if not hits:
+        doc.AddItem(Bold(_('No matching messages were found.')))
+        return
+    first = start + 1
+    last = start + len(hits)
+    doc.AddItem(Bold(_(f'Messages {first} to {last} of {total}')))
+    baseurl = mlist.GetBaseArchiveURL()
+    results = OrderedList()
+    for hit in hits:
+        url = baseurl + hit['archive'] + '/' + hit['filename']
+        subject = Utils.websafe(hit['subject'])
+        author = Utils.websafe(obscure(hit['author']))
+        snippet = SearchIndex.highlight(obscure(hit['snippet']))
+        results.AddItem(Container(
+            Link(url, Bold(subject)), ' ', Italic(author), ' ',
+            Utils.websafe(hit['archive']), '<br>', snippet))
+    doc.AddItem(results)
+    # Links to the previous and next pages of results
+    scripturl = mlist.GetScriptURL('search', absolute=1)
+    if start > 0:
+        prev = urllib.parse.urlencode({'q': query,
+                                       'start': max(0, start - PAGESIZE)})
+        doc.AddItem(Link(Utils.websafe(scripturl + '?' + prev),
+                         _('Previous')))
+        doc.AddItem(' ')
+    if last < total:
+        next = urllib.parse.urlencode({'q': query, 'start': last})
+        doc.AddItem(Link(Utils.websafe(scripturl + '?' + next), _('Next')))
@@ -0,0 +1,108 @@
+# Copyright (C) 2026 by the Free Software Foundation, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+
+"""A site-wide cache of DMARC policy lookups, shared by all processes.
+
+Utils.IsDMARCProhibited() looks up the _dmarc TXT records of each poster's
+domain and organizational domain.  The records found for a name, or None if
+it has none, are kept here until their DNS TTL runs out, so a busy sender's
+domain is looked up once per TTL by the whole site instead of twice for every
+post.  Only the records are cached; each list still applies its own DMARC
+settings to them.
+
+The cache is an SQLite database in DATA_DIR.  Database errors are logged and
+treated as cache misses.
+"""
+
+import json
+import time
+import sqlite3
+
+from Mailman import mm_cfg
+from Mailman.SQLiteStore import SQLiteStore
+from Mailman.Logging.Syslog import syslog
+
+CACHEFILE = 'dmarc.db'
+
+# Expired entries are deleted every this many updates by a process.
+CLEAN_INTERVAL = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    name TEXT PRIMARY KEY,
+    expires REAL NOT NULL,
+    records TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS records_by_expiry ON records (expires);
+"""
+
+_store = SQLiteStore(CACHEFILE, SCHEMA)
+_updates = 0
+
+
+
+def cache_path():
+    return _store.path()
+
+
+def _connect():
+    return _store.connect()
+
+
+def close():
+    _store.close()
+
+
+def get(name, now=None):
+    """Return (True, records) if name's records are cached, else (False, None).
+
+    records is a list of (name, [TXT strings]) pairs, or None if name has no
+    TXT records.
+    """
+    if now is None:
+        now = time.time()
+    try:
+        row = _connect().execute(
+            'SELECT records FROM records WHERE name = ? AND expires > ?',
+            (name, now)).fetchone()
+    except sqlite3.Error as e:
+        syslog('error', 'Cannot read DMARC cache for %s: %s', name, e)
+        return False, None
+    if row is None:
+        return False, None
+    records = json.loads(row[0])
+    if records is not None:
+        records = [(rname, strings) for rname, strings in records]
+    return True, records
+
+
+def put(name, records, ttl, now=None):
+    """Cache name's records for ttl seconds."""
+    global _updates
+    if ttl <= 0:
+        return
+    if now is None:
+        now = time.time()
+    try:
+        conn = _connect()
+        conn.execute('INSERT OR REPLACE INTO records VALUES (?, ?, ?)',
+                     (name, now + ttl, json.dumps(records)))
+        _updates += 1
+        if _updates >= CLEAN_INTERVAL:
+            _updates = 0
+            conn.execute('DELETE FROM records WHERE expires <= ?', (now,))
+    except sqlite3.Error as e:
+        syslog('error', 'Cannot update DMARC cache for %s: %s', name, e)
@@ -31,6 +31,22 @@ from Mailman.i18n import _
 from Mailman.SafeDict import SafeDict
 from Mailman.Logging.Syslog import syslog
 
+EMPTYSTRING = ''
+
+# The %-interpolations compiled decorations handle.  Templates with any other
+# use of % are interpolated the slow way.
+slotcre = re.compile(r'%(?:(%)|\(([^()]*)\)s)')
+blanklinecre = re.compile(r'(?m)(?<!^--) +(?=\n)')
+
+# The compiled decorations are forgotten when there are more than this many
+# of them, e.g. after a lot of changes in a long running process.
+MAXCACHED = 1000
+
+# Maps (template, use_dollar_strings, list attributes) to the compiled
+# Decoration, or None if the template can't be compiled.
+_decorations = {}
+
+
 
 def process(mlist, msg, msgdata):
     # Digests and Mailman-craft messages should not get additional headers
@@ -44,18 +60,24 @@ def process(mlist, msg, msgdata):
         assert type(recips) == list and len(recips) == 1
         member = recips[0].lower()
         d['user_address'] = member
+        # Only look up what the header and footer use.
+        needed = slot_names(mlist, mlist.msg_header, mlist.msg_footer)
         try:
             d['user_delivered_to'] = mlist.getMemberCPAddress(member)
             # BAW: Hmm, should we allow this?
-            d['user_password'] = mlist.getMemberPassword(member)
+            if needed is None or 'user_password' in needed:
+                d['user_password'] = mlist.getMemberPassword(member)
             d['user_language'] = mlist.getMemberLanguage(member)
-            username = mlist.getMemberName(member) or None
-            try:
-                username = username.encode(Utils.GetCharSet(d['user_language']))
-            except (AttributeError, UnicodeError):
-                username = member
-            d['user_name'] = username
-            d['user_optionsurl'] = mlist.GetOptionsURL(member)
+            if needed is None or 'user_name' in needed:
+                username = mlist.getMemberName(member) or None
+                try:
+                    username = username.encode(
+                        Utils.GetCharSet(d['user_language']))
+                except (AttributeError, UnicodeError):
+                    username = member
+                d['user_name'] = username
+            if needed is None or 'user_optionsurl' in needed:
+                d['user_optionsurl'] = mlist.GetOptionsURL(member)
         except Errors.NotAMemberError:
             pass
     # These strings are descriptive for the log file and shouldn't be i18n'd
@@ -217,28 +239,17 @@ def process(mlist, msg, msgdata):
 
 def decorate(mlist, template, what, extradict=None):
     # `what' is just a descriptive phrase used in the log message
-    
+    decoration = get_decoration(mlist, template)
+    if decoration is not None:
+        text = decoration.render(extradict)
+        if text is not None:
+            return text
+
     # If template is only whitespace, ignore it.
     if len(re.sub(r'\s', '', template)) == 0:
         return ''
 
-    # BAW: We've found too many situations where Python can be fooled into
-    # interpolating too much revealing data into a format string.  For
-    # example, a footer of "% silly %(real_name)s" would give a header
-    # containing all list attributes.  While we've previously removed such
-    # really bad ones like `password' and `passwords', it's much better to
-    # provide a whitelist of known good attributes, then to try to remove a
-    # blacklist of known bad ones.
-    d = SafeDict({'real_name'     : mlist.real_name,
-                  'list_name'     : mlist.internal_name(),
-                  # For backwards compatibility
-                  '_internal_name': mlist.internal_name(),
-                  'host_name'     : mlist.host_name,
-                  'web_page_url'  : mlist.web_page_url,
-                  'description'   : mlist.description,
-                  'info'          : mlist.info,
-                  'cgiext'        : mm_cfg.CGIEXT,
-                  })
+    d = SafeDict(list_attributes(mlist))
     if extradict is not None:
         d.update(extradict)
     # Using $-strings?
@@ -255,3 +266,140 @@ def decorate(mlist, template, what, extradict=None):
     if not text.endswith('\n'):
         text += '\n'
     return text
+
+
+
+
+def list_attributes(mlist):
+    # BAW: We've found too many situations where Python can be fooled into
+    # interpolating too much revealing data into a format string.  For
+    # example, a footer of "% silly %(real_name)s" would give a header
+    # containing all list attributes.  While we've previously removed such
+    # really bad ones like `password' and `passwords', it's much better to
+    # provide a whitelist of known good attributes, then to try to remove a
+    # blacklist of known bad ones.
+    return {'real_name'     : mlist.real_name,
+            'list_name'     : mlist.internal_name(),
+            # For backwards compatibility
+            '_internal_name': mlist.internal_name(),
+            'host_name'     : mlist.host_name,
+            'web_page_url'  : mlist.web_page_url,
+            'description'   : mlist.description,
+            'info'          : mlist.info,
+            'cgiext'        : mm_cfg.CGIEXT,
+            }
+
+
+def get_decoration(mlist, template):
+    """Return the compiled Decoration for template, or None."""
+    listdict = list_attributes(mlist)
+    dollars = bool(getattr(mlist, 'use_dollar_strings', 0))
+    key = (template, dollars, tuple(sorted(listdict.items())))
+    try:
+        return _decorations[key]
+    except KeyError:
+        pass
+    if len(_decorations) >= MAXCACHED:
+        _decorations.clear()
+    if dollars:
+        template = Utils.to_percent(template)
+    decoration = _decorations[key] = Decoration.compile(template, listdict)
+    return decoration
+
+
+def slot_names(mlist, *templates):
+    """Return the names the templates take from the decoration data, or None
+    if any of them isn't compiled."""
+    names = set()
+    for template in templates:
+        decoration = get_decoration(mlist, template)
+        if decoration is None:
+            return None
+        names.update(decoration.names)
+    return names
+
+
+
+class Decoration(object):
+    """A header or footer template with the list's attributes filled in.
+
+    pieces alternates literal text with the names of the slots still to be
+    filled from the decoration data, e.g. the personalization data, when the
+    decoration is rendered.
+    """
+    def __init__(self, pieces, listnames):
+        self.pieces = pieces
+        self.names = frozenset(pieces[1::2])
+        self._listnames = listnames
+        if self.names:
+            self._text = None
+        else:
+            self._text = finish(pieces[0])
+
+    @classmethod
+    def compile(cls, template, listdict):
+        """Return the Decoration for a %-string template, or None if it uses
+        % for more than %(name)s and %%."""
+        # If template is only whitespace, ignore it.
+        if len(re.sub(r'\s', '', template)) == 0:
+            return BlankDecoration([''], frozenset(listdict))
+        pieces = []
+        literal = []
+        pos = 0
+        for mo in slotcre.finditer(template):
+            text = template[pos:mo.start()]
+            if '%' in text:
+                return None
+            literal.append(text)
+            percent, name = mo.groups()
+            if percent:
+                literal.append('%')
+            elif name in listdict:
+                literal.append(str(listdict[name]))
+            else:
+                pieces.append(EMPTYSTRING.join(literal))
+                pieces.append(name)
+                literal = []
+            pos = mo.end()
+        text = template[pos:]
+        if '%' in text:
+            return None
+        literal.append(text)
+        pieces.append(EMPTYSTRING.join(literal))
+        return cls(pieces, frozenset(listdict))
+
+    def render(self, extradict=None):
+        """Return the decoration text, or None if extradict overrides any of
+        the list's attributes."""
+        if extradict:
+            if not self._listnames.isdisjoint(extradict):
+                return None
+        else:
+            extradict = {}
+        if self._text is not None:
+            return self._text
+        pieces = self.pieces[:]
+        for i in range(1, len(pieces), 2):
+            name = pieces[i]
+            if name in extradict:
+                pieces[i] = str(extradict[name])
+            else:
+                # As SafeDict leaves unknown names.
+                pieces[i] = '%(' + name + ')s'
+        return finish(EMPTYSTRING.join(pieces))
+
+
+class BlankDecoration(Decoration):
+    def __init__(self, pieces, listnames):
+        Decoration.__init__(self, pieces, listnames)
+        self._text = ''
+
+
+
+def finish(text):
+    # Strip trailing blanks, except from signature separators, and ensure
+    # text ends with new-line.
+    text = blanklinecre.sub('', text.replace('\r\n', '\n'))
+    if not text.endswith('\n'):
+        text += '\n'
+    return text
@@ -21,6 +21,7 @@ import os
 import re
 import time
 import errno
+import hashlib
 import binascii
 import tempfile
 from io import StringIO
@@ -32,7 +33,6 @@ from email.charset import Charset
 
 from Mailman import mm_cfg
 from Mailman import Utils
-from Mailman import LockFile
 from Mailman import Message
 from Mailman.Errors import DiscardMessage
 from Mailman.i18n import _
@@ -434,6 +434,60 @@ def makedirs(dir):
             raise
 
 
+def write_file(path, data):
+    # Honor the umask, unlike tempfile.mkstemp(), since the file is linked
+    # into the archive.
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    with os.fdopen(fd, 'wb') as fp:
+        fp.write(data)
+
+
+def store_path(digest):
+    return os.path.join(mm_cfg.ATTACHMENT_STORE_DIR,
+                        digest[:2], digest[2:4], digest)
+
+
+def store_attachment(data):
+    """Return the path of data's file in the attachment store.
+
+    Files are named by the SHA-256 hash of their contents, so an attachment
+    is stored once however many lists and messages it appears in.  The
+    archives hard link to these files.  New files are written under a
+    temporary name and renamed into place, so writers need no lock.
+    """
+    path = store_path(hashlib.sha256(data).hexdigest())
+    if not os.path.exists(path):
+        makedirs(os.path.dirname(path))
+        tmppath = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            write_file(tmppath, data)
+            os.rename(tmppath, path)
+        except:
+            if os.path.exists(tmppath):
+                os.unlink(tmppath)
+            raise
+    return path
+
+
+def prune_store():
+    """Remove the stored attachments no archive links to any more.
+
+    Return the number of files removed.
+    """
+    count = 0
+    for dirpath, dirnames, filenames in os.walk(mm_cfg.ATTACHMENT_STORE_DIR):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                if os.stat(path).st_nlink == 1:
+                    os.unlink(path)
+                    count += 1
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+    return count
+
+
 def save_attachment(mlist, msg, dir, filter_html=True):
     fsdir = os.path.join(mlist.archive_dir(), dir)
     makedirs(fsdir)
@@ -465,69 +519,39 @@ def save_attachment(mlist, msg, dir, filter_html=True):
             ext = '.bin'
     # Allow only alphanumerics, dash, underscore, and dot
     ext = sre.sub('', ext)
-    path = None
-    # We need a lock to calculate the next attachment number
-    lockfile = os.path.join(fsdir, 'attachments.lock')
-    lock = LockFile.LockFile(lockfile)
-    lock.lock()
-    try:
-        # Now base the filename on what's in the attachment, uniquifying it if
-        # necessary.
-        if not filename or mm_cfg.SCRUBBER_DONT_USE_ATTACHMENT_FILENAME:
-            filebase = 'attachment'
-        else:
-            # Sanitize the filename given in the message headers
-            parts = pre.split(filename)
-            filename = parts[-1]
-            # Strip off leading dots
-            filename = dre.sub('', filename)
-            # Allow only alphanumerics, dash, underscore, and dot
-            filename = sre.sub('', filename)
-            # If the filename's extension doesn't match the type we guessed,
-            # which one should we go with?  For now, let's go with the one we
-            # guessed so attachments can't lie about their type.  Also, if the
-            # filename /has/ no extension, then tack on the one we guessed.
-            # The extension was removed from the name above.
-            # Allow for extra and ext and keep it under 255 bytes.
-            filebase = filename[:240]
-        # Now we're looking for a unique name for this file on the file
-        # system.  If msgdir/filebase.ext isn't unique, we'll add a counter
-        # after filebase, e.g. msgdir/filebase-cnt.ext
-        counter = 0
-        extra = ''
-        while True:
-            path = os.path.join(fsdir, filebase + extra + ext)
-            # Generally it is not a good idea to test for file existance
-            # before just trying to create it, but the alternatives aren't
-            # wonderful (i.e. os.open(..., O_CREAT | O_EXCL) isn't
-            # NFS-safe).  Besides, we have an exclusive lock now, so we're
-            # guaranteed that no other process will be racing with us.
-            if os.path.exists(path):
-                counter += 1
-                extra = '-%04d' % counter
-            else:
-                break
-    finally:
-        lock.unlock()
-    # `path' now contains the unique filename for the attachment.  There's
-    # just one more step we need to do.  If the part is text/html and
-    # ARCHIVE_HTML_SANITIZER is a string (which it must be or we wouldn't be
-    # here), then send the attachment through the filter program for
-    # sanitization
+    # Now base the filename on what's in the attachment.
+    if not filename or mm_cfg.SCRUBBER_DONT_USE_ATTACHMENT_FILENAME:
+        filebase = 'attachment'
+    else:
+        # Sanitize the filename given in the message headers
+        parts = pre.split(filename)
+        filename = parts[-1]
+        # Strip off leading dots
+        filename = dre.sub('', filename)
+        # Allow only alphanumerics, dash, underscore, and dot
+        filename = sre.sub('', filename)
+        # If the filename's extension doesn't match the type we guessed,
+        # which one should we go with?  For now, let's go with the one we
+        # guessed so attachments can't lie about their type.  Also, if the
+        # filename /has/ no extension, then tack on the one we guessed.
+        # The extension was removed from the name above.
+        # Allow for extra and ext and keep it under 255 bytes.
+        filebase = filename[:240]
+    # If the part is text/html and ARCHIVE_HTML_SANITIZER is a string (which
+    # it must be or we wouldn't be here), then send the attachment through
+    # the filter program for sanitization
     if filter_html and ctype == 'text/html':
-        base, ext = os.path.splitext(path)
-        tmppath = base + '-tmp' + ext
-        fp = open(tmppath, 'w')
+        fd, tmppath = tempfile.mkstemp(ext, filebase + '-tmp', fsdir)
         try:
-            fp.write(decodedpayload)
-            fp.close()
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(decodedpayload)
             cmd = mm_cfg.ARCHIVE_HTML_SANITIZER % {'filename' : tmppath}
             try:
                 result = Utils.run_command(cmd, capture_output=True)
             except (ValueError, OSError) as e:
                 syslog('error', 'HTML sanitizer failed to run: %s', e)
             else:
-                decodedpayload = result.stdout.decode('utf-8', 'replace')
+                decodedpayload = result.stdout
                 if result.returncode:
                     syslog('error',
                            'HTML sanitizer exited with non-zero status: %s',
@@ -538,7 +562,6 @@ def save_attachment(mlist, msg, dir, filter_html=True):
         # text.  Blarg, we really want the sanitizer to tell us what the type
         # if the return data is. :(
         ext = '.txt'
-        path = base + '.txt'
     # Is it a message/rfc822 attachment?
     elif ctype == 'message/rfc822':
         submsg = msg.get_payload()
@@ -559,10 +582,54 @@ def save_attachment(mlist, msg, dir, filter_html=True):
         if mcset == None or mcset == "":
             mcset = 'utf-8'
         decodedpayload = decodedpayload.encode(mcset)
-
-    fp = open(path, 'wb')
-    fp.write(decodedpayload)
-    fp.close()
+    if decodedpayload is None:
+        decodedpayload = b''
+    # Link the archive's copy of the attachment to the one in the store, or
+    # failing that, to a private copy written under a temporary name.
+    source = None
+    tmppath = None
+    if mm_cfg.SCRUBBER_DEDUPLICATE_ATTACHMENTS:
+        try:
+            source = store_attachment(decodedpayload)
+        except OSError as e:
+            syslog('error', 'Cannot add attachment to the store: %s', e)
+    try:
+        # Now we're looking for a unique name for this file on the file
+        # system.  If msgdir/filebase.ext isn't unique, we'll add a counter
+        # after filebase, e.g. msgdir/filebase-cnt.ext.  link() fails if the
+        # name is taken, even over NFS, so concurrent archivers can't claim
+        # the same name and we don't need a lock.
+        counter = 0
+        extra = ''
+        while True:
+            if source is None:
+                tmppath = os.path.join(fsdir, '.attachment.%d.tmp'
+                                       % os.getpid())
+                write_file(tmppath, decodedpayload)
+                source = tmppath
+            path = os.path.join(fsdir, filebase + extra + ext)
+            try:
+                os.link(source, path)
+                break
+            except OSError as e:
+                if e.errno == errno.EEXIST:
+                    counter += 1
+                    extra = '-%04d' % counter
+                elif source != tmppath:
+                    # E.g. the store is on another file system, or the file
+                    # was just pruned from it.
+                    syslog('error', 'Cannot link %s to %s: %s',
+                           path, source, e)
+                    source = None
+                else:
+                    raise
+    finally:
+        if tmppath is not None:
+            try:
+                os.unlink(tmppath)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
     # Now calculate the url
     baseurl = mlist.GetBaseArchiveURL()
     # Private archives will likely have a trailing slash.  Normalize.
@@ -62,6 +62,13 @@ class HeaderMatchHold(Errors.HoldMessage):
 # And reset the translator
 _ = i18n._
 
+FILTER_FLAGS = re.IGNORECASE | re.MULTILINE | re.UNICODE
+
+# The compiled KNOWN_SPAMMERS, and the compiled header_filter_rules of each
+# list, along with the settings they were compiled from.
+_spammers = (None, None)
+_filters = {}
+
 
 
 def getDecodedHeaders(msg, cset='utf-8'):
@@ -98,6 +105,106 @@ def getDecodedHeaders(msg, cset='utf-8'):
     return headers
 
 
+
+def compile_patterns(patterns, flags, what):
+    """Return (pattern, compiled regexp) for each valid pattern."""
+    compiled = []
+    for pattern in patterns:
+        try:
+            compiled.append((pattern, re.compile(pattern, flags)))
+        except (re.error, TypeError):
+            syslog('error', 'ignoring %s invalid pattern: %s', what, pattern)
+    return compiled
+
+
+class HeaderFilter(object):
+    """A list's compiled header_filter_rules."""
+
+    def __init__(self, rules, lcset):
+        self.rules = []
+        allpatterns = []
+        for patterns, action, empty in rules:
+            if action == mm_cfg.DEFER:
+                continue
+            lines = []
+            for pattern in patterns.splitlines():
+                if pattern.startswith('#'):
+                    continue
+                # ignore 'empty' patterns
+                if not pattern.strip():
+                    continue
+                pattern = Utils.xml_to_unicode(pattern, lcset)
+                pattern = normalize(mm_cfg.NORMALIZE_FORM, pattern)
+                lines.append(pattern)
+            compiled = compile_patterns(lines, FILTER_FLAGS,
+                                        'header_filter_rules')
+            if compiled:
+                self.rules.append((action,
+                                   Utils.PatternSet(compiled, FILTER_FLAGS)))
+                allpatterns.extend(compiled)
+        # Most messages match no rule at all, which this finds out in one
+        # pass over the headers.
+        self._any = Utils.PatternSet(allpatterns, FILTER_FLAGS)
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def match(self, headers):
+        """Return (action, pattern) for the first rule matching headers.
+
+        Returns None if no rule matches.
+        """
+        if not self._any.matches(headers):
+            return None
+        for action, patterns in self.rules:
+            pattern = patterns.first(headers)
+            if pattern is not None:
+                return action, pattern
+        return None
+
+
+def get_header_filter(mlist, lcset):
+    """Return the list's compiled header_filter_rules.
+
+    The compiled rules are cached, and recompiled when the list's rules (or
+    the settings they depend on) change.
+    """
+    key = (tuple([(patterns, action)
+                  for patterns, action, empty in mlist.header_filter_rules]),
+           lcset, mm_cfg.NORMALIZE_FORM)
+    cached = _filters.get(mlist.internal_name())
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    headerfilter = HeaderFilter(mlist.header_filter_rules, lcset)
+    _filters[mlist.internal_name()] = (key, headerfilter)
+    return headerfilter
+
+
+def get_known_spammers():
+    """Return [(header, Utils.PatternSet)] for the site's KNOWN_SPAMMERS."""
+    global _spammers
+    key = tuple([tuple(item) for item in mm_cfg.KNOWN_SPAMMERS])
+    if _spammers[0] == key:
+        return _spammers[1]
+    byheader = {}
+    order = []
+    for header, regex in mm_cfg.KNOWN_SPAMMERS:
+        header = header.lower()
+        if header not in byheader:
+            byheader[header] = []
+            order.append(header)
+        byheader[header].append(regex)
+    spammers = []
+    for header in order:
+        compiled = compile_patterns(byheader[header], re.IGNORECASE,
+                                    'KNOWN_SPAMMERS')
+        if compiled:
+            spammers.append((header,
+                             Utils.PatternSet(compiled, re.IGNORECASE)))
+    _spammers = (key, spammers)
+    return spammers
+
+
 
 def process(mlist, msg, msgdata):
     # Before anything else, check DMARC if necessary.  We do this as early
@@ -150,58 +257,50 @@ error, contact the mailing list owner at %(listowner)s."""))
     if msgdata.get('approved'):
         return
     # First do site hard coded header spam checks
-    for header, regex in mm_cfg.KNOWN_SPAMMERS:
-        cre = re.compile(regex, re.IGNORECASE)
+    for header, patterns in get_known_spammers():
         for value in msg.get_all(header, []):
-            mo = cre.search(value)
-            if mo:
+            pattern = patterns.first(value)
+            if pattern is not None:
                 # we've detected spam, so throw the message away
+                syslog('vette', '%s: %s header matched KNOWN_SPAMMERS: %s',
+                       mlist.real_name, header, pattern)
                 raise SpamDetected
     # Now do header_filter_rules
+    # Get the character set of the lists preferred language for headers
+    lcset = Utils.GetCharSet(mlist.preferred_language)
+    headerfilter = get_header_filter(mlist, lcset)
+    if not headerfilter:
+        return
     # TK: Collect headers in sub-parts because attachment filename
     # extension may be a clue to possible virus/spam.
     headers = u''
-    # Get the character set of the lists preferred language for headers
-    lcset = Utils.GetCharSet(mlist.preferred_language)
     for p in msg.walk():
         headers += getDecodedHeaders(p, lcset)
-    for patterns, action, empty in mlist.header_filter_rules:
-        if action == mm_cfg.DEFER:
-            continue
-        for pattern in patterns.splitlines():
-            if pattern.startswith('#'):
-                continue
-            # ignore 'empty' patterns
-            if not pattern.strip():
-                continue
-            pattern = Utils.xml_to_unicode(pattern, lcset)
-            pattern = normalize(mm_cfg.NORMALIZE_FORM, pattern)
-            try:
-                mo = re.search(pattern,
-                               headers,
-                               re.IGNORECASE|re.MULTILINE|re.UNICODE)
-            except (re.error, TypeError):
-                syslog('error',
-                       'ignoring header_filter_rules invalid pattern: %s',
-                       pattern)
-            if mo:
-                if action == mm_cfg.DISCARD:
-                    raise Errors.DiscardMessage
-                if action == mm_cfg.REJECT:
-                    if msgdata.get('toowner'):
-                        # Don't send rejection notice if addressed to '-owner'
-                        # because it may trigger a loop of notices if the
-                        # sender address is forged.  We just discard it here.
-                        raise Errors.DiscardMessage
-                    raise Errors.RejectMessage(
-                        _('Message rejected by filter rule match'))
-                if action == mm_cfg.HOLD:
-                    if msgdata.get('toowner'):
-                        # Don't hold '-owner' addressed message.  We just
-                        # pass it here but list-owner can set this to be
-                        # discarded on the GUI if he wants.
-                        return
-                    hold_for_approval(
-                        mlist, msg, msgdata, HeaderMatchHold(pattern))
-                if action == mm_cfg.ACCEPT:
-                    return
+    matched = headerfilter.match(headers)
+    if matched is None:
+        return
+    action, pattern = matched
+    if action == mm_cfg.DISCARD:
+        syslog('vette', '%s: header_filter_rules discard: %s',
+               mlist.real_name, pattern)
+        raise Errors.DiscardMessage
+    if action == mm_cfg.REJECT:
+        syslog('vette', '%s: header_filter_rules reject: %s',
+               mlist.real_name, pattern)
+        if msgdata.get('toowner'):
+            # Don't send rejection notice if addressed to '-owner'
+            # because it may trigger a loop of notices if the
+            # sender address is forged.  We just discard it here.
+            raise Errors.DiscardMessage
+        raise Errors.RejectMessage(
+            _('Message rejected by filter rule match'))
+    if action == mm_cfg.HOLD:
+        if msgdata.get('toowner'):
+            # Don't hold '-owner' addressed message.  We just
+            # pass it here but list-owner can set this to be
+            # discarded on the GUI if he wants.
+            return
+        hold_for_approval(
+            mlist, msg, msgdata, HeaderMatchHold(pattern))
+    if action == mm_cfg.ACCEPT:
+        return
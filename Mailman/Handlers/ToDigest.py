@@ -25,12 +25,23 @@ from __future__ import print_function
 # When the file reaches the size threshold, it is moved to the qfiles/digest
 # directory and the DigestRunner will craft the MIME, rfc1153, and
 # (eventually) URL-subject linked digests from the mbox.
+#
+# With DIGEST_SPOOL enabled, each message's table of contents entry, RFC 1153
+# text and MIME digest part are also rendered as it arrives, and appended to
+# side files next to the mbox.  Sending the digest then just copies these into
+# place, instead of parsing every message in the mbox again.  The side files
+# are only used if they cover exactly the contents of the mbox.  Otherwise
+# they are rebuilt from the mbox, one message at a time, when the digest is
+# sent.
 
 from builtins import str
 import os
 import re
 import copy
+import errno
 import time
+import codecs
+import pickle
 import traceback
 from io import StringIO
 
@@ -40,6 +51,7 @@ from email.mime.base import MIMEBase
 from email.mime.text import MIMEText
 from email.mime.message import MIMEMessage
 from email.utils import getaddresses, formatdate
+from email.generator import _make_boundary
 from email.header import decode_header, make_header, Header
 from email.charset import Charset
 
@@ -49,7 +61,6 @@ from Mailman import Message
 from Mailman import i18n
 from Mailman import Errors
 from Mailman.Mailbox import Mailbox
-from Mailman.MemberAdaptor import ENABLED
 from Mailman.Handlers.Decorate import decorate
 from Mailman.Queue.sbcache import get_switchboard
 from Mailman.Mailbox import Mailbox
@@ -61,6 +72,18 @@ _ = i18n._
 UEMPTYSTRING = u''
 EMPTYSTRING = ''
 
+# The digest spool: the state file, and the side files holding the table of
+# contents entries, the RFC 1153 text and the MIME parts of the messages.
+SPOOL_STATE = 'digest.spool'
+SPOOL_TOC = 'digest.toc'
+SPOOL_PLAIN = 'digest.plain'
+SPOOL_MIME = 'digest.mime'
+SPOOL_FILES = (SPOOL_TOC, SPOOL_PLAIN, SPOOL_MIME)
+SPOOL_VERSION = 1
+
+separator70 = '-' * 70
+separator30 = '-' * 30
+
 
 def to_cset_out(text, lcset):
     # Convert text from unicode or lcset to output cset.
@@ -80,6 +103,7 @@ def process(mlist, msg, msgdata):
     omask = os.umask(0o007)
     try:
         with open(mboxfile, 'a+b') as mboxfp:
+            mboxsize = os.fstat(mboxfp.fileno()).st_size
             mbox = Mailbox(mboxfp.name)
             try:
                 mbox.AppendMessage(msg)
@@ -91,6 +115,14 @@ def process(mlist, msg, msgdata):
             # whether the size threshold has been reached.
             mboxfp.flush()
             size = os.path.getsize(mboxfile)
+            if mm_cfg.DIGEST_SPOOL:
+                try:
+                    spool_message(mlist, msg, mboxsize, size)
+                except Exception as errmsg:
+                    # The digest will be built from the mbox instead.
+                    syslog('error', 'digest spool failed for list %s: %s',
+                           mlist.internal_name(), errmsg)
+                    remove_spool(mlist)
             if (mlist.digest_size_threshhold > 0 and
                 size / 1024.0 >= mlist.digest_size_threshhold):
                 # This is a bit of a kludge to get the mbox file moved to the digest
@@ -114,6 +146,156 @@ def process(mlist, msg, msgdata):
         os.umask(omask)
 
 
+
+def _spool_path(mlist, name):
+    return os.path.join(mlist.fullpath(), name)
+
+
+def read_spool(mlist):
+    """Return the digest spool's state, or None if there is no spool."""
+    try:
+        with open(_spool_path(mlist, SPOOL_STATE), 'rb') as fp:
+            state = pickle.load(fp)
+    except (EnvironmentError, EOFError, pickle.UnpicklingError):
+        return None
+    if not isinstance(state, dict) or state.get('version') != SPOOL_VERSION:
+        return None
+    return state
+
+
+def _write_spool(mlist, state):
+    path = _spool_path(mlist, SPOOL_STATE)
+    tmpfile = path + '.tmp'
+    with open(tmpfile, 'wb') as fp:
+        pickle.dump(state, fp, 1)
+    os.rename(tmpfile, path)
+
+
+def remove_spool(mlist):
+    for name in (SPOOL_STATE,) + SPOOL_FILES:
+        try:
+            os.unlink(_spool_path(mlist, name))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                syslog('error', 'cannot remove digest spool file %s: %s',
+                       _spool_path(mlist, name), e)
+
+
+def _new_spool(mlist):
+    return {'version': SPOOL_VERSION,
+            'lang': mlist.preferred_language,
+            'boundary': _make_boundary(),
+            'count': 0,
+            'mboxsize': 0,
+            'sizes': dict([(name, 0) for name in SPOOL_FILES]),
+            }
+
+
+def spool_message(mlist, msg, mboxsize, newsize):
+    """Render msg into the digest spool.
+
+    mboxsize and newsize are the sizes of digest.mbox before and after msg was
+    appended to it.
+    """
+    state = read_spool(mlist)
+    if (state is None or state['mboxsize'] != mboxsize or
+            state['lang'] != mlist.preferred_language):
+        # The spool doesn't cover what's in the mbox, either because it got
+        # out of step or because the digest was started without it.  It can
+        # only be started again with a new digest.
+        remove_spool(mlist)
+        if mboxsize:
+            return
+        state = _new_spool(mlist)
+    # The message continues through the pipeline, so work on a copy.
+    if _spool_render(mlist, copy.deepcopy(msg), state):
+        state['mboxsize'] = newsize
+        _write_spool(mlist, state)
+    else:
+        # Building the digest from the mbox picks a boundary that doesn't
+        # clash.
+        syslog('error', 'digest spool boundary clash for list %s',
+               mlist.internal_name())
+        remove_spool(mlist)
+
+
+def _spool_render(mlist, msg, state):
+    # Append the message's entries to the spool files, and update state to
+    # match.  Return False if the message contains the MIME digest boundary.
+    msgcount = state['count'] + 1
+    boundary = state['boundary']
+    lcset = Utils.GetCharSet(mlist.preferred_language)
+    # Render in the list's language, whatever the caller's is.
+    otranslation = i18n.get_translation()
+    i18n.set_language(mlist.preferred_language)
+    try:
+        toc = _toc_entry(mlist, msg, msgcount, lcset)
+        _keep_headers(msg, msgcount)
+        mimepart = StringIO()
+        Generator(mimepart, mangle_from_=False).flatten(MIMEMessage(msg))
+        mimepart = mimepart.getvalue()
+        if boundary in mimepart:
+            return False
+        # This scrubs the message, so it comes after the MIME part.
+        plain = _plain_entry(mlist, msg, lcset)
+    finally:
+        i18n.set_translation(otranslation)
+    if msgcount > 1:
+        mimepart = '\n--%s\n%s' % (boundary, mimepart)
+        plain = '%s\n\n%s' % (separator30, plain)
+    else:
+        mimepart = '--%s\n%s' % (boundary, mimepart)
+    for name, text in ((SPOOL_TOC, toc),
+                       (SPOOL_PLAIN, plain),
+                       (SPOOL_MIME, mimepart)):
+        data = text.encode('utf-8')
+        with open(_spool_path(mlist, name), 'ab') as fp:
+            # Drop anything written after the state was last saved.
+            fp.truncate(state['sizes'][name])
+            fp.write(data)
+        state['sizes'][name] += len(data)
+    state['count'] = msgcount
+    return True
+
+
+def _rebuild_spool(mlist, mboxfp):
+    # Render the spool from the messages in digest.mbox, parsing one message
+    # at a time, and return its state.
+    for attempt in range(3):
+        remove_spool(mlist)
+        state = _new_spool(mlist)
+        mbox = Mailbox(mboxfp)
+        try:
+            for msg in mbox.itervalues():
+                if msg == '':
+                    # It was an unparseable message
+                    continue
+                if not _spool_render(mlist, msg, state):
+                    # Try again with another boundary.
+                    break
+            else:
+                state['mboxsize'] = os.fstat(mboxfp.fileno()).st_size
+                _write_spool(mlist, state)
+                return state
+        finally:
+            mbox.close()
+    raise Errors.MailmanError('no usable MIME boundary for the digest')
+
+
+def _copy_spool(mlist, name, size, outfp):
+    # Copy the first size bytes of a spool file to outfp, a text stream.
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    with open(_spool_path(mlist, name), 'rb') as fp:
+        while size > 0:
+            data = fp.read(min(size, 65536))
+            if not data:
+                raise IOError('digest spool file %s is truncated' % name)
+            size -= len(data)
+            outfp.write(decoder.decode(data))
+    outfp.write(decoder.decode(b'', True))
+
+
+
 
 def send_digests(mlist, mboxfp):
     # Set the digest volume and time
@@ -146,7 +328,8 @@ def send_digests(mlist, mboxfp):
             mlist.bump_digest_volume()
     mlist.digest_last_sent_at = time.time()
     # Wrapper around actually digest crafter to set up the language context
-    # properly.  All digests are translated to the list's preferred language.
+    # properly.  The messages are rendered in the list's preferred language;
+    # the rest of each digest in its recipients' language.
     otranslation = i18n.get_translation()
     i18n.set_language(mlist.preferred_language)
     try:
@@ -157,296 +340,320 @@ def send_digests(mlist, mboxfp):
 
 
 def send_i18n_digests(mlist, mboxfp):
-    mbox = Mailbox(mboxfp)
+    state = read_spool(mlist)
+    if (not mm_cfg.DIGEST_SPOOL or state is None or
+            state['mboxsize'] != os.fstat(mboxfp.fileno()).st_size or
+            state['lang'] != mlist.preferred_language):
+        state = _rebuild_spool(mlist, mboxfp)
+    if state['count']:
+        _send_spooled_digests(mlist, state)
+    # The spool only ever covers the digest that was just sent.
+    remove_spool(mlist)
+
+
+def _toc_entry(mlist, msg, msgcount, lcset):
+    # Return the table of contents entry for the message.
+    toc = StringIO()
+    # Get the Subject header
+    no_subject_locale = _('(no subject)')
+    if isinstance(no_subject_locale, bytes):
+        no_subject_locale = str(no_subject_locale)
+    msgsubj = msg.get('subject', no_subject_locale)
+    subject = Utils.oneline(msgsubj, lcset)
+    # Don't include the redundant subject prefix in the toc
+    mo = re.match('(re:? *)?(%s)' % re.escape(mlist.subject_prefix),
+                  subject, re.IGNORECASE)
+    if mo:
+        subject = subject[:mo.start(2)] + subject[mo.end(2):]
+    username = ''
+    addresses = getaddresses([Utils.oneline(msg.get('from', ''), lcset)])
+    # Take only the first author we find
+    if isinstance(addresses, list) and addresses:
+        username = addresses[0][0]
+        if not username:
+            username = addresses[0][1]
+    if username:
+        username = ' (%s)' % username
+    # Put count and Wrap the toc subject line
+    if isinstance(subject, bytes):
+        subject = str(subject)
+    wrapped = Utils.wrap('%2d. %s' % (msgcount, subject), 65)
+    slines = wrapped.split('\n')
+    # See if the user's name can fit on the last line
+    if len(slines[-1]) + len(username) > 70:
+        slines.append(username)
+    else:
+        slines[-1] += username
+    # Add this subject to the accumulating topics
+    first = True
+    for line in slines:
+        if first:
+            print(' ', line, file=toc)
+            first = False
+        else:
+            print('     ', line.lstrip(), file=toc)
+    return toc.getvalue()
+
+
+def _keep_headers(msg, msgcount):
+    # We do not want all the headers of the original message to leak
+    # through in the digest messages.  For this phase, we'll leave the
+    # same set of headers in both digests, i.e. those required in RFC 1153
+    # plus a couple of other useful ones.  We also need to reorder the
+    # headers according to RFC 1153.  Later, we'll strip out headers for
+    # for the specific MIME or plain digests.
+    keeper = {}
+    all_keepers = {}
+    for header in (mm_cfg.MIME_DIGEST_KEEP_HEADERS +
+                   mm_cfg.PLAIN_DIGEST_KEEP_HEADERS):
+        all_keepers[header] = True
+    all_keepers = list(all_keepers.keys())
+    for keep in all_keepers:
+        keeper[keep] = msg.get_all(keep, [])
+    # Now remove all unkempt headers :)
+    for header in list(msg.keys()):
+        del msg[header]
+    # And add back the kept header in the RFC 1153 designated order
+    for keep in all_keepers:
+        for field in keeper[keep]:
+            msg[keep] = field
+    # And a bit of extra stuff
+    msg['Message'] = repr(msgcount)
+
+
+def _plain_entry(mlist, msg, lcset):
+    # Return the RFC 1153 digest text for the message.  This scrubs the
+    # message, so the MIME digest part must be made first.
+    plainmsg = StringIO()
+    # Use Mailman.Handlers.Scrubber.process() to get plain text
     try:
-        _send_i18n_digests(mlist, mbox)
-    finally:
-        mbox.close()
+        msg = scrubber(mlist, msg)
+    except Errors.DiscardMessage:
+        discard_msg = _('[Message discarded by content filter]')
+        if isinstance(discard_msg, bytes):
+            discard_msg = str(discard_msg)
+        print(discard_msg, file=plainmsg)
+        return plainmsg.getvalue()
+    # Honor the default setting
+    for h in mm_cfg.PLAIN_DIGEST_KEEP_HEADERS:
+        if msg[h]:
+            uh = Utils.wrap('%s: %s' % (h, Utils.oneline(msg[h], lcset)))
+            uh = '\n\t'.join(uh.split('\n'))
+            print(uh, file=plainmsg)
+    print(file=plainmsg)
+    # If decoded payload is empty, this may be multipart message.
+    # -- just stringfy it.
+    payload = msg.get_payload(decode=True)
+    if payload == None:
+        payload = msg.as_string().split('\n\n',1)[1]
+    mcset = msg.get_content_charset('')
+    if mcset == None or mcset == "":
+        mcset = 'utf-8'
+    if isinstance(payload, bytes):
+        payload = payload.decode(mcset, 'replace')
+    print(payload, file=plainmsg)
+    if not payload.endswith('\n'):
+        print(file=plainmsg)
+    return plainmsg.getvalue()
 
 
-def _send_i18n_digests(mlist, mbox):
-    # Prepare common information (first lang/charset)
-    lang = mlist.preferred_language
-    lcset = Utils.GetCharSet(lang)
-    lcset_out = Charset(lcset).output_charset or lcset
-    # Common Information (contd)
+def _digest_id(mlist):
     realname = mlist.real_name
     volume = mlist.volume
     issue = mlist.next_digest_number
-    digestid = _('%(realname)s Digest, Vol %(volume)d, Issue %(issue)d')
-    digestsubj = Header(digestid, lcset, header_name='Subject')
-    # Set things up for the MIME digest.  Only headers not added by
-    # CookHeaders need be added here.
-    # Date/Message-ID should be added here also.
-    mimemsg = Message.Message()
-    mimemsg['Content-Type'] = 'multipart/mixed'
-    mimemsg['MIME-Version'] = '1.0'
-    mimemsg['From'] = mlist.GetRequestEmail()
-    mimemsg['Subject'] = digestsubj
-    mimemsg['To'] = mlist.GetListEmail()
-    mimemsg['Reply-To'] = mlist.GetListEmail()
-    mimemsg['Date'] = formatdate(localtime=1)
-    mimemsg['Message-ID'] = Utils.unique_message_id(mlist)
-    # Set things up for the rfc1153 digest
-    plainmsg = StringIO()
-    rfc1153msg = Message.Message()
-    rfc1153msg['From'] = mlist.GetRequestEmail()
-    rfc1153msg['Subject'] = digestsubj
-    rfc1153msg['To'] = mlist.GetListEmail()
-    rfc1153msg['Reply-To'] = mlist.GetListEmail()
-    rfc1153msg['Date'] = formatdate(localtime=1)
-    rfc1153msg['Message-ID'] = Utils.unique_message_id(mlist)
-    separator70 = '-' * 70
-    separator30 = '-' * 30
-    # In the rfc1153 digest, the masthead contains the digest boilerplate plus
-    # any digest header.  In the MIME digests, the masthead and digest header
-    # are separate MIME subobjects.  In either case, it's the first thing in
-    # the digest, and we can calculate it now, so go ahead and add it now.
-    mastheadtxt = Utils.maketext(
+    return _('%(realname)s Digest, Vol %(volume)d, Issue %(issue)d')
+
+
+def _digest_message(mlist, digestid, lcset):
+    # Return a new digest message with the headers not added by CookHeaders.
+    msg = Message.Message()
+    msg['From'] = mlist.GetRequestEmail()
+    msg['Subject'] = Header(digestid, lcset, header_name='Subject')
+    msg['To'] = mlist.GetListEmail()
+    msg['Reply-To'] = mlist.GetListEmail()
+    msg['Date'] = formatdate(localtime=1)
+    msg['Message-ID'] = Utils.unique_message_id(mlist)
+    return msg
+
+
+def _masthead(mlist, lang):
+    return Utils.maketext(
         'masthead.txt',
         {'real_name' :        mlist.real_name,
          'got_list_email':    mlist.GetListEmail(),
          'got_listinfo_url':  mlist.GetScriptURL('listinfo', absolute=1),
          'got_request_email': mlist.GetRequestEmail(),
          'got_owner_email':   mlist.GetOwnerEmail(),
-         }, mlist=mlist)
-    # MIME
-    masthead = MIMEText(mastheadtxt, _charset=lcset)
-    masthead['Content-Description'] = digestid
-    mimemsg.attach(masthead)
-    # RFC 1153
-    print(mastheadtxt, file=plainmsg)
+         }, lang=lang, mlist=mlist)
+
+
+def _digest_header(mlist):
+    # Return the digest header, but only if more than whitespace.
+    if not re.sub(r'\s', '', mlist.digest_header):
+        return None
+    lc_digest_header_msg = _('digest header')
+    if isinstance(lc_digest_header_msg, bytes):
+        lc_digest_header_msg = str(lc_digest_header_msg)
+    return decorate(mlist, mlist.digest_header, lc_digest_header_msg)
+
+
+def _digest_footer(mlist):
+    # Return the digest footer, but only if more than whitespace.
+    if not re.sub(r'\s', '', mlist.digest_footer):
+        return None
+    lc_digest_footer_msg = _('digest footer')
+    if isinstance(lc_digest_footer_msg, bytes):
+        lc_digest_footer_msg = str(lc_digest_footer_msg)
+    return decorate(mlist, mlist.digest_footer, lc_digest_footer_msg)
+
+
+def _print_plain_footer(footertxt, plainmsg):
+    # MAS: There is no real place for the digest_footer in an RFC 1153
+    # compliant digest, so add it as an additional message with
+    # Subject: Digest Footer
+    print(separator30, file=plainmsg)
     print(file=plainmsg)
-    # Now add the optional digest header but only if more than whitespace.
-    if re.sub(r'\s', '', mlist.digest_header):
-        lc_digest_header_msg = _('digest header')
-        if isinstance(lc_digest_header_msg, bytes):
-            lc_digest_header_msg = str(lc_digest_header_msg)
-        headertxt = decorate(mlist, mlist.digest_header, lc_digest_header_msg)
-        # MIME
-        header = MIMEText(headertxt, _charset=lcset)
-        header['Content-Description'] = _('Digest Header')
-        mimemsg.attach(header)
-        # RFC 1153
-        print(headertxt, file=plainmsg)
-        print(file=plainmsg)
-    # Now we have to cruise through all the messages accumulated in the
-    # mailbox file.  We can't add these messages to the plainmsg and mimemsg
-    # yet, because we first have to calculate the table of contents
-    # (i.e. grok out all the Subjects).  Store the messages in a list until
-    # we're ready for them.
-    #
-    # Meanwhile prepare things for the table of contents
-    toc = StringIO()
+    digest_footer_msg = _('Digest Footer')
+    if isinstance(digest_footer_msg, bytes):
+        digest_footer_msg = str(digest_footer_msg)
+    print('Subject: ' + digest_footer_msg, file=plainmsg)
+    print(file=plainmsg)
+    print(footertxt, file=plainmsg)
+    print(file=plainmsg)
+    print(separator30, file=plainmsg)
+    print(file=plainmsg)
+
+
+def _start_toc():
     start_toc = _("Today's Topics:\n")
     if isinstance(start_toc, bytes):
         start_toc = str(start_toc)
-    print(start_toc, file=toc)
-    # Now cruise through all the messages in the mailbox of digest messages,
-    # building the MIME payload and core of the RFC 1153 digest.  We'll also
-    # accumulate Subject: headers and authors for the table-of-contents.
-    messages = []
-    msgcount = 0
-    mbox = mbox.itervalues()
-    msg = next(mbox, None)
-    while msg is not None:
-        if msg == '':
-            # It was an unparseable message
-            msg = next(mbox, None)
-            continue
-        msgcount += 1
-        messages.append(msg)
-        # Get the Subject header
-        no_subject_locale = _('(no subject)')
-        if isinstance(no_subject_locale, bytes):
-            no_subject_locale = str(no_subject_locale)
-        msgsubj = msg.get('subject', no_subject_locale)
-        subject = Utils.oneline(msgsubj, lcset)
-        # Don't include the redundant subject prefix in the toc
-        mo = re.match('(re:? *)?(%s)' % re.escape(mlist.subject_prefix),
-                      subject, re.IGNORECASE)
-        if mo:
-            subject = subject[:mo.start(2)] + subject[mo.end(2):]
-        username = ''
-        addresses = getaddresses([Utils.oneline(msg.get('from', ''), lcset)])
-        # Take only the first author we find
-        if isinstance(addresses, list) and addresses:
-            username = addresses[0][0]
-            if not username:
-                username = addresses[0][1]
-        if username:
-            username = ' (%s)' % username
-        # Put count and Wrap the toc subject line
-        if isinstance(subject, bytes):
-            subject = str(subject)
-        wrapped = Utils.wrap('%2d. %s' % (msgcount, subject), 65)
-        slines = wrapped.split('\n')
-        # See if the user's name can fit on the last line
-        if len(slines[-1]) + len(username) > 70:
-            slines.append(username)
-        else:
-            slines[-1] += username
-        # Add this subject to the accumulating topics
-        first = True
-        for line in slines:
-            if first:
-                print(' ', line, file=toc)
-                first = False
-            else:
-                print('     ', line.lstrip(), file=toc)
-        # We do not want all the headers of the original message to leak
-        # through in the digest messages.  For this phase, we'll leave the
-        # same set of headers in both digests, i.e. those required in RFC 1153
-        # plus a couple of other useful ones.  We also need to reorder the
-        # headers according to RFC 1153.  Later, we'll strip out headers for
-        # for the specific MIME or plain digests.
-        keeper = {}
-        all_keepers = {}
-        for header in (mm_cfg.MIME_DIGEST_KEEP_HEADERS +
-                       mm_cfg.PLAIN_DIGEST_KEEP_HEADERS):
-            all_keepers[header] = True
-        all_keepers = list(all_keepers.keys())
-        for keep in all_keepers:
-            keeper[keep] = msg.get_all(keep, [])
-        # Now remove all unkempt headers :)
-        for header in list(msg.keys()):
-            del msg[header]
-        # And add back the kept header in the RFC 1153 designated order
-        for keep in all_keepers:
-            for field in keeper[keep]:
-                msg[keep] = field
-        # And a bit of extra stuff
-        msg['Message'] = repr(msgcount)
-        # Get the next message in the digest mailbox
-        msg = next(mbox, None)
-    # Now we're finished with all the messages in the digest.  First do some
-    # sanity checking and then on to adding the toc.
-    if msgcount == 0:
-        # Why did we even get here?
-        return
-    toctext = toc.getvalue()
-    toctext_encoded = to_cset_out(toctext, lcset)
-    # MIME
+    return start_toc + '\n'
+
+
+
+
+def _send_spooled_digests(mlist, state):
+    # Work out who gets which digest, then assemble each digest that has
+    # recipients from the spool files.  Apart from the table of contents,
+    # the messages are copied straight into the outgoing text.
+    drecips = mlist.getDigestMemberKeys() + list(mlist.one_last_digest.keys())
+    recips = mlist.getDigestRecipients(drecips)
+    if not mm_cfg.DIGEST_MEMBER_LANGUAGES:
+        merged = {}
+        for (lang, mime), members in recips.items():
+            merged.setdefault((mlist.preferred_language, mime), []).extend(
+                members)
+        recips = merged
+    headertxt = _digest_header(mlist)
+    footertxt = _digest_footer(mlist)
+    entries = StringIO()
+    _copy_spool(mlist, SPOOL_TOC, state['sizes'][SPOOL_TOC], entries)
+    entries = entries.getvalue()
+    virginq = get_switchboard(mm_cfg.VIRGINQUEUE_DIR)
+    otranslation = i18n.get_translation()
+    try:
+        for lang in sorted(set([lang for lang, mime in recips])):
+            i18n.set_language(lang)
+            toctext = _start_toc() + entries
+            mastheadtxt = _masthead(mlist, lang)
+            if (lang, True) in recips:
+                mimetext = _mime_digest(mlist, state, lang, toctext,
+                                        mastheadtxt, headertxt, footertxt)
+                virginq.enqueue(mimetext,
+                                recips=recips[(lang, True)],
+                                listname=mlist.internal_name(),
+                                isdigest=True,
+                                _plaintext=True)
+            if (lang, False) in recips:
+                rfc1153msg = _plain_digest(mlist, state, lang, toctext,
+                                           mastheadtxt, headertxt, footertxt)
+                virginq.enqueue(rfc1153msg,
+                                recips=recips[(lang, False)],
+                                listname=mlist.internal_name(),
+                                isdigest=True)
+    finally:
+        i18n.set_translation(otranslation)
+    # Do our final bit of housekeeping.
+    mlist.next_digest_number += 1
+    # Zap this since we're now delivering the last digest to these folks.
+    mlist.one_last_digest.clear()
+
+
+def _mime_digest(mlist, state, lang, toctext, mastheadtxt, headertxt,
+                 footertxt):
+    # Return the text of the MIME digest.  The small parts are built as
+    # usual, and each is flattened separately so the spooled multipart/digest
+    # part can be put between them.
+    lcset = Utils.GetCharSet(lang)
+    msgcount = state['count']
+    digestid = _digest_id(mlist)
+    mimemsg = _digest_message(mlist, digestid, lcset)
+    mimemsg['Content-Type'] = 'multipart/mixed'
+    mimemsg['MIME-Version'] = '1.0'
+    parts = []
+    masthead = MIMEText(mastheadtxt, _charset=lcset)
+    masthead['Content-Description'] = digestid
+    parts.append(masthead)
+    if headertxt is not None:
+        header = MIMEText(headertxt, _charset=lcset)
+        header['Content-Description'] = _('Digest Header')
+        parts.append(header)
     tocpart = MIMEText(toctext, _charset=lcset)
     tocpart['Content-Description']= _("Today's Topics (%(msgcount)d messages)")
-    mimemsg.attach(tocpart)
-    # RFC 1153
+    parts.append(tocpart)
+    # The messages go here.
+    parts.append(None)
+    if footertxt is not None:
+        footer = MIMEText(footertxt, _charset=lcset)
+        footer['Content-Description'] = _('Digest Footer')
+        parts.append(footer)
+    # The spooled parts can't contain the digest boundary, nor this one.
+    outer = state['boundary'] + '.mixed'
+    mimemsg.set_boundary(outer)
+    mimemsg.set_payload('')
+    mimetext = StringIO()
+    mimetext.write(mimemsg.as_string(mangle_from_=False))
+    for part in parts:
+        mimetext.write('--%s\n' % outer)
+        if part is None:
+            mimedigest = MIMEBase('multipart', 'digest',
+                                  boundary=state['boundary'])
+            mimedigest.set_payload('')
+            mimetext.write(mimedigest.as_string())
+            _copy_spool(mlist, SPOOL_MIME, state['sizes'][SPOOL_MIME],
+                        mimetext)
+            mimetext.write('\n--%s--\n' % state['boundary'])
+        else:
+            mimetext.write(part.as_string())
+        mimetext.write('\n')
+    mimetext.write('--%s--\n' % outer)
+    mimetext.write(_('End of ') + digestid + '\n')
+    return mimetext.getvalue()
+
+
+def _plain_digest(mlist, state, lang, toctext, mastheadtxt, headertxt,
+                  footertxt):
+    # Return the RFC 1153 digest message.  In the rfc1153 digest, the
+    # masthead contains the digest boilerplate plus any digest header.
+    digestid = _digest_id(mlist)
+    rfc1153msg = _digest_message(mlist, digestid, Utils.GetCharSet(lang))
+    plainmsg = StringIO()
+    print(mastheadtxt, file=plainmsg)
+    print(file=plainmsg)
+    if headertxt is not None:
+        print(headertxt, file=plainmsg)
+        print(file=plainmsg)
     print(toctext, file=plainmsg)
     print(file=plainmsg)
     # For RFC 1153 digests, we now need the standard separator
     print(separator70, file=plainmsg)
     print(file=plainmsg)
-    # Now go through and add each message
-    mimedigest = MIMEBase('multipart', 'digest')
-    mimemsg.attach(mimedigest)
-    first = True
-    for msg in messages:
-        # MIME.  Make a copy of the message object since the rfc1153
-        # processing scrubs out attachments.
-        mimedigest.attach(MIMEMessage(copy.deepcopy(msg)))
-        # rfc1153
-        if first:
-            first = False
-        else:
-            print(separator30, file=plainmsg)
-            print(file=plainmsg)
-        # Use Mailman.Handlers.Scrubber.process() to get plain text
-        try:
-            msg = scrubber(mlist, msg)
-        except Errors.DiscardMessage:
-            discard_msg = _('[Message discarded by content filter]')
-            if isinstance(discard_msg, bytes):
-                discard_msg = str(discard_msg)
-            print(discard_msg, file=plainmsg)
-            continue
-        # Honor the default setting
-        for h in mm_cfg.PLAIN_DIGEST_KEEP_HEADERS:
-            if msg[h]:
-                uh = Utils.wrap('%s: %s' % (h, Utils.oneline(msg[h], lcset)))
-                uh = '\n\t'.join(uh.split('\n'))
-                print(uh, file=plainmsg)
-        print(file=plainmsg)
-        # If decoded payload is empty, this may be multipart message.
-        # -- just stringfy it.
-        payload = msg.get_payload(decode=True)
-        if payload == None:
-            payload = msg.as_string().split('\n\n',1)[1]
-        mcset = msg.get_content_charset('')
-        if mcset == None or mcset == "":
-            mcset = 'utf-8'
-        if isinstance(payload, bytes):
-            payload = payload.decode(mcset, 'replace')
-        print(payload, file=plainmsg)
-        if not payload.endswith('\n'):
-            print(file=plainmsg)
-
-    # Now add the footer but only if more than whitespace.
-    if re.sub(r'\s', '', mlist.digest_footer):
-        lc_digest_footer_msg = _('digest footer')
-        if isinstance(lc_digest_footer_msg, bytes):
-            lc_digest_footer_msg = str(lc_digest_footer_msg)
-        footertxt = decorate(mlist, mlist.digest_footer, lc_digest_footer_msg)
-        # MIME
-        footer = MIMEText(footertxt, _charset=lcset)
-        footer['Content-Description'] = _('Digest Footer')
-        mimemsg.attach(footer)
-        # RFC 1153
-        # MAS: There is no real place for the digest_footer in an RFC 1153
-        # compliant digest, so add it as an additional message with
-        # Subject: Digest Footer
-        print(separator30, file=plainmsg)
-        print(file=plainmsg)
-
-        digest_footer_msg = _('Digest Footer')
-        if isinstance(digest_footer_msg, bytes):
-            digest_footer_msg = str(digest_footer_msg)
-        print('Subject: ' + digest_footer_msg, file=plainmsg)
-        print(file=plainmsg)
-        print(footertxt, file=plainmsg)
-        print(file=plainmsg)
-        print(separator30, file=plainmsg)
-        print(file=plainmsg)
-    # Do the last bit of stuff for each digest type
+    _copy_spool(mlist, SPOOL_PLAIN, state['sizes'][SPOOL_PLAIN], plainmsg)
+    if footertxt is not None:
+        _print_plain_footer(footertxt, plainmsg)
     signoff = _('End of ') + digestid
-    # MIME
-    # BAW: This stuff is outside the normal MIME goo, and it's what the old
-    # MIME digester did.  No one seemed to complain, probably because you
-    # won't see it in an MUA that can't display the raw message.  We've never
-    # got complaints before, but if we do, just wax this.  It's primarily
-    # included for (marginally useful) backwards compatibility.
-    mimemsg.postamble = signoff
-    # rfc1153
     print(signoff, file=plainmsg)
     print('*' * len(signoff), file=plainmsg)
-    # Do our final bit of housekeeping, and then send each message to the
-    # outgoing queue for delivery.
-    mlist.next_digest_number += 1
-    virginq = get_switchboard(mm_cfg.VIRGINQUEUE_DIR)
-    # Calculate the recipients lists
-    plainrecips = []
-    mimerecips = []
-    drecips = mlist.getDigestMemberKeys() + list(mlist.one_last_digest.keys())
-    for user in mlist.getMemberCPAddresses(drecips):
-        # user might be None if someone who toggled off digest delivery
-        # subsequently unsubscribed from the mailing list.  Also, filter out
-        # folks who have disabled delivery.
-        if user is None or mlist.getDeliveryStatus(user) != ENABLED:
-            continue
-        # Otherwise, decide whether they get MIME or RFC 1153 digests
-        if mlist.getMemberOption(user, mm_cfg.DisableMime):
-            plainrecips.append(user)
-        else:
-            mimerecips.append(user)
-    # Zap this since we're now delivering the last digest to these folks.
-    mlist.one_last_digest.clear()
-    # MIME
-    virginq.enqueue(mimemsg,
-                    recips=mimerecips,
-                    listname=mlist.internal_name(),
-                    isdigest=True)
-    # RFC 1153
     rfc1153msg.set_payload(plainmsg.getvalue(), 'utf-8')
-    virginq.enqueue(rfc1153msg,
-                    recips=plainrecips,
-                    listname=mlist.internal_name(),
-                    isdigest=True)
+    return rfc1153msg
@@ -25,20 +25,19 @@ from builtins import *
 from builtins import object
 import sys
 import os
-import codecs
 
 from Mailman import mm_cfg
 from Mailman.Logging.Utils import _logexc
 
 # Set this to the encoding to be used for your log file output.  If set to
 # None, then it uses your system's default encoding.  Otherwise, it must be an
-# encoding string appropriate for codecs.open().
+# encoding string appropriate for open().
 LOG_ENCODING = 'iso-8859-1'
 
 
 
 class Logger(object):
-    def __init__(self, category, nofail=1, immediate=0):
+    def __init__(self, category, nofail=1, immediate=0, buffered=0):
         """nofail says to fallback to sys.__stderr__ if write fails to
         category file - a complaint message is emitted, but no exception is
         raised.  Set nofail=0 if you want to handle the error in your code,
@@ -46,10 +45,14 @@ class Logger(object):
 
         immediate=1 says to create the log file on instantiation.
         Otherwise, the file is created only when there are writes pending.
+
+        buffered=1 says not to flush the file after every write; the caller
+        is then responsible for calling flush().
         """
         self.__filename = os.path.join(mm_cfg.LOG_DIR, category)
         self.__fp = None
         self.__nofail = nofail
+        self.__buffered = buffered
         self.__encoding = LOG_ENCODING or sys.getdefaultencoding()
         if immediate:
             self.__get_f()
@@ -68,8 +71,8 @@ class Logger(object):
                 ou = os.umask(0o07)
                 try:
                     try:
-                        f = codecs.open(
-                            self.__filename, 'a+', self.__encoding, 'replace')
+                        f = open(self.__filename, 'a+',
+                                 encoding=self.__encoding, errors='replace')
                     except LookupError:
                         f = open(self.__filename, 'a+', 1)
                     self.__fp = f
@@ -94,7 +97,8 @@ class Logger(object):
         f = self.__get_f()
         try:
             f.write(msg)
-            f.flush()
+            if not self.__buffered:
+                f.flush()
         except IOError as msg:
             _logexc(self, msg)
 
@@ -41,7 +41,7 @@ class StampedLogger(Logger):
 
     """
     def __init__(self, category, label=None, manual_reprime=0, nofail=1,
-                 immediate=1):
+                 immediate=1, buffered=0):
         """If specified, optional label is included after timestamp.
         Other options are passed to the Logger class initializer.
         """
@@ -49,19 +49,22 @@ class StampedLogger(Logger):
         self.__manual_reprime = manual_reprime
         self.__primed = 1
         self.__bol = 1
-        Logger.__init__(self, category, nofail, immediate)
+        Logger.__init__(self, category, nofail, immediate, buffered)
 
     def reprime(self):
         """Reset so timestamp will be included with next write."""
         self.__primed = 1
 
-    def write(self, msg):
+    def write(self, msg, when=None):
+        """Write msg, stamped with the time when if given, otherwise now."""
         if not self.__bol:
             prefix = ""
         else:
             if not self.__manual_reprime or self.__primed:
+                if when is None:
+                    when = time.time()
                 stamp = time.strftime("%b %d %H:%M:%S %Y ",
-                                      time.localtime(time.time()))
+                                      time.localtime(when))
                 self.__primed = 0
             else:
                 stamp = ""
@@ -21,12 +21,22 @@ This might eventually be replaced by a syslog based logger, hence the name.
 """
 
 from builtins import object
+import os
+import time
 import quopri
+import atexit
+import threading
+import collections
 
+from Mailman import mm_cfg
 from Mailman.Logging.StampedLogger import StampedLogger
 
+# Buffered lines are written out once there are this many of them, even if
+# LOG_FLUSH_INTERVAL hasn't passed yet.
+MAX_PENDING = 1000
+
+
 
-
 # Global, shared logger instance.  All clients should use this object.
 syslog = None
 
@@ -55,15 +65,33 @@ def reopen_logs_if_pending():
     return True
 
 
-
+
 # Don't instantiate except below.
 class _Syslog(object):
     def __init__(self):
         self._logfiles = {}
+        # Lines waiting to be written, as (kind, msg, when) tuples.  Appending
+        # to a deque needs no lock, so logging from a signal handler can't
+        # deadlock.
+        self._pending = collections.deque()
+        # Serializes writing the pending lines and closing the files, which
+        # the writer thread does too.  It's reentrant in case a signal
+        # handler logs while this thread is writing.
+        self._lock = threading.RLock()
+        self._lastflush = time.time()
+        self._thread = None
+        self._stopping = threading.Event()
+        self._disabled = set(mm_cfg.LOG_DISABLED_CATEGORIES)
+        self._immediate = set(mm_cfg.LOG_IMMEDIATE_CATEGORIES)
+        self._interval = mm_cfg.LOG_FLUSH_INTERVAL
 
     def __del__(self):
         self.close()
 
+    def enabled(self, kind):
+        """Return whether messages in the kind category are logged."""
+        return kind not in self._disabled
+
     def write(self, kind, msg, *args, **kws):
         self.write_ex(kind, msg, args, kws)
 
@@ -71,10 +99,10 @@ class _Syslog(object):
     # object, which is not a concrete dictionary.  This is not allowed by
     # Python's extended call syntax. :(
     def write_ex(self, kind, msg, args=None, kws=None):
+        if kind in self._disabled:
+            # Don't even bother formatting the message.
+            return
         origmsg = msg
-        logf = self._logfiles.get(kind)
-        if not logf:
-            logf = self._logfiles[kind] = StampedLogger(kind)
         try:
             if args:
                 msg %= args
@@ -83,23 +111,100 @@ class _Syslog(object):
         # It's really bad if exceptions in the syslogger cause other crashes
         except Exception as e:
             msg = 'Bad format "%s": %s: %s' % (origmsg, repr(e), e)
+        if self._interval <= 0 or kind in self._immediate:
+            with self._lock:
+                self._write(kind, msg)
+                self._logfiles[kind].flush()
+            return
+        self._pending.append((kind, msg, time.time()))
+        if mm_cfg.LOG_WRITER_THREAD:
+            if self._thread is None:
+                self._start_thread()
+        elif len(self._pending) >= MAX_PENDING:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def _write(self, kind, msg, when=None):
+        logf = self._logfiles.get(kind)
+        if not logf:
+            logf = self._logfiles[kind] = StampedLogger(
+                kind, buffered=kind not in self._immediate)
         try:
-            logf.write(msg + '\n')
+            logf.write(msg + '\n', when)
         except UnicodeError:
             # Python 2.4 may fail to write 8bit (non-ascii) characters
             # Also, if msg is unicode with non-ascii, quopri.encodestring()
             # will throw UnicodeEncodeError, so avoid that.
             if isinstance(msg, str):
                 msg = msg.encode('iso-8859-1', 'replace')
-            logf.write(quopri.encodestring(msg) + '\n')
+            logf.write(quopri.encodestring(msg).decode('ascii') + '\n', when)
 
     # For the ultimate in convenience
     __call__ = write
 
+    def flush(self):
+        """Write out all the buffered lines."""
+        with self._lock:
+            kinds = set()
+            while True:
+                try:
+                    kind, msg, when = self._pending.popleft()
+                except IndexError:
+                    break
+                self._write(kind, msg, when)
+                kinds.add(kind)
+            for kind in kinds:
+                self._logfiles[kind].flush()
+            self._lastflush = time.time()
+
+    def flush_if_due(self):
+        """Write out the buffered lines if LOG_FLUSH_INTERVAL has passed."""
+        if (self._pending and
+                time.time() - self._lastflush >= self._interval):
+            self.flush()
+
     def close(self):
-        for kind, logger in list(self._logfiles.items()):
-            logger.close()
-        self._logfiles.clear()
+        with self._lock:
+            # Buffered lines go to the files they were logged for, e.g. before
+            # they're rotated.
+            self.flush()
+            for kind, logger in list(self._logfiles.items()):
+                logger.close()
+            self._logfiles.clear()
+
+    def _start_thread(self):
+        self._thread = threading.Thread(target=self._writer,
+                                        name='syslog writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _writer(self):
+        while not self._stopping.wait(max(self._interval, 0.1)):
+            self.flush()
+
+    def shutdown(self):
+        """Stop the writer thread, if any, and write everything out."""
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+            self._stopping.clear()
+        self.flush()
+
+    def _before_fork(self):
+        # Otherwise the child inherits the buffered lines and writes them too.
+        self.flush()
+
+    def _after_fork_in_child(self):
+        # The writer thread doesn't survive the fork, and neither may the
+        # state of the lock.
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.RLock()
 
 
 syslog = _Syslog()
+atexit.register(syslog.shutdown)
+os.register_at_fork(before=syslog._before_fork,
+                    after_in_child=syslog._after_fork_in_child)
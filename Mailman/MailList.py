@@ -68,6 +68,7 @@ from Mailman import MemberAdaptor
 from Mailman.OldStyleMemberships import OldStyleMemberships
 from Mailman import Message
 from Mailman import Site
+from Mailman import AddressPatterns
 from Mailman import i18n
 from Mailman.Logging.Syslog import syslog
 
@@ -1783,60 +1784,8 @@ bad regexp in bounce_matching_header line: %s
         says process the @listname syntax and provides the name of
         the list attribute for log messages.
         """
-        matched = None
-        # First strip out all the regular expressions and listnames because
-        # documentation says we do non-regexp first (Why?).
-        plainaddrs = [x.strip() for x in pattern_list if x.strip() and not
-                         (x.startswith('^') or x.startswith('@'))]
-        addrdict = Utils.List2Dict(plainaddrs, foldcase=1)
-        if email.lower() in addrdict:
-            return email
-        for pattern in pattern_list:
-            if pattern.startswith('^'):
-                # This is a regular expression match
-                try:
-                    if re.search(pattern, email, re.IGNORECASE):
-                        matched = pattern
-                        break
-                except re.error as e:
-                    # BAW: we should probably remove this pattern
-                    # The GUI won't add a bad regexp, but at least log it.
-                    # The following kludge works because the ban_list stuff
-                    # is the only caller with no at_list.
-                    attr_name = at_list or 'ban_list'
-                    syslog('error',
-                           '%s in %s has bad regexp "%s": %s',
-                           attr_name,
-                           self.internal_name(),
-                           pattern,
-                           str(e)
-                          )
-            elif at_list and pattern.startswith('@'):
-                # XXX Needs to be reviewed for list@domain names.
-                # this refers to the members of another list in this
-                # installation.
-                mname = pattern[1:].lower().strip()
-                if mname == self.internal_name():
-                    # don't reference your own list
-                    syslog('error',
-                        '%s in %s references own list',
-                        at_list,
-                        self.internal_name())
-                    continue
-                try:
-                    mother = MailList(mname, lock = False)
-                except Errors.MMUnknownListError:
-                    syslog('error',
-                           '%s in %s references non-existent list %s',
-                           at_list,
-                           self.internal_name(),
-                           mname
-                          )
-                    continue
-                if mother.isMember(email.lower()):
-                    matched = pattern
-                    break
-        return matched
+        return AddressPatterns.get_patterns(
+            self.internal_name(), pattern_list, at_list).match(email)
 
 
 
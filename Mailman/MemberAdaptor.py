@@ -46,8 +46,10 @@ For any writeable method not supported, a NotImplementedError exception should
 be raised.
 """
 
-# Delivery statuses
 from builtins import object
+from Mailman import mm_cfg
+
+# Delivery statuses
 ENABLED  = 0                                      # enabled
 UNKNOWN  = 1                                      # legacy disabled
 BYUSER   = 2                                      # disabled by user choice
@@ -220,6 +222,30 @@ class MemberAdaptor:
         """
         raise NotImplementedError
 
+    def getDigestRecipients(self, members):
+        """Return the digest recipients among the members KEY/LCE.
+
+        The result is a dictionary mapping (language, mime) pairs to lists of
+        CPEs, where language is the member's preferred language and mime is
+        true if they get MIME rather than RFC 1153 digests.  Members whose
+        delivery is not ENABLED, and entries in members that don't refer to a
+        valid member, are left out.
+
+        Adaptors can override this with a single query; this version asks
+        about each member in turn.
+        """
+        recips = {}
+        for member in members:
+            if not self.isMember(member):
+                continue
+            if self.getDeliveryStatus(member) != ENABLED:
+                continue
+            mime = not self.getMemberOption(member, mm_cfg.DisableMime)
+            key = (self.getMemberLanguage(member), mime)
+            recips.setdefault(key, []).append(
+                self.getMemberCPAddress(member))
+        return recips
+
 
     #
     # The writeable interface
@@ -0,0 +1,206 @@
+# Copyright (C) 2026 by the Free Software Foundation, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+
+"""Process-wide counters, gauges and histograms.
+
+Metrics are kept in memory and can be written out in the Prometheus text
+exposition format, e.g. to a file picked up by node_exporter's textfile
+collector.  Each metric is identified by its name and a set of labels:
+
+    Metrics.inc('mailman_bounces_total', list='mylist')
+    Metrics.observe('mailman_bounce_detector_seconds', 0.002, detector='DSN')
+"""
+
+import os
+import re
+import bisect
+
+from Mailman import mm_cfg
+
+# Histogram bucket upper bounds, in seconds.
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5,
+                   1.0, 5.0, 10.0, 60.0)
+# For end to end latencies, which can run into hours.
+LATENCY_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0,
+                   3600.0, 14400.0, 86400.0)
+
+# Maps (name, labels) to values, where labels is a sorted tuple of
+# (label, value) pairs.
+_counters = {}
+_gauges = {}
+_histograms = {}
+# Maps metric names to their help text, and histogram names to their bucket
+# bounds if not the default ones.
+_help = {}
+_buckets = {}
+
+samplecre = re.compile(r'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)'
+                       r'(?:\{(?P<labels>.*)\})?\s+(?P<value>\S+)')
+labelcre = re.compile(r'(?P<label>[a-zA-Z_][a-zA-Z0-9_]*)="'
+                      r'(?P<value>(?:[^"\\]|\\.)*)"')
+
+
+
+class Histogram(object):
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # counts[i] is the number of observations that fell in bucket i; the
+        # last one is for observations above the largest bound.
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+
+def describe(name, text, buckets=None):
+    """Set the help text for a metric, and the buckets for a histogram."""
+    _help[name] = text
+    if buckets is not None:
+        _buckets[name] = buckets
+
+
+def inc(name, value=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    _counters[key] = _counters.get(key, 0) + value
+
+
+def gauge(name, value, **labels):
+    _gauges[(name, tuple(sorted(labels.items())))] = value
+
+
+def observe(name, value, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    histogram = _histograms.get(key)
+    if histogram is None:
+        histogram = _histograms[key] = Histogram(
+            _buckets.get(name, DEFAULT_BUCKETS))
+    histogram.observe(value)
+
+
+def get(name, **labels):
+    """Return the value of a counter or gauge, or a Histogram, or None."""
+    key = (name, tuple(sorted(labels.items())))
+    for metrics in (_counters, _gauges, _histograms):
+        if key in metrics:
+            return metrics[key]
+    return None
+
+
+def reset():
+    _counters.clear()
+    _gauges.clear()
+    _histograms.clear()
+
+
+
+def _labelstr(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        ['%s="%s"' % (k, str(v).replace('\\', r'\\').replace('"', r'\"')
+                                .replace('\n', r'\n'))
+         for k, v in labels])
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def format(**extralabels):
+    """Return all metrics in the Prometheus text format.
+
+    Any keyword arguments are added as labels to every sample.
+    """
+    extra = tuple(sorted(extralabels.items()))
+    byname = {}
+    for kind, metrics in (('counter', _counters),
+                          ('gauge', _gauges),
+                          ('histogram', _histograms)):
+        for (name, labels), value in list(metrics.items()):
+            byname.setdefault((name, kind), []).append(
+                (tuple(sorted(labels + extra)), value))
+    lines = []
+    for name, kind in sorted(byname):
+        if name in _help:
+            lines.append('# HELP %s %s' % (name, _help[name]))
+        lines.append('# TYPE %s %s' % (name, kind))
+        for labels, value in sorted(byname[(name, kind)],
+                                    key=lambda item: item[0]):
+            if kind != 'histogram':
+                lines.append('%s%s %s' % (name, _labelstr(labels),
+                                          _number(value)))
+                continue
+            cumulative = 0
+            bounds = [_number(bound) for bound in value.buckets] + ['+Inf']
+            for bound, count in zip(bounds, value.counts):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (
+                    name, _labelstr(labels + (('le', bound),)), cumulative))
+            lines.append('%s_sum%s %s' % (name, _labelstr(labels),
+                                          repr(value.sum)))
+            lines.append('%s_count%s %d' % (name, _labelstr(labels),
+                                            value.count))
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_file(name):
+    """Return the path of the metrics file for this process."""
+    return os.path.join(mm_cfg.DATA_DIR,
+                        'metrics-%s-%05d.prom' % (name, os.getpid()))
+
+
+def write(path, **extralabels):
+    """Atomically write all metrics to path in the Prometheus text format."""
+    tmpfile = path + '.tmp'
+    omask = os.umask(0o002)
+    try:
+        with open(tmpfile, 'w') as fp:
+            fp.write(format(**extralabels))
+        os.rename(tmpfile, path)
+    finally:
+        os.umask(omask)
+
+
+def parse(fp):
+    """Parse the Prometheus text format written by write().
+
+    Return a list of (name, labels, value) samples, where labels is a
+    dictionary.
+    """
+    samples = []
+    for line in fp:
+        mo = samplecre.match(line)
+        if not mo or line.startswith('#'):
+            continue
+        labels = {}
+        for lmo in labelcre.finditer(mo.group('labels') or ''):
+            labels[lmo.group('label')] = re.sub(
+                r'\\(.)', lambda m: {'n': '\n'}.get(m.group(1), m.group(1)),
+                lmo.group('value'))
+        try:
+            value = float(mo.group('value'))
+        except ValueError:
+            continue
+        samples.append((mo.group('name'), labels, value))
+    return samples
@@ -167,6 +167,28 @@ class OldStyleMemberships(MemberAdaptor.MemberAdaptor):
         self.__assertIsMember(member)
         return self.__mlist.bounce_info.get(member.lower())
 
+    def getDigestRecipients(self, members):
+        mlist = self.__mlist
+        preferred = mlist.preferred_language
+        available = mlist.GetAvailableLanguages()
+        recips = {}
+        for member in members:
+            cpaddr, where = self.__get_cp_member(member)
+            if cpaddr is None:
+                continue
+            member = member.lower()
+            status = mlist.delivery_status.get(
+                member, (MemberAdaptor.ENABLED, 0))[0]
+            if status != MemberAdaptor.ENABLED:
+                continue
+            lang = mlist.language.get(member, preferred)
+            if lang not in available:
+                lang = preferred
+            options = mlist.user_options.get(member, 0)
+            key = (lang, not (options & mm_cfg.DisableMime))
+            recips.setdefault(key, []).append(cpaddr)
+        return recips
+
     #
     # Write interface
     #
@@ -22,6 +22,7 @@ import os
 import re
 import time
 import pickle
+import struct
 
 from email.iterators import typed_subpart_iterator
 from email.mime.text import MIMEText
@@ -30,6 +31,7 @@ from email.utils import parseaddr
 
 from Mailman import mm_cfg
 from Mailman import Utils
+from Mailman import Metrics
 from Mailman.MailList import MailList
 from Mailman import LockFile
 from Mailman.Errors import NotAMemberError
@@ -43,25 +45,47 @@ from Mailman.i18n import _
 
 COMMASPACE = ', '
 
+# The bounce event journal is a sequence of records, each a fixed-size header
+# followed by a payload of the length given in the header.  A message record
+# holds a pickled bounce message.  An address record holds the list name and
+# the bouncing address, and refers to its message record by number, so a
+# bounce for many recipients stores the message only once.
+EVENT_HEADER = struct.Struct('!cIHBBI')
+MESSAGE_RECORD = b'M'
+ADDRESS_RECORD = b'A'
+
+Metrics.describe('mailman_bounce_messages_total',
+                 'Bounce messages processed, by how they were handled')
+Metrics.describe('mailman_bounces_total',
+                 'Bouncing addresses queued for registration, by list')
+Metrics.describe('mailman_bounce_registration_seconds',
+                 'Time taken to register the queued bounces for a list')
+Metrics.describe('mailman_bounce_events_queued',
+                 'Bounce events waiting to be registered')
+Metrics.describe('mailman_bounce_journal_bytes',
+                 'Size of the bounce event journal')
+Metrics.describe('mailman_bounce_detector_seconds',
+                 'Time taken by each bounce detector')
+Metrics.describe('mailman_bounce_detector_hits_total',
+                 'Bounces recognized by each bounce detector')
+
 
 class BounceMixin:
     def __init__(self):
         # Registering a bounce means acquiring the list lock, and it would be
         # too expensive to do this for each message.  Instead, each bounce
-        # runner maintains an event log which is essentially a file with
-        # multiple pickles.  Each bounce we receive gets appended to this file
-        # as a 4-tuple record: (listname, addr, today, msg)
-        #
-        # today is itself a 3-tuple of (year, month, day)
+        # runner maintains an event journal.  Each bounce message we receive
+        # gets appended to this file once, followed by an address record
+        # (listname, addr, today) for each address it reports, where today
+        # is a 3-tuple of (year, month, day).  See EVENT_HEADER above for
+        # the record format.
         #
         # Every once in a while (see _doperiodic()), the bounce runner cracks
-        # open the file, reads all the records and registers all the bounces.
-        # Then it truncates the file and continues on.  We don't need to lock
-        # the bounce event file because bounce qrunners are single threaded
-        # and each creates a uniquely named file to contain the events.
-        #
-        # XXX When Python 2.3 is minimal require, we can use the new
-        # tempfile.TemporaryFile() function.
+        # open the file, reads through the records and registers all the
+        # bounces.  Then it removes the file and continues on.  We don't need
+        # to lock the bounce event file because bounce qrunners are single
+        # threaded and each creates a uniquely named file to contain the
+        # events.
         #
         # XXX We used to classify bounces to the site list as bounce events
         # for every list, but this caused severe problems.  Here's the
@@ -80,35 +104,123 @@ class BounceMixin:
         # reminder bounces can be processed when BOUNCE_PROCESS_REMINDER_BOUNCES
         # is enabled.
         self._bounce_events_file = os.path.join(
-            mm_cfg.DATA_DIR, 'bounce-events-%05d.pck' % os.getpid())
+            mm_cfg.DATA_DIR, 'bounce-events-%05d.jnl' % os.getpid())
         self._bounce_events_fp = None
         self._bouncecnt = 0
+        self._bouncemsgs = 0
+        self._unsynced = 0
+        self._nextsync = 0
         self._nextaction = time.time() + mm_cfg.REGISTER_BOUNCES_EVERY
 
-    def _queue_bounces(self, listname, addrs, msg):
-        today = time.localtime()[:3]
+    def _open_bounce_events(self):
         if self._bounce_events_fp is None:
             omask = os.umask(0o006)
             try:
                 self._bounce_events_fp = open(self._bounce_events_file, 'a+b')
             finally:
                 os.umask(omask)
-        for addr in addrs:
-            pickle.dump((listname, addr, today, msg),
-                         self._bounce_events_fp, 1)
+
+    def _write_bounce_message(self, msg):
+        # Return the number that address records use to refer to msg.
+        data = pickle.dumps(msg, 1, fix_imports=True)
+        self._bouncemsgs += 1
+        self._bounce_events_fp.write(
+            EVENT_HEADER.pack(MESSAGE_RECORD, self._bouncemsgs, 0, 0, 0,
+                              len(data)))
+        self._bounce_events_fp.write(data)
+        return self._bouncemsgs
+
+    def _write_bounce_event(self, listname, addr, day, msgnum):
+        data = ('%s\0%s' % (listname, addr)).encode('utf-8')
+        year, month, mday = day
+        self._bounce_events_fp.write(
+            EVENT_HEADER.pack(ADDRESS_RECORD, msgnum, year, month, mday,
+                              len(data)))
+        self._bounce_events_fp.write(data)
+
+    def _sync_bounce_events(self, force=False):
+        # Flushing the journal after every bounce is cheap, but an fsync for
+        # each is not, so those are done at most every
+        # BOUNCE_EVENTS_SYNC_INTERVAL seconds.
+        if self._bounce_events_fp is None:
+            return
         self._bounce_events_fp.flush()
-        os.fsync(self._bounce_events_fp.fileno())
+        now = time.time()
+        if self._unsynced and (force or now >= self._nextsync):
+            os.fsync(self._bounce_events_fp.fileno())
+            self._unsynced = 0
+            self._nextsync = now + mm_cfg.BOUNCE_EVENTS_SYNC_INTERVAL
+
+    def _read_bounce_events(self):
+        """Return the queued events grouped by list.
+
+        The result maps list names to lists of (addr, day, msgnum) tuples, in
+        the order the events were queued, and a function that returns the
+        message for a msgnum.  Messages stay in the journal and are only read
+        when they are asked for.
+        """
+        fp = self._bounce_events_fp
+        events = {}
+        offsets = {}
+        fp.seek(0)
+        while True:
+            header = fp.read(EVENT_HEADER.size)
+            if len(header) < EVENT_HEADER.size:
+                if header:
+                    syslog('bounce', 'Truncated bounce event record in %s',
+                           self._bounce_events_file)
+                break
+            kind, msgnum, year, month, mday, length = \
+                  EVENT_HEADER.unpack(header)
+            if kind == MESSAGE_RECORD:
+                offsets[msgnum] = (fp.tell(), length)
+                fp.seek(length, 1)
+            elif kind == ADDRESS_RECORD:
+                data = fp.read(length).decode('utf-8', 'replace')
+                listname, addr = data.split('\0', 1)
+                events.setdefault(listname, []).append(
+                    (addr, (year, month, mday), msgnum))
+            else:
+                syslog('bounce', 'Bad bounce event record in %s',
+                       self._bounce_events_file)
+                break
+        # Address records for one message are queued together, so
+        # remembering the last message read is enough to read each one once.
+        cache = {}
+        def getmsg(msgnum):
+            if msgnum not in cache:
+                cache.clear()
+                msg = None
+                if msgnum in offsets:
+                    offset, length = offsets[msgnum]
+                    fp.seek(offset)
+                    try:
+                        msg = pickle.loads(fp.read(length), fix_imports=True,
+                                           encoding='latin1')
+                    except (ValueError, EOFError, pickle.UnpicklingError) as e:
+                        syslog('bounce', 'Error reading bounce events: %s', e)
+                cache[msgnum] = msg
+            return cache[msgnum]
+        return events, getmsg
+
+    def _queue_bounces(self, listname, addrs, msg):
+        if not addrs:
+            return
+        today = time.localtime()[:3]
+        self._open_bounce_events()
+        msgnum = self._write_bounce_message(msg)
+        for addr in addrs:
+            self._write_bounce_event(listname, addr, today, msgnum)
         self._bouncecnt += len(addrs)
+        self._unsynced += len(addrs)
+        self._sync_bounce_events()
+        Metrics.inc('mailman_bounces_total', len(addrs), list=listname)
 
     def _queue_reminder_bounces(self, addr, msg):
         """Queue a reminder bounce for each subscribed list that sends reminders."""
         today = time.localtime()[:3]
-        if self._bounce_events_fp is None:
-            omask = os.umask(0o006)
-            try:
-                self._bounce_events_fp = open(self._bounce_events_file, 'a+b')
-            finally:
-                os.umask(omask)
+        self._open_bounce_events()
+        msgnum = None
         queued = 0
         for listname in Utils.list_names():
             if listname.lower() == mm_cfg.MAILMAN_SITE_LIST.lower():
@@ -122,49 +234,58 @@ class BounceMixin:
                 continue
             if mlist.getMemberOption(addr, mm_cfg.SuppressPasswordReminder):
                 continue
-            pickle.dump((listname, addr, today, msg), self._bounce_events_fp, 1)
+            if msgnum is None:
+                msgnum = self._write_bounce_message(msg)
+            self._write_bounce_event(listname, addr, today, msgnum)
+            Metrics.inc('mailman_bounces_total', list=listname)
             queued += 1
         if queued:
-            self._bounce_events_fp.flush()
-            os.fsync(self._bounce_events_fp.fileno())
             self._bouncecnt += queued
+            self._unsynced += queued
+            self._sync_bounce_events()
 
     def _register_bounces(self):
         syslog('bounce', '%s processing %s queued bounces',
                self, self._bouncecnt)
-        # Read all the records from the bounce file, then unlink it.  Sort the
-        # records by listname for more efficient processing.
-        events = {}
-        self._bounce_events_fp.seek(0)
-        while True:
-            try:
-                listname, addr, day, msg = pickle.load(self._bounce_events_fp, fix_imports=True, encoding='latin1')
-            except ValueError as e:
-                syslog('bounce', 'Error reading bounce events: %s', e)
-            except EOFError:
-                break
-            events.setdefault(listname, []).append((addr, day, msg))
+        # Read the address records from the bounce file, grouped by listname
+        # for more efficient processing.
+        events, getmsg = self._read_bounce_events()
         # Now register all events sorted by list
         for listname in list(events.keys()):
+            t0 = time.time()
             mlist = self._open_list(listname)
             mlist.Lock()
             try:
-                for addr, day, msg in events[listname]:
-                    mlist.registerBounce(addr, msg, day=day)
-                mlist.Save()
+                # Messages are read from the journal as they are needed.
+                mlist.registerBounces((addr, getmsg(msgnum), day)
+                                      for addr, day, msgnum
+                                      in events[listname])
             finally:
                 mlist.Unlock()
+            Metrics.observe('mailman_bounce_registration_seconds',
+                            time.time() - t0, list=listname)
         # Reset and free all the cached memory
         self._bounce_events_fp.close()
         self._bounce_events_fp = None
         os.unlink(self._bounce_events_file)
         self._bouncecnt = 0
+        self._bouncemsgs = 0
+        self._unsynced = 0
+
+    def _update_metrics(self):
+        Metrics.gauge('mailman_bounce_events_queued', self._bouncecnt)
+        try:
+            size = os.path.getsize(self._bounce_events_file)
+        except OSError:
+            size = 0
+        Metrics.gauge('mailman_bounce_journal_bytes', size)
 
     def _cleanup(self):
         if self._bouncecnt > 0:
             self._register_bounces()
 
     def _doperiodic(self):
+        self._sync_bounce_events()
         now = time.time()
         if self._nextaction > now or self._bouncecnt == 0:
             return
@@ -255,6 +376,7 @@ class BounceRunner(Runner, BounceMixin):
                              envsender=Utils.get_site_email(extra='loop'),
                              nodecorate=1,
                              )
+                Metrics.inc('mailman_bounce_messages_total', result='site')
                 return
         # Is this a possible looping message sent directly to a list-bounces
         # address other than the site list?
@@ -269,20 +391,25 @@ class BounceRunner(Runner, BounceMixin):
                          envsender=Utils.get_site_email(extra='loop'),
                          nodecorate=1,
                          )
+            Metrics.inc('mailman_bounce_messages_total', result='loop')
             return
         # List isn't doing bounce processing?
         if not process_reminder_bounce and not mlist.bounce_processing:
+            Metrics.inc('mailman_bounce_messages_total', result='ignored')
             return
         # Try VERP detection first, since it's quick and easy
         addrs = verp_bounce(mlist, msg)
         if addrs:
             # We have an address, but check if the message is non-fatal.
             if BouncerAPI.ScanMessages(mlist, msg) is BouncerAPI.Stop:
+                Metrics.inc('mailman_bounce_messages_total', result='warning')
                 return
+            result = 'verp'
         else:
             # See if this was a probe message.
             token = verp_probe(mlist, msg)
             if token:
+                Metrics.inc('mailman_bounce_messages_total', result='probe')
                 self._probe_bounce(mlist, token)
                 return
             # That didn't give us anything useful, so try the old fashion
@@ -290,7 +417,9 @@ class BounceRunner(Runner, BounceMixin):
             addrs = BouncerAPI.ScanMessages(mlist, msg)
             if addrs is BouncerAPI.Stop:
                 # This is a recognized, non-fatal notice. Ignore it.
+                Metrics.inc('mailman_bounce_messages_total', result='warning')
                 return
+            result = 'detected'
         # If that still didn't return us any useful addresses, then send it on
         # or discard it.
         addrs = [_f for _f in addrs if _f]
@@ -299,8 +428,10 @@ class BounceRunner(Runner, BounceMixin):
                    '%s: bounce message w/no discernable addresses: %s',
                    mlist.internal_name(),
                    msg.get('message-id', 'n/a'))
+            Metrics.inc('mailman_bounce_messages_total', result='unrecognized')
             maybe_forward(mlist, msg)
             return
+        Metrics.inc('mailman_bounce_messages_total', result=result)
         # BAW: It's possible that there are None's in the list of addresses,
         # although I'm unsure how that could happen.  Possibly ScanMessages()
         # can let None's sneak through.  In any event, this will kill them.
@@ -313,6 +444,7 @@ class BounceRunner(Runner, BounceMixin):
             self._queue_bounces(mlist.internal_name(), addrs, msg)
 
     _doperiodic = BounceMixin._doperiodic
+    _update_metrics = BounceMixin._update_metrics
 
     def _cleanup(self):
         BounceMixin._cleanup(self)
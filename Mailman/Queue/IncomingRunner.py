@@ -96,26 +96,43 @@
 
 import sys
 import os
+import time
 from io import StringIO
 
 from Mailman import mm_cfg
 from Mailman import Errors
 from Mailman import LockFile
+from Mailman import Metrics
 from Mailman.Queue.Runner import Runner
 from Mailman.Logging.Syslog import syslog
 
+Metrics.describe('mailman_list_lock_wait_seconds',
+                 'Time spent waiting for the list lock, by list')
+Metrics.describe('mailman_list_save_seconds',
+                 'Time taken to save the list after the pipeline, by list')
+Metrics.describe('mailman_handler_seconds',
+                 'Time taken by each handler of the incoming pipeline')
+
 
 
 class IncomingRunner(Runner):
     QDIR = mm_cfg.INQUEUE_DIR
 
     def _dispose(self, mlist, msg, msgdata):
+        timed = mm_cfg.STAGE_METRICS
+        listname = mlist.internal_name()
         # Try to get the list lock.
+        if timed:
+            start = time.time()
         try:
             mlist.Lock(timeout=mm_cfg.LIST_LOCK_TIMEOUT)
         except LockFile.TimeOutError:
             # Oh well, try again later
             return 1
+        finally:
+            if timed:
+                Metrics.observe('mailman_list_lock_wait_seconds',
+                                time.time() - start, list=listname)
         # Process the message through a handler pipeline.  The handler
         # pipeline can actually come from one of three places: the message
         # metadata, the mlist, or the global pipeline.
@@ -130,7 +147,13 @@ class IncomingRunner(Runner):
             more = self._dopipeline(mlist, msg, msgdata, pipeline)
             if not more:
                 del msgdata['pipeline']
-            mlist.Save()
+            if timed:
+                start = time.time()
+                mlist.Save()
+                Metrics.observe('mailman_list_save_seconds',
+                                time.time() - start, list=listname)
+            else:
+                mlist.Save()
             return more
         finally:
             mlist.Unlock()
@@ -177,13 +200,21 @@ class IncomingRunner(Runner):
         return pipeline[:]
 
     def _dopipeline(self, mlist, msg, msgdata, pipeline):
+        timed = mm_cfg.STAGE_METRICS
         while pipeline:
             handler = pipeline.pop(0)
             modname = 'Mailman.Handlers.' + handler
             __import__(modname)
+            if timed:
+                start = time.time()
             try:
                 pid = os.getpid()
-                sys.modules[modname].process(mlist, msg, msgdata)
+                try:
+                    sys.modules[modname].process(mlist, msg, msgdata)
+                finally:
+                    if timed:
+                        Metrics.observe('mailman_handler_seconds',
+                                        time.time() - start, handler=handler)
                 # Failsafe -- a child may have leaked through.
                 if pid != os.getpid():
                     syslog('error', 'child process leaked thru: %s', modname)
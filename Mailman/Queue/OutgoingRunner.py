@@ -29,6 +29,7 @@ from Mailman import mm_cfg
 from Mailman import Message
 from Mailman import Errors
 from Mailman import LockFile
+from Mailman import Metrics
 from Mailman.Queue.Runner import Runner
 from Mailman.Queue.Switchboard import Switchboard
 from Mailman.Queue.BounceRunner import BounceMixin
@@ -38,6 +39,12 @@ from Mailman.Logging.Syslog import syslog
 # permanent failures.  It is a count of calls to _doperiodic()
 DEAL_WITH_PERMFAILURES_EVERY = 10
 
+Metrics.describe('mailman_smtp_seconds',
+                 'Time taken to hand a message to the MTA, by list')
+Metrics.describe('mailman_delivery_latency_seconds',
+                 'Time from a message first being queued to its delivery',
+                 Metrics.LATENCY_BUCKETS)
+
 
 class OutgoingRunner(Runner, BounceMixin):
     QDIR = mm_cfg.OUTQUEUE_DIR
@@ -62,14 +69,27 @@ class OutgoingRunner(Runner, BounceMixin):
             return True
         # Make sure we have the most up-to-date state
         mlist.Load()
+        timed = mm_cfg.STAGE_METRICS
         try:
             pid = os.getpid()
-            self._func(mlist, msg, msgdata)
+            if timed:
+                start = time.time()
+                try:
+                    self._func(mlist, msg, msgdata)
+                finally:
+                    now = time.time()
+                    Metrics.observe('mailman_smtp_seconds', now - start,
+                                    list=mlist.internal_name())
+            else:
+                self._func(mlist, msg, msgdata)
             # Failsafe -- a child may have leaked through.
             if pid != os.getpid():
                 syslog('error', 'child process leaked thru: %s', modname)
                 os._exit(1)
             self.__logged = False
+            if timed and 'received_time' in msgdata:
+                Metrics.observe('mailman_delivery_latency_seconds',
+                                now - msgdata['received_time'])
         except socket.error:
             # There was a problem connecting to the SMTP server.  Log this
             # once, but crank up our sleep time so we don't fill the error
@@ -129,6 +149,7 @@ class OutgoingRunner(Runner, BounceMixin):
         return False
 
     _doperiodic = BounceMixin._doperiodic
+    _update_metrics = BounceMixin._update_metrics
 
     def _cleanup(self):
         BounceMixin._cleanup(self)
@@ -19,6 +19,7 @@
 """
 
 from builtins import object
+import os
 import time
 import traceback
 from io import StringIO
@@ -30,6 +31,7 @@ syslog('debug', 'Runner.py: mm_cfg imported from %s', mm_cfg.__file__)
 syslog('debug', 'Runner.py: mm_cfg.GLOBAL_PIPELINE type: %s', type(mm_cfg.GLOBAL_PIPELINE).__name__ if hasattr(mm_cfg, 'GLOBAL_PIPELINE') else 'NOT FOUND')
 from Mailman import Utils
 from Mailman import Errors
+from Mailman import Metrics
 from Mailman import MailList
 from Mailman import i18n
 
@@ -39,6 +41,12 @@ from Mailman.Queue.Switchboard import Switchboard
 
 import email.errors
 
+Metrics.describe('mailman_queue_wait_seconds',
+                 'Time messages spent waiting in each queue',
+                 Metrics.LATENCY_BUCKETS)
+Metrics.describe('mailman_runner_seconds',
+                 'Time taken by each qrunner to process a message')
+
 
 class Runner:
     QDIR = None
@@ -53,6 +61,12 @@ class Runner:
         # Create the shunt switchboard
         self._shunt = Switchboard(mm_cfg.SHUNTQUEUE_DIR)
         self._stop = False
+        self._metrics_file = Metrics.metrics_file(self.__class__.__name__)
+        self._nextmetrics = 0
+        if mm_cfg.TEMPLATE_CACHE_SIZE > 0:
+            Utils.warm_templates()
+        if mm_cfg.PRELOAD_TRANSLATIONS:
+            i18n.preload_languages()
 
     def __repr__(self):
         return '<%s at %s>' % (self.__class__.__name__, id(self))
@@ -75,9 +89,12 @@ class Runner:
                     # shouldn't be called here.  There should be one more
                     # _doperiodic() call at the end of the _oneloop() loop.
                     self._doperiodic()
+                    self._check_metrics()
                     # If the stop flag is set, we're done.
                     if self._stop:
                         break
+                    # Don't leave log lines buffered while we're idle.
+                    syslog.flush()
                     # Give the runner an opportunity to snooze for a while,
                     # but pass it the file count so it can decide whether to
                     # do more work now or not.
@@ -118,6 +135,14 @@ class Runner:
                     preserve = False
                 self._switchboard.finish(filebase, preserve=preserve)
                 continue
+            timed = mm_cfg.STAGE_METRICS
+            if timed:
+                start = time.time()
+                hops = msgdata.get('hops')
+                if hops:
+                    queue, when = hops[-1]
+                    Metrics.observe('mailman_queue_wait_seconds',
+                                    start - when, queue=queue)
             try:
                 self._onefile(msg, msgdata)
                 self._switchboard.finish(filebase)
@@ -147,9 +172,14 @@ class Runner:
                            'SHUNTING FAILED, preserving original entry: %s',
                            filebase)
                     self._switchboard.finish(filebase, preserve=True)
+            if timed:
+                Metrics.observe('mailman_runner_seconds', time.time() - start,
+                                runner=self.__class__.__name__)
             # Other work we want to do each time through the loop
+            syslog.flush_if_due()
             Utils.reap(self._kids, once=True)
             self._doperiodic()
+            self._check_metrics()
             if self._shortcircuit():
                 break
         return len(files)
@@ -220,6 +250,23 @@ class Runner:
         traceback.print_exc(file=s)
         syslog('error', s.getvalue())
 
+    def _check_metrics(self):
+        if not mm_cfg.METRICS_INTERVAL:
+            return
+        now = time.time()
+        if self._nextmetrics <= now:
+            self._nextmetrics = now + mm_cfg.METRICS_INTERVAL
+            self._write_metrics()
+
+    def _write_metrics(self):
+        self._update_metrics()
+        try:
+            Metrics.write(self._metrics_file,
+                          runner=self.__class__.__name__, pid=os.getpid())
+        except (IOError, OSError) as e:
+            syslog('error', 'Cannot write metrics file %s: %s',
+                   self._metrics_file, e)
+
     #
     # Subclasses can override these methods.
     #
@@ -230,6 +277,11 @@ class Runner:
         any necessary resource deallocation.  Its return value is irrelevant.
         """
         Utils.reap(self._kids)
+        # The metrics file only describes running processes.
+        try:
+            os.unlink(self._metrics_file)
+        except OSError:
+            pass
 
     def _dispose(self, mlist, msg, msgdata):
         """Dispose of a single message destined for a mailing list.
@@ -246,6 +298,14 @@ class Runner:
         """
         raise NotImplementedError
 
+    def _update_metrics(self):
+        """Update the gauges before the metrics file is written.
+
+        Called every METRICS_INTERVAL seconds, just before the Runner writes
+        its metrics file.  Its return value is irrelevant.
+        """
+        pass
+
     def _doperiodic(self):
         """Do some processing `every once in a while'.
 
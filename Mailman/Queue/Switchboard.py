@@ -62,6 +62,10 @@ DELTA = .0001
 # value, we move the file to the shunt queue as a .psv.
 MAX_BAK_COUNT = 3
 
+# The metadata keeps the times a message entered its last this many queues,
+# so a message retried for days doesn't grow without bound.
+MAXHOPS = 20
+
 
 
 class Switchboard:
@@ -143,6 +147,11 @@ class Switchboard:
         # this system) and the sha hex digest.
         #rcvtime = data.setdefault('received_time', now)
         rcvtime = data.setdefault('received_time', now)
+        if mm_cfg.STAGE_METRICS:
+            # Record when the message entered this queue, for the runner to
+            # tell how long it waited.
+            hops = data.get('hops', [])[-(MAXHOPS - 1):]
+            data['hops'] = hops + [(os.path.basename(self.__whichq), now)]
         filebase = repr(rcvtime) + '+' + sha_new(hashfood).hexdigest()
         filename = os.path.join(self.__whichq, filebase + '.pck')
         tmpfile = filename + '.tmp'
@@ -253,6 +262,48 @@ class Switchboard:
         keys.sort()
         return [times[k] for k in keys]
 
+    def stats(self, numslices=None, now=None):
+        """Return the ages of the entries in this queue, by slice and kind.
+
+        Only the file names are looked at, so the ages are measured from the
+        time each message was first received, as encoded in its file name.
+        Entries are assigned to numslices slices (by default this
+        switchboard's) the way the runners' switchboards do.  Returns a
+        dictionary mapping (slice, extension) to a sorted list of ages in
+        seconds, where the extension is e.g. '.pck' for waiting entries and
+        '.bak' for those being processed.
+        """
+        if numslices is None:
+            numslices = self.__numslices
+        if now is None:
+            now = time.time()
+        ages = {}
+        try:
+            names = os.listdir(self.__whichq)
+        except OSError as e:
+            if e.errno != errno.ENOENT: raise
+            names = []
+        for f in names:
+            filebase, ext = os.path.splitext(f)
+            if ext == '.tmp':
+                continue
+            try:
+                when, digest = filebase.split('+')
+                when = float(when)
+                digest = int(digest, 16)
+            except ValueError:
+                continue
+            if numslices == 1:
+                slice = 0
+            elif self.__distribution == 'round_robin':
+                slice = digest % numslices
+            else:
+                slice = digest * numslices // (shamax + 1)
+            ages.setdefault((slice, ext), []).append(now - when)
+        for values in ages.values():
+            values.sort()
+        return ages
+
     def recover_backup_files(self):
         # Move all .bak files in our slice to .pck.  It's impossible for both
         # to exist at the same time, so the move is enough to ensure that our
@@ -295,3 +346,11 @@ class Switchboard:
                         os.rename(src, dst)
             finally:
                 fp.close()
+
+
+
+def percentile(ages, p):
+    """Return the p-th percentile of a sorted list of ages, or None."""
+    if not ages:
+        return None
+    return ages[min(len(ages) - 1, int(len(ages) * p / 100.0))]
@@ -0,0 +1,110 @@
+# Copyright (C) 2026 by the Free Software Foundation, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+
+"""Site-wide sliding window event counts, shared by all processes.
+
+Each event is recorded under a key, e.g. one naming a sender and a list, along
+with the time it drops out of the window.  hit() records an event and returns
+how many events for the key are still within their window, so the same store
+serves per-sender, per-list and site-wide posting limits:
+
+    RateStore.hit('verbose %s %s' % (listname, sender), 300)
+
+The events live in an SQLite database in DATA_DIR, so all the qrunner slices
+see each other's events.  Expired events of a key are deleted when the key is
+hit, and each process deletes those of idle keys every VERBOSE_CLEAN_LIMIT
+hits.  Database errors are logged and counted as no events.
+"""
+
+import time
+import sqlite3
+
+from Mailman import mm_cfg
+from Mailman.SQLiteStore import SQLiteStore
+from Mailman.Logging.Syslog import syslog
+
+STOREFILE = 'rates.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    key TEXT NOT NULL,
+    expires REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS events_by_key ON events (key, expires);
+CREATE INDEX IF NOT EXISTS events_by_expiry ON events (expires);
+"""
+
+_store = SQLiteStore(STOREFILE, SCHEMA)
+_hits = 0
+
+
+
+def store_path():
+    return _store.path()
+
+
+def _connect():
+    return _store.connect()
+
+
+def close():
+    _store.close()
+
+
+def hit(key, window, now=None):
+    """Record an event for key and return the events in the window.
+
+    The event counts for window seconds.  The returned count includes it.
+    """
+    global _hits
+    if now is None:
+        now = time.time()
+    try:
+        conn = _connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM events WHERE key = ? AND expires <= ?',
+                         (key, now))
+            conn.execute('INSERT INTO events (key, expires) VALUES (?, ?)',
+                         (key, now + float(window)))
+            count = conn.execute(
+                'SELECT COUNT(*) FROM events WHERE key = ?',
+                (key,)).fetchone()[0]
+            _hits += 1
+            if _hits >= mm_cfg.VERBOSE_CLEAN_LIMIT:
+                _hits = 0
+                conn.execute('DELETE FROM events WHERE expires <= ?', (now,))
+        except:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+    except sqlite3.Error as e:
+        syslog('error', 'Cannot update rate store for %s: %s', key, e)
+        return 0
+    return count
+
+
+def count(key, now=None):
+    """Return the events for key that are still within their window."""
+    if now is None:
+        now = time.time()
+    try:
+        return _connect().execute(
+            'SELECT COUNT(*) FROM events WHERE key = ? AND expires > ?',
+            (key, now)).fetchone()[0]
+    except sqlite3.Error as e:
+        syslog('error', 'Cannot read rate store for %s: %s', key, e)
+        return 0
@@ -0,0 +1,73 @@
+# Copyright (C) 2026 by the Free Software Foundation, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+
+"""Per-process connections to the site-wide SQLite databases in DATA_DIR.
+
+BounceIndex, RateStore and DMARCCache each keep a small database that all the
+qrunners and cron scripts share.  Each of them opens it through an SQLiteStore:
+
+    _store = SQLiteStore('rates.db', SCHEMA)
+    _store.connect().execute(...)
+
+The connection is opened on first use and reused for the life of the process.
+A forked child opens its own, since an SQLite connection must not be used on
+both sides of a fork().
+"""
+
+import os
+import sqlite3
+
+from Mailman import mm_cfg
+
+
+
+class SQLiteStore(object):
+    def __init__(self, filename, schema):
+        self.filename = filename
+        self.schema = schema
+        self._conn = None
+        self._pid = None
+
+    def path(self):
+        return os.path.join(mm_cfg.DATA_DIR, self.filename)
+
+    def connect(self):
+        """Return this process's connection, opening it if need be.
+
+        The connection is in autocommit mode, so each statement is committed
+        on its own unless the caller issues BEGIN.  The database uses write-
+        ahead logging, so readers don't block the writer or each other.
+        """
+        if self._conn is None or self._pid != os.getpid():
+            omask = os.umask(0o007)
+            try:
+                conn = sqlite3.connect(self.path(), timeout=30,
+                                       isolation_level=None)
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+                conn.executescript(self.schema)
+            finally:
+                os.umask(omask)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def close(self):
+        # Leave a connection inherited from the parent process alone.
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
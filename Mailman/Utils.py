@@ -30,6 +30,7 @@ import re
 import time
 import errno
 import base64
+import marshal
 import random
 import urllib
 import urllib.request, urllib.error
@@ -275,6 +276,8 @@ class FieldStorage:
 from Mailman import mm_cfg
 from Mailman import Errors
 from Mailman import Site
+from Mailman import RateStore
+from Mailman import DMARCCache
 from Mailman.SafeDict import SafeDict
 from Mailman.Logging.Syslog import syslog
 
@@ -686,6 +689,55 @@ def List2Dict(L, foldcase=False):
     return d
 
 
+
+# Patterns using any of these can't be searched for as part of a combined
+# regexp: group references would refer to the wrong groups, named groups could
+# clash, and global flags must be at the start of the whole regexp.
+_unmergeablecre = re.compile(r'\\[1-9]|\(\?P[=<]|\(\?\(|\(\?[aiLmsux]+\)')
+
+
+class PatternSet(object):
+    """A sequence of regexps, searched for in a single pass where possible."""
+
+    def __init__(self, compiled, flags):
+        self.patterns = compiled
+        self._others = []
+        merged = []
+        for pattern, cre in compiled:
+            if _unmergeablecre.search(pattern):
+                self._others.append(cre)
+            else:
+                merged.append(pattern)
+        self._combined = None
+        if len(merged) > 1:
+            try:
+                self._combined = re.compile(
+                    '|'.join(['(?:%s)' % pattern for pattern in merged]),
+                    flags)
+            except re.error:
+                pass
+        if self._combined is None:
+            self._others = [cre for pattern, cre in compiled]
+
+    def matches(self, text):
+        """Return whether any of the patterns matches text."""
+        if self._combined is not None and self._combined.search(text):
+            return True
+        for cre in self._others:
+            if cre.search(text):
+                return True
+        return False
+
+    def first(self, text):
+        """Return the first pattern, in order, that matches text, or None."""
+        if not self.matches(text):
+            return None
+        for pattern, cre in self.patterns:
+            if cre.search(text):
+                return pattern
+        return None
+
+
 
 _vowels = ('a', 'e', 'i', 'o', 'u')
 _consonants = ('b', 'c', 'd', 'f', 'g', 'h', 'k', 'm', 'n',
@@ -1011,9 +1063,6 @@ def UnobscureEmail(addr):
 
 
 
-class OuterExit(Exception):
-    pass
-
 def findtext(templatefile, dict=None, raw=False, lang=None, mlist=None):
     # Make some text from a template file.  The order of searches depends on
     # whether mlist and lang are provided.  Once the templatefile is found,
@@ -1080,36 +1129,92 @@ def findtext(templatefile, dict=None, raw=False, lang=None, mlist=None):
     searchdirs.append(os.path.join(mm_cfg.TEMPLATE_DIR, 'site'))
     searchdirs.append(mm_cfg.TEMPLATE_DIR)
     # Start scanning
-    fp = None
-    try:
-        for lang in languages:
-            for dir in searchdirs:
-                filename = os.path.join(dir, lang, templatefile)
-                try:
-                    fp = open(filename)
-                    raise OuterExit
-                except IOError as e:
-                    if e.errno != errno.ENOENT: raise
-                    # Okay, it doesn't exist, keep looping
-                    fp = None
-    except OuterExit:
-        pass
-    if fp is None:
-        # Try one last time with the distro English template, which, unless
-        # you've got a really broken installation, must be there.
+    filename = _find_template(templatefile, languages, searchdirs)
+    template = _read_template(filename)
+    text = template
+    if dict is not None:
         try:
-            filename = os.path.join(mm_cfg.TEMPLATE_DIR, 'en', templatefile)
-            fp = open(filename)
-        except IOError as e:
-            if e.errno != errno.ENOENT: raise
-            # We never found the template.  BAD!
-            raise IOError(errno.ENOENT, 'No template file found', templatefile)
+            sdict = SafeDict(dict)
+            try:
+                text = sdict.interpolate(template)
+            except UnicodeError:
+                # Try again after coercing the template to unicode
+                utemplate = str(template, GetCharSet(lang), 'replace')
+                text = sdict.interpolate(utemplate)
+        except (TypeError, ValueError) as e:
+            # The template is really screwed up
+            syslog('error', 'broken template: %s\n%s', filename, e)
+            pass
+    if raw:
+        return text, filename
+    return wrap(text), filename
+
+
+def maketext(templatefile, dict=None, raw=False, lang=None, mlist=None):
+    return findtext(templatefile, dict, raw, lang, mlist)[0]
+
+
+# findtext() caches where it found each template, as a mapping from
+# (templatefile, languages, search directories) to the path and the stamps of
+# the directories searched up to it.  The lookup is repeated when any of them
+# changes, e.g. when a list specific template is added.  The texts read are
+# cached by path until the file changes.
+_template_paths = {}
+_template_texts = {}
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+def _find_template(templatefile, languages, searchdirs):
+    key = (templatefile, tuple(languages), tuple(searchdirs))
+    cached = _template_paths.get(key)
+    if cached is not None:
+        filename, stamps = cached
+        for path, stamp in stamps:
+            if _stamp(path) != stamp:
+                break
+        else:
+            return filename
+    # The last resort is the distro English template, which, unless you've
+    # got a really broken installation, must be there.
+    candidates = [os.path.join(dir, lang, templatefile)
+                  for lang in languages for dir in searchdirs]
+    candidates.append(os.path.join(mm_cfg.TEMPLATE_DIR, 'en', templatefile))
+    stamps = []
+    seen = set()
+    for filename in candidates:
+        dirname = os.path.dirname(filename)
+        if dirname in seen:
+            continue
+        seen.add(dirname)
+        stamp = _stamp(dirname)
+        stamps.append((dirname, stamp))
+        if stamp is not None and os.path.exists(filename):
+            break
+    else:
+        # We never found the template.  BAD!
+        raise IOError(errno.ENOENT, 'No template file found', templatefile)
+    if mm_cfg.TEMPLATE_CACHE_SIZE > 0:
+        if len(_template_paths) >= mm_cfg.TEMPLATE_CACHE_SIZE:
+            _template_paths.clear()
+        _template_paths[key] = (filename, stamps)
+    return filename
+
+def _read_template(filename):
+    stamp = _stamp(filename)
+    cached = _template_texts.get(filename)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    fp = open(filename)
     try:
         template = fp.read()
     except UnicodeDecodeError as e:
         # failed to read the template as utf-8, so lets determine the current encoding
         # then save the file back to disk as utf-8.
-        filename = fp.name
         fp.close()
 
         current_encoding = get_current_encoding(filename)
@@ -1123,33 +1228,37 @@ def findtext(templatefile, dict=None, raw=False, lang=None, mlist=None):
             f.write(decoded_template)
 
         template = decoded_template
+        stamp = _stamp(filename)
     except Exception as e:
         # catch any other non-unicode exceptions...
         syslog('error', 'Failed to read template %s: %s', fp.name, e)
     finally:
         fp.close()
-
-    text = template
-    if dict is not None:
+    if mm_cfg.TEMPLATE_CACHE_SIZE > 0:
+        if len(_template_texts) >= mm_cfg.TEMPLATE_CACHE_SIZE:
+            _template_texts.clear()
+        _template_texts[filename] = (stamp, template)
+    return template
+
+def warm_templates(lang=None):
+    """Read the site's templates in lang, by default the server's language,
+    into the template cache."""
+    if lang is None:
+        lang = mm_cfg.DEFAULT_SERVER_LANGUAGE
+    for dir in (os.path.join(mm_cfg.TEMPLATE_DIR, 'site', lang),
+                os.path.join(mm_cfg.TEMPLATE_DIR, lang)):
         try:
-            sdict = SafeDict(dict)
+            names = os.listdir(dir)
+        except OSError:
+            continue
+        for name in names:
+            filename = os.path.join(dir, name)
+            if not os.path.isfile(filename):
+                continue
             try:
-                text = sdict.interpolate(template)
-            except UnicodeError:
-                # Try again after coercing the template to unicode
-                utemplate = str(template, GetCharSet(lang), 'replace')
-                text = sdict.interpolate(utemplate)
-        except (TypeError, ValueError) as e:
-            # The template is really screwed up
-            syslog('error', 'broken template: %s\n%s', filename, e)
-            pass
-    if raw:
-        return text, filename
-    return wrap(text), filename
-
-
-def maketext(templatefile, dict=None, raw=False, lang=None, mlist=None):
-    return findtext(templatefile, dict, raw, lang, mlist)[0]
+                _read_template(filename)
+            except (IOError, OSError, UnicodeError) as e:
+                syslog('error', 'Failed to read template %s: %s', filename, e)
 
 
 
@@ -1710,24 +1819,23 @@ def suspiciousHTML(html):
 # algorithm at https://publicsuffix.org/list/ to find the "Organizational
 # Domain corresponding to a From: domain.
 
-s_dict = {}
-
-def get_suffixes(url):
-    """This loads and parses the data from the url argument into s_dict for
-    use by get_org_dom."""
-    global s_dict
-    if s_dict:
-        return
-    if not url:
-        return
-    try:
-        d = safe_urlopen(url)
-    except (urllib.error.URLError, ValueError) as e:
-        syslog('error',
-               'Unable to retrieve data from %s: %s',
-               url, e)
-        return
-    for line in d.readlines():
+# The rules are kept in a trie of their labels, from the right.  Each node is
+# a dict mapping labels (or '*') to child nodes, and a node ending a rule maps
+# PSL_RULE to True for an exception rule, False otherwise.  cron/update_psl
+# compiles the list into PSL_FILE in DATA_DIR, from which it is loaded; the
+# URL is only used when that file is missing.
+PSL_RULE = None
+PSL_FILE = 'public_suffix_list.marshal'
+# After failing to retrieve the list, wait this long before trying again.
+PSL_RETRY_INTERVAL = 60 * 60
+s_trie = {}
+_psl_mtime = None
+_psl_failed = None
+
+def parse_suffixes(lines):
+    """Parse the lines of the public suffix list into a trie."""
+    trie = {}
+    for line in lines:
         if not line:
             continue
         if isinstance(line, bytes):
@@ -1744,8 +1852,72 @@ def get_suffixes(url):
         else:
             exc = False
         parts.reverse()
-        k = '.'.join(parts)
-        s_dict[k] = exc
+        node = trie
+        for label in parts:
+            node = node.setdefault(label, {})
+        node[PSL_RULE] = exc
+    return trie
+
+def save_suffixes(trie):
+    """Atomically write trie to the compiled list in DATA_DIR."""
+    path = os.path.join(mm_cfg.DATA_DIR, PSL_FILE)
+    tmpfile = '%s.tmp.%d' % (path, os.getpid())
+    omask = os.umask(0o002)
+    try:
+        with open(tmpfile, 'wb') as fp:
+            marshal.dump(trie, fp)
+        os.rename(tmpfile, path)
+    finally:
+        os.umask(omask)
+
+def load_suffixes():
+    """Load the compiled list from DATA_DIR into s_trie if it has changed
+    since it was last loaded.  Return false if there is no usable list."""
+    global s_trie, _psl_mtime
+    path = os.path.join(mm_cfg.DATA_DIR, PSL_FILE)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return False
+    if mtime == _psl_mtime:
+        return bool(s_trie)
+    # Don't try again until the file changes.
+    _psl_mtime = mtime
+    try:
+        with open(path, 'rb') as fp:
+            trie = marshal.load(fp)
+    except (IOError, EOFError, ValueError, TypeError) as e:
+        syslog('error', 'Unable to load %s: %s', path, e)
+        return False
+    s_trie = trie
+    return bool(s_trie)
+
+def get_suffixes(url):
+    """This loads the compiled public suffix list into s_trie for use by
+    get_org_dom, or failing that, retrieves and parses the data from the url
+    argument."""
+    global s_trie, _psl_failed
+    if load_suffixes() or s_trie:
+        return
+    if not url:
+        return
+    if (_psl_failed is not None and
+            time.time() < _psl_failed + PSL_RETRY_INTERVAL):
+        return
+    try:
+        d = safe_urlopen(url)
+    except (urllib.error.URLError, ValueError) as e:
+        syslog('error',
+               'Unable to retrieve data from %s: %s',
+               url, e)
+        _psl_failed = time.time()
+        return
+    s_trie = parse_suffixes(d.readlines())
+    # Save the other processes from fetching it too.
+    try:
+        save_suffixes(s_trie)
+    except (IOError, OSError) as e:
+        syslog('error', 'Unable to save the public suffix list: %s', e)
 
 def _get_dom(d, l):
     """A helper to get a domain name consisting of the first l+1 labels
@@ -1757,31 +1929,33 @@ def _get_dom(d, l):
 def get_org_dom(domain):
     """Given a domain name, this returns the corresponding Organizational
     Domain which may be the same as the input."""
-    global s_dict
-    if not s_dict:
-        get_suffixes(mm_cfg.DMARC_ORGANIZATIONAL_DOMAIN_DATA_URL)
-    hits = []
+    get_suffixes(mm_cfg.DMARC_ORGANIZATIONAL_DOMAIN_DATA_URL)
     d = domain.lower().split('.')
     d.reverse()
-    for k in list(s_dict.keys()):
-        ks = k.split('.')
-        if len(d) >= len(ks):
-            for i in range(len(ks)-1):
-                if d[i] != ks[i] and ks[i] != '*':
-                    break
-            else:
-                if d[len(ks)-1] == ks[-1] or ks[-1] == '*':
-                    hits.append(k)
-    if not hits:
+    # Walk down the trie a label at a time, following both the label and any
+    # wildcard, and note the longest rule and longest exception matched.
+    longest = exception = 0
+    nodes = [s_trie]
+    for depth, label in enumerate(d):
+        matched = []
+        for node in nodes:
+            for key in set((label, '*')):
+                child = node.get(key)
+                if child is None:
+                    continue
+                matched.append(child)
+                if child.get(PSL_RULE):
+                    exception = depth + 1
+                elif PSL_RULE in child:
+                    longest = depth + 1
+        if not matched:
+            break
+        nodes = matched
+    if exception:
+        return _get_dom(d, exception - 1)
+    if not longest:
         return _get_dom(d, 1)
-    l = 0
-    for k in hits:
-        if s_dict[k]:
-            # It's an exception
-            return _get_dom(d, len(k.split('.'))-1)
-        if len(k.split('.')) > l:
-            l = len(k.split('.'))
-    return _get_dom(d, l)
+    return _get_dom(d, longest)
 
 
 # This takes an email address, and returns True if DMARC policy is p=reject
@@ -1810,15 +1984,87 @@ def IsDMARCProhibited(mlist, email):
             return x
     return False
 
+_resolver = None
+
+def _dmarc_records(dmarc_domain):
+    """Return the TXT records of dmarc_domain as a list of (name, strings)
+    pairs, or None if it has none.  Lookups are cached site-wide in
+    DMARCCache for the records' TTL.  DNS errors are raised."""
+    global _resolver
+    hit, records = DMARCCache.get(dmarc_domain)
+    if hit:
+        return records
+    if _resolver is None:
+        _resolver = dns.resolver.Resolver()
+        _resolver.timeout = float(mm_cfg.DMARC_RESOLVER_TIMEOUT)
+        _resolver.lifetime = float(mm_cfg.DMARC_RESOLVER_LIFETIME)
+    try:
+        txt_recs = _resolver.query(dmarc_domain, dns.rdatatype.TXT)
+    except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer) as e:
+        DMARCCache.put(dmarc_domain, None,
+                       min(_negative_ttl(e), mm_cfg.DMARC_CACHE_MAX_TTL))
+        return None
+    # Be as robust as possible in parsing the result.
+    results_by_name = {}
+    cnames = {}
+    want_names = set([dmarc_domain + '.'])
+    for txt_rec in txt_recs.response.answer:
+        if not isinstance(txt_rec.items, list):
+            continue
+        if not txt_rec.items[0]:
+            continue
+        # Don't be fooled by an answer with uppercase in the name.
+        name = txt_rec.name.to_text().lower()
+        if txt_rec.rdtype == dns.rdatatype.CNAME:
+            cnames[name] = (
+                txt_rec.items[0].target.to_text())
+        if txt_rec.rdtype != dns.rdatatype.TXT:
+            continue
+        results_by_name.setdefault(name, []).append(
+            "".join( [ record.decode() if isinstance(record, bytes) else record for record in txt_rec.items[0].strings ] ))
+    expands = list(want_names)
+    seen = set(expands)
+    while expands:
+        item = expands.pop(0)
+        if item in cnames:
+            if cnames[item] in seen:
+                continue # cname loop
+            expands.append(cnames[item])
+            seen.add(cnames[item])
+            want_names.add(cnames[item])
+            want_names.discard(item)
+
+    if len(want_names) != 1:
+        syslog('error',
+               """multiple DMARC entries in results for %s,
+               processing each to be strict""",
+               dmarc_domain)
+    records = [(name, results_by_name[name]) for name in sorted(want_names)
+               if name in results_by_name]
+    DMARCCache.put(dmarc_domain, records,
+                   min(txt_recs.expiration - time.time(),
+                       mm_cfg.DMARC_CACHE_MAX_TTL))
+    return records
+
+def _negative_ttl(e):
+    """Return how long to cache the absence of records, from the SOA record
+    in the NXDOMAIN or NoAnswer response (RFC 2308)."""
+    if isinstance(e, dns.resolver.NXDOMAIN):
+        responses = list(e.kwargs.get('responses', {}).values())
+    else:
+        responses = [e.kwargs.get('response')]
+    for response in responses:
+        if response is None:
+            continue
+        for rrset in response.authority:
+            if rrset.rdtype == dns.rdatatype.SOA and len(rrset):
+                return min(rrset.ttl, rrset[0].minimum)
+    return mm_cfg.DMARC_NEGATIVE_CACHE_TTL
+
 def _DMARCProhibited(mlist, email, dmarc_domain, org=False):
 
     try:
-        resolver = dns.resolver.Resolver()
-        resolver.timeout = float(mm_cfg.DMARC_RESOLVER_TIMEOUT)
-        resolver.lifetime = float(mm_cfg.DMARC_RESOLVER_LIFETIME)
-        txt_recs = resolver.query(dmarc_domain, dns.rdatatype.TXT)
-    except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
-        return 'continue'
+        records = _dmarc_records(dmarc_domain)
     except (dns.resolver.NoNameservers):
         syslog('error',
                'DNSException: No Nameservers available for %s (%s)',
@@ -1836,46 +2082,11 @@ def _DMARCProhibited(mlist, email, dmarc_domain, org=False):
         # a DMARC policy record that we missed and that a receiver of the mail
         # might see.  Thus, we should err on the side of caution and mitigate.
         return True
+    if records is None:
+        return 'continue'
     else:
-        # Be as robust as possible in parsing the result.
-        results_by_name = {}
-        cnames = {}
-        want_names = set([dmarc_domain + '.'])
-        for txt_rec in txt_recs.response.answer:
-            if not isinstance(txt_rec.items, list):
-                continue
-            if not txt_rec.items[0]:
-                continue
-            # Don't be fooled by an answer with uppercase in the name.
-            name = txt_rec.name.to_text().lower()
-            if txt_rec.rdtype == dns.rdatatype.CNAME:
-                cnames[name] = (
-                    txt_rec.items[0].target.to_text())
-            if txt_rec.rdtype != dns.rdatatype.TXT:
-                continue
-            results_by_name.setdefault(name, []).append(
-                "".join( [ record.decode() if isinstance(record, bytes) else record for record in txt_rec.items[0].strings ] ))
-        expands = list(want_names)
-        seen = set(expands)
-        while expands:
-            item = expands.pop(0)
-            if item in cnames:
-                if cnames[item] in seen:
-                    continue # cname loop
-                expands.append(cnames[item])
-                seen.add(cnames[item])
-                want_names.add(cnames[item])
-                want_names.discard(item)
-
-        if len(want_names) != 1:
-            syslog('error',
-                   """multiple DMARC entries in results for %s,
-                   processing each to be strict""",
-                   dmarc_domain)
-        for name in want_names:
-            if name not in results_by_name:
-                continue
-            dmarcs = [n for n in results_by_name[name] if n.startswith('v=DMARC1;')]
+        for name, results in records:
+            dmarcs = [n for n in results if n.startswith('v=DMARC1;')]
             if len(dmarcs) == 0:
                 return 'continue'
             if len(dmarcs) > 1:
@@ -1920,50 +2131,23 @@ def _DMARCProhibited(mlist, email, dmarc_domain, org=False):
 
 
 # Check a known list in order to auto-moderate verbose members
-# dictionary to remember recent posts.
-recentMemberPostings = {}
-# counter of times through
-clean_count = 0
 def IsVerboseMember(mlist, email):
     """For lists that request it, we keep track of recent posts by address.
 A message from an address to a list, if the list requests it, is remembered
 for a specified time whether or not the address is a list member, and if the
 address is a member and the member is over the threshold for the list, that
-fact is returned."""
-
-    global clean_count
+fact is returned.  The posts are counted in the site-wide RateStore, so all
+the IncomingRunner slices see them."""
 
     if mlist.member_verbosity_threshold == 0:
         return False
 
     email = email.lower()
-
-    now = time.time()
-    recentMemberPostings.setdefault(email,[]).append(now +
-                                       float(mlist.member_verbosity_interval)
-                                   )
-    x = list(range(len(recentMemberPostings[email])))
-    x.reverse()
-    for i in x:
-        if recentMemberPostings[email][i] < now:
-            del recentMemberPostings[email][i]
-
-    clean_count += 1
-    if clean_count >= mm_cfg.VERBOSE_CLEAN_LIMIT:
-        clean_count = 0
-        for addr in list(recentMemberPostings.keys()):
-            x = list(range(len(recentMemberPostings[addr])))
-            x.reverse()
-            for i in x:
-                if recentMemberPostings[addr][i] < now:
-                    del recentMemberPostings[addr][i]
-            if not recentMemberPostings[addr]:
-                del recentMemberPostings[addr]
+    count = RateStore.hit('verbose %s %s' % (mlist.internal_name(), email),
+                          mlist.member_verbosity_interval)
     if not mlist.isMember(email):
         return False
-    return (len(recentMemberPostings.get(email, [])) >
-                mlist.member_verbosity_threshold
-           )
+    return count > mlist.member_verbosity_threshold
 
 
 def check_eq_domains(email, domains_list):
@@ -17,15 +17,37 @@
 
 from builtins import str
 from builtins import range
+import re
 import sys
 import time
 import locale
+import weakref
 import gettext
 
 from Mailman import mm_cfg
+from Mailman import Metrics
 from Mailman.SafeDict import SafeDict
 
 _translation = None
+# Maps languages to their translations.  Each language's catalog is loaded
+# once per process, so switching languages is just a lookup.
+_translations = {}
+
+Metrics.describe('mailman_translation_hits_total',
+                 'Switches to an already loaded language, by language')
+Metrics.describe('mailman_translation_loads_total',
+                 'Translation catalogs loaded, by language')
+
+# Maps each translation to a dictionary mapping the strings translated with it
+# to (translated string, names), where names are the keys interpolated into
+# the translated string, or None if it must be interpolated the slow way.
+# When there's nothing to interpolate, the translated string is final.
+_compiled = weakref.WeakKeyDictionary()
+# The strings compiled for a translation are forgotten when there are more
+# than this many of them, e.g. when dynamic strings are being translated.
+MAXCACHED = 5000
+
+keycre = re.compile(r'%\(([^()]*)\)')
 
 
 def _get_ctype_charset():
@@ -43,15 +65,31 @@ else:
 
 def set_language(language=None):
     global _translation
+    try:
+        _translation = _translations[language]
+    except KeyError:
+        _translation = _translations[language] = _load(language)
+    else:
+        Metrics.inc('mailman_translation_hits_total',
+                    language=language or 'default')
+
+def _load(language):
+    Metrics.inc('mailman_translation_loads_total',
+                language=language or 'default')
     if language is not None:
         language = [language]
     try:
-        _translation = gettext.translation('mailman', mm_cfg.MESSAGES_DIR,
-                                           language)
+        return gettext.translation('mailman', mm_cfg.MESSAGES_DIR, language)
     except IOError:
         # The selected language was not installed in messages, so fall back to
         # untranslated English.
-        _translation = gettext.NullTranslations()
+        return gettext.NullTranslations()
+
+def preload_languages():
+    """Load the catalogs of all the site's languages."""
+    for language in mm_cfg.LC_DESCRIPTIONS:
+        if language not in _translations:
+            _translations[language] = _load(language)
 
 def get_translation():
     return _translation
@@ -81,10 +119,63 @@ def _(s, frame=1):
     #     print _('The current time is: %(now)s')
     #
     # and have it Just Work.  Note that the lookup order for keys in the
-    # original string is 1) locals dictionary, 2) globals dictionary.
+    # original string is 1) locals dictionary, 2) globals dictionary.  Only
+    # the keys the translated string uses are looked up.
     #
+    tns, names = _compile(s)
+    if names is not None and not names:
+        return tns
     # First, get the frame of the caller
     frame = sys._getframe(frame)
+    if names is None:
+        return _interpolate_all(tns, frame)
+    # Only look up the names the translated string uses.
+    f_locals = frame.f_locals
+    f_globals = frame.f_globals
+    dict = SafeDict()
+    for name in names:
+        if name in f_locals:
+            v = f_locals[name]
+        elif name in f_globals:
+            v = f_globals[name]
+        else:
+            continue
+        # XXX python3 str does not require encode/decode
+        if isinstance(v, bytes):
+            v = v.decode('utf-8', 'replace')
+        dict[name] = v
+    try:
+        return tns % dict
+    except (ValueError, TypeError):
+        # Bad interpolation format. Punt.
+        return tns
+
+
+def _compile(s):
+    cache = _compiled.get(_translation)
+    if cache is None:
+        cache = _compiled[_translation] = {}
+    try:
+        return cache[s]
+    except KeyError:
+        pass
+    tns = _translation.gettext(s)
+    names = None
+    if isinstance(tns, str):
+        # Every % must start a %(name) key or be a %% escape.
+        stripped = tns.replace('%%', '')
+        keys = keycre.findall(stripped)
+        if stripped.count('%') == len(keys):
+            names = tuple(set(keys))
+            if not names:
+                tns = tns.replace('%%', '%')
+    if len(cache) >= MAXCACHED:
+        cache.clear()
+    cache[s] = (tns, names)
+    return tns, names
+
+
+def _interpolate_all(tns, frame):
     # A `safe' dictionary is used so we won't get an exception if there's a
     # missing key in the dictionary.
     dict = SafeDict(frame.f_globals.copy())
@@ -95,10 +186,6 @@ def _(s, frame=1):
     # much other stuff and _() has many tentacles.  Eventually I think we want
     # to use Unicode everywhere.
     # XXX python3 str does not require encode/decode
-    tns = _translation.gettext(s)
-    charset = _translation.charset()
-    if not charset:
-        charset = 'us-ascii'
     for k, v in list(dict.items()):
         if isinstance(v, bytes):
             dict[k] = v.decode('utf-8', 'replace')
@@ -0,0 +1,112 @@
+#! /usr/bin/env python
+
+# Copyright (C) 2026 by the Free Software Foundation, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+
+"""Benchmark the archiver's message body HTML-ification.
+
+This is not a unit test.  It times HyperArch.quote_body_lines() against the
+old search-and-slice implementation (kept in test_archiver.py) on a body
+built from repeated sample lines.
+
+Usage: %(PROGRAM)s [options]
+
+Options:
+    -h / --help
+        Print this text and exit.
+
+    -n lines / --lines=lines
+        Number of body lines per run (default 20000).
+
+    -r repeat / --repeat=repeat
+        Number of timed runs; the best is reported (default 5).
+"""
+from __future__ import print_function
+
+import sys
+import time
+import getopt
+
+import paths
+from Mailman.Archiver import HyperArch
+
+from test_archiver import SAMPLE, LISTINFO, reference_quote_body_lines
+
+PROGRAM = sys.argv[0]
+
+
+
+def usage(code, msg=''):
+    print(__doc__ % globals())
+    if msg:
+        print(msg)
+    sys.exit(code)
+
+
+def best_of(func, body, repeat):
+    best = None
+    for i in range(repeat):
+        lines = list(body)
+        t0 = time.time()
+        func(lines, listinfo_url=LISTINFO)
+        elapsed = time.time() - t0
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hn:r:',
+                                   ['help', 'lines=', 'repeat='])
+    except getopt.error as msg:
+        usage(1, msg)
+
+    nlines = 20000
+    repeat = 5
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            usage(0)
+        elif opt in ('-n', '--lines'):
+            nlines = int(arg)
+        elif opt in ('-r', '--repeat'):
+            repeat = int(arg)
+
+    sample = [line for line in SAMPLE if line is not None]
+    body = (sample * (nlines // len(sample) + 1))[:nlines]
+
+    old = list(body)
+    new = list(body)
+    reference_quote_body_lines(old, listinfo_url=LISTINFO)
+    HyperArch.quote_body_lines(new, listinfo_url=LISTINFO)
+    if old != new:
+        print('Output differs from the reference implementation!')
+        sys.exit(1)
+
+    told = best_of(reference_quote_body_lines, body, repeat)
+    tnew = best_of(HyperArch.quote_body_lines, body, repeat)
+    print('lines:       %d' % nlines)
+    print('reference:   %.4f sec' % told)
+    print('single scan: %.4f sec' % tnew)
+    if tnew:
+        print('speedup:     %.2fx' % (told / tnew))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,459 @@
+# Copyright (C) 2026 by the Free Software Foundation, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+
+"""Unit tests for the pipermail archiver.
+"""
+
+import os
+import re
+import pickle
+import shutil
+import tempfile
+import unittest
+try:
+    from Mailman import __init__
+except ImportError:
+    import paths
+
+from Mailman import mm_cfg
+from Mailman.Archiver import HyperArch
+from Mailman.Archiver import SearchIndex
+from Mailman.Archiver.HyperDatabase import DumbBTree
+from Mailman.Archiver.HyperDatabase import HyperDatabase
+from Mailman.Archiver.HyperDatabase import _ArticleCache, _load_article
+from Mailman.Archiver.HyperArch import CGIescape, html_quote
+from Mailman.Archiver.HyperArch import emailpat, urlpat, quotedpat
+
+LISTINFO = 'http://www.dom.ain/mailman/listinfo/_xtest'
+
+SAMPLE = [
+    'Hello there,\n',
+    '\n',
+    '> On Monday, aperson@dom.ain wrote:\n',
+    '>> see http://www.example.com/foo?a=1&b=2 for details\n',
+    '|| piped quote\n',
+    ':: colon quote <with> "markup" & stuff\n',
+    '&gt; already escaped quote\n',
+    'Two links: https://a.example/x_ and ftp://b.example/y)\n',
+    'Mail bperson@dom.ain, cperson@dom.ain or visit <http://c.example>.\n',
+    'url_in_quotes "http://d.example/" and \'http://e.example\'\n',
+    'mixed http://f.example/user@host then dperson@dom.ain\n',
+    'trailing underscore http://g.example/a_\n',
+    'no newline http://h.example',
+    None,
+    'caf\xe9 \xfcber eperson@d\xf6m.ain\n',
+    '',
+    ]
+
+
+
+def reference_quote_body_lines(lines, lang=None, iquotes=1, showhtml=0,
+                               listinfo_url=None, atmark=' at '):
+    # This is the search-and-slice loop HyperArchive used before
+    # quote_body_lines(); it is kept here to prove the new code produces
+    # identical output.
+    source = lines[:]
+    dest = lines
+    last_line_was_quoted = 0
+    for i in range(0, len(source)):
+        L = source[i]
+        prefix = suffix = ''
+        if L is None:
+            continue
+        if iquotes:
+            quoted = quotedpat.match(L)
+            if quoted is None:
+                last_line_was_quoted = 0
+            else:
+                quoted = quoted.end(0)
+                prefix = CGIescape(L[:quoted], lang) + '<i>'
+                suffix = '</I>'
+                if showhtml:
+                    suffix += '<BR>'
+                    if not last_line_was_quoted:
+                        prefix = '<BR>' + prefix
+                L = L[quoted:]
+                last_line_was_quoted = 1
+        L2 = ''
+        jr = emailpat.search(L)
+        kr = urlpat.search(L)
+        while jr is not None or kr is not None:
+            j = -1 if jr is None else jr.start(0)
+            k = -1 if kr is None else kr.start(0)
+            if j != -1 and (j < k or k == -1):
+                text = jr.group(1)
+                length = len(text)
+                if listinfo_url is not None:
+                    text = re.sub('@', atmark, text)
+                    URL = listinfo_url
+                else:
+                    URL = 'mailto:' + text
+                pos = j
+            else:
+                text = URL = kr.group(1)
+                length = len(text)
+                pos = k
+            L2 += '%s<A HREF="%s">%s</A>' % (
+                CGIescape(L[:pos], lang),
+                html_quote(URL), CGIescape(text, lang))
+            L = L[pos+length:]
+            jr = emailpat.search(L)
+            kr = urlpat.search(L)
+        L = CGIescape(L, lang)
+        dest[i] = prefix + L2 + L + suffix
+
+
+
+class TestQuoteBodyLines(unittest.TestCase):
+    def _check(self, lines, **kws):
+        expected = list(lines)
+        reference_quote_body_lines(expected, **kws)
+        got = list(lines)
+        HyperArch.quote_body_lines(got, **kws)
+        self.assertEqual(got, expected)
+
+    def test_identical_output(self):
+        for iquotes in (0, 1):
+            for showhtml in (0, 1):
+                for listinfo_url in (None, LISTINFO):
+                    self._check(SAMPLE, iquotes=iquotes, showhtml=showhtml,
+                                listinfo_url=listinfo_url)
+
+    def test_url(self):
+        lines = ['see http://www.example.com/ now\n']
+        HyperArch.quote_body_lines(lines)
+        self.assertEqual(lines, [
+            'see <A HREF="http://www.example.com/">http://www.example.com/'
+            '</A> now\n'])
+
+    def test_email_mailto(self):
+        lines = ['ask aperson@dom.ain\n']
+        HyperArch.quote_body_lines(lines)
+        self.assertEqual(lines, [
+            'ask <A HREF="mailto:aperson@dom.ain">aperson@dom.ain</A>\n'])
+
+    def test_email_obscured(self):
+        lines = ['ask aperson@dom.ain\n']
+        HyperArch.quote_body_lines(lines, listinfo_url=LISTINFO)
+        self.assertEqual(lines, [
+            'ask <A HREF="%s">aperson at dom.ain</A>\n' % LISTINFO])
+
+    def test_quoted(self):
+        lines = ['> quoted <b>\n', 'plain\n']
+        HyperArch.quote_body_lines(lines)
+        self.assertEqual(lines, ['&gt;<i> quoted &lt;b&gt;\n</I>',
+                                 'plain\n'])
+
+    def test_none_is_skipped(self):
+        lines = [None, '<b>\n']
+        HyperArch.quote_body_lines(lines)
+        self.assertEqual(lines, [None, '&lt;b&gt;\n'])
+
+
+
+class FakeArticle(object):
+    def __init__(self, msgid, subject, body, filename):
+        self.msgid = msgid
+        self.subject = subject
+        self.author = 'A Person'
+        self.body = body
+        self.filename = filename
+        self.date = '00001234567'
+        self.decoded = {}
+
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp()
+        self._path = SearchIndex.index_path(self._tmpdir)
+        index = SearchIndex.SearchIndex(self._path)
+        index.add('2026-October', FakeArticle(
+            '<a@dom.ain>', 'Pipermail search', ['Full text search\n'],
+            '000001.html'))
+        index.add('2026-October', FakeArticle(
+            '<b@dom.ain>', 'Unrelated', ['Nothing to see (search) here\n'],
+            '000002.html'))
+        index.close()
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpdir)
+
+    def _search(self, text):
+        index = SearchIndex.SearchIndex(self._path, readonly=1)
+        try:
+            return index.search(text)
+        finally:
+            index.close()
+
+    def test_ranking(self):
+        total, hits = self._search('search')
+        self.assertEqual(total, 2)
+        # Subject matches rank above body matches
+        self.assertEqual([hit['filename'] for hit in hits],
+                         ['000001.html', '000002.html'])
+
+    def test_all_words(self):
+        total, hits = self._search('full search')
+        self.assertEqual(total, 1)
+        self.assertEqual(hits[0]['archive'], '2026-October')
+
+    def test_syntax_is_literal(self):
+        total, hits = self._search('(search AND "')
+        self.assertEqual(total, 0)
+
+    def test_replace(self):
+        index = SearchIndex.SearchIndex(self._path)
+        index.add('2026-October', FakeArticle(
+            '<a@dom.ain>', 'Pipermail', ['Rewritten\n'], '000001.html'))
+        index.close()
+        total, hits = self._search('full')
+        self.assertEqual(total, 0)
+        total, hits = self._search('rewritten')
+        self.assertEqual(total, 1)
+
+    def test_highlight(self):
+        total, hits = self._search('full')
+        self.assertEqual(SearchIndex.highlight(hits[0]['snippet']),
+                         '<b>Full</b> text search\n')
+
+
+
+class ThreadArticle(object):
+    # Just the attributes HyperDatabase needs to index and store an article.
+    def __init__(self, sequence, msgid, parentID=None, in_reply_to='',
+                 references=()):
+        self.sequence = sequence
+        self.msgid = msgid
+        self.parentID = parentID
+        self.in_reply_to = in_reply_to
+        self.references = list(references)
+        self.date = '%011d' % (1234567000 + sequence)
+        self.subject = 'Subject %d' % sequence
+        self.author = 'A Person'
+        self.body = ['Body\n']
+        self.html_body = None
+
+    def setListIfUnset(self, mlist):
+        pass
+
+
+def key(*sequences):
+    return ''.join('%011d.%d-' % (1234567000 + n, n) for n in sequences)
+
+
+class TestThreadGraph(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp()
+        self._db = HyperDatabase(self._tmpdir, None)
+
+    def tearDown(self):
+        self._db.close()
+        shutil.rmtree(self._tmpdir)
+
+    def _add(self, *args, **kws):
+        self._db.addArticle('2026-October', ThreadArticle(*args, **kws))
+
+    def _reopen(self):
+        self._db.close()
+        self._db = HyperDatabase(self._tmpdir, None)
+        self._db.numArticles('2026-October')
+
+    def _threads(self):
+        return sorted(self._db.threadIndex.keys())
+
+    def _stored_key(self, msgid):
+        return self._db.getArticle('2026-October', msgid).threadKey
+
+    def test_reply_before_parent(self):
+        eq = self.assertEqual
+        self._add(2, '<b@dom.ain>', in_reply_to='<a@dom.ain>')
+        eq(self._threads(), [(key(2), '<b@dom.ain>')])
+        self._add(1, '<a@dom.ain>')
+        eq(self._threads(), [(key(1), '<a@dom.ain>'),
+                             (key(1, 2), '<b@dom.ain>')])
+        eq(self._db.graphIndex['<b@dom.ain>'],
+           ['<a@dom.ain>', key(1, 2), []])
+        eq(self._db.graphIndex['<a@dom.ain>'], [None, key(1), ['<b@dom.ain>']])
+        # The stored article was rewritten too.
+        self._reopen()
+        eq(self._stored_key('<b@dom.ain>'), key(1, 2))
+        eq(self._db.getArticle('2026-October', '<b@dom.ain>').parentID,
+           '<a@dom.ain>')
+
+    def test_subtree_rekeyed(self):
+        eq = self.assertEqual
+        self._add(2, '<b@dom.ain>', in_reply_to='<a@dom.ain>')
+        self._add(3, '<c@dom.ain>', parentID='<b@dom.ain>',
+                  in_reply_to='<b@dom.ain>')
+        eq(self._threads(), [(key(2), '<b@dom.ain>'),
+                             (key(2, 3), '<c@dom.ain>')])
+        self._add(1, '<a@dom.ain>')
+        eq(self._threads(), [(key(1), '<a@dom.ain>'),
+                             (key(1, 2), '<b@dom.ain>'),
+                             (key(1, 2, 3), '<c@dom.ain>')])
+        self._reopen()
+        eq(self._stored_key('<b@dom.ain>'), key(1, 2))
+        eq(self._stored_key('<c@dom.ain>'), key(1, 2, 3))
+
+    def test_build_from_thread_index(self):
+        eq = self.assertEqual
+        self._add(1, '<a@dom.ain>')
+        self._add(2, '<b@dom.ain>', parentID='<a@dom.ain>')
+        self._add(3, '<c@dom.ain>', parentID='<b@dom.ain>')
+        self._add(4, '<d@dom.ain>')
+        graph = dict(self._db.graphIndex.dict)
+        # A volume archived before the graph existed.
+        self._db.close()
+        os.unlink(os.path.join(self._tmpdir, 'database', '2026-October-graph'))
+        self._reopen()
+        eq(dict(self._db.graphIndex.dict), graph)
+        eq(self._db.graphIndex['<b@dom.ain>'],
+           ['<a@dom.ain>', key(1, 2), ['<c@dom.ain>']])
+        eq(self._db.graphIndex['<d@dom.ain>'], [None, key(4), []])
+        # New replies are keyed from the rebuilt graph.
+        self._add(5, '<e@dom.ain>', parentID='<c@dom.ain>')
+        self.assertTrue((key(1, 2, 3, 5), '<e@dom.ain>') in self._threads())
+
+
+
+class TestArticleCache(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp()
+        self._size = mm_cfg.ARCHIVER_ARTICLE_CACHE_SIZE
+        self._bytes = mm_cfg.ARCHIVER_ARTICLE_CACHE_BYTES
+
+    def tearDown(self):
+        mm_cfg.ARCHIVER_ARTICLE_CACHE_SIZE = self._size
+        mm_cfg.ARCHIVER_ARTICLE_CACHE_BYTES = self._bytes
+        shutil.rmtree(self._tmpdir)
+
+    def test_evict_by_count(self):
+        eq = self.assertEqual
+        cache = _ArticleCache(2, 0)
+        cache.put('a', 'A', 100)
+        cache.put('b', 'B', 100)
+        # Using a makes b the least recently used.
+        eq(cache.get('a'), 'A')
+        cache.put('c', 'C', 100)
+        eq(len(cache), 2)
+        eq(cache.get('b'), None)
+        eq(cache.get('a'), 'A')
+        eq(cache.get('c'), 'C')
+        eq(cache.stats()['evictions'], 1)
+
+    def test_evict_by_bytes(self):
+        eq = self.assertEqual
+        cache = _ArticleCache(0, 250)
+        cache.put('a', 'A', 100)
+        cache.put('b', 'B', 100)
+        cache.put('c', 'C', 100)
+        eq(cache.get('a'), None)
+        eq(cache.stats()['bytes'], 200)
+        # Replacing an entry doesn't count its old size.
+        cache.put('c', 'C2', 50)
+        eq(len(cache), 2)
+        eq(cache.stats()['bytes'], 150)
+        # An entry over budget on its own is still kept.
+        cache.put('d', 'D', 1000)
+        eq(len(cache), 1)
+        eq(cache.get('d'), 'D')
+        eq(cache.stats()['evictions'], 3)
+
+    def test_cache_stats(self):
+        eq = self.assertEqual
+        mm_cfg.ARCHIVER_ARTICLE_CACHE_SIZE = 2
+        mm_cfg.ARCHIVER_ARTICLE_CACHE_BYTES = 0
+        db = HyperDatabase(self._tmpdir, None)
+        try:
+            for n, msgid in enumerate(('<a@dom.ain>', '<b@dom.ain>',
+                                       '<c@dom.ain>')):
+                db.addArticle('2026-October', ThreadArticle(n, msgid))
+            for msgid in ('<a@dom.ain>', '<a@dom.ain>', '<b@dom.ain>',
+                          '<c@dom.ain>', '<a@dom.ain>'):
+                eq(db.getArticle('2026-October', msgid).msgid, msgid)
+            stats = db.cacheStats()
+        finally:
+            db.close()
+        eq(stats['hits'], 1)
+        eq(stats['misses'], 4)
+        eq(stats['evictions'], 2)
+        eq(stats['entries'], 2)
+
+    def test_load_current_pickle(self):
+        article = ThreadArticle(1, '<a@dom.ain>')
+        article.subject = 'caf\xe9'
+        loaded = _load_article(pickle.dumps(article, 4))
+        self.assertEqual(loaded.subject, 'caf\xe9')
+        self.assertEqual(loaded.msgid, '<a@dom.ain>')
+        self.assertEqual(_load_article(b'\x80\x04garbage'), None)
+
+    def test_load_legacy_pickle(self):
+        # Fake a Python 2 pickle, in which the subject is a Latin-1 byte
+        # string rather than a unicode string.
+        article = ThreadArticle(1, '<a@dom.ain>')
+        article.subject = 'PLACEHOLDER'
+        buf = pickle.dumps(article, 2)
+        unicode = b'X' + len(b'PLACEHOLDER').to_bytes(4, 'little') + \
+                  b'PLACEHOLDER'
+        self.assertTrue(unicode in buf)
+        buf = buf.replace(unicode, b'U\x04caf\xe9')
+        loaded = _load_article(buf)
+        self.assertEqual(loaded.subject, 'caf\xe9')
+        self.assertEqual(loaded.msgid, '<a@dom.ain>')
+
+
+
+class TestDumbBTree(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp()
+        self._btree = DumbBTree(os.path.join(self._tmpdir, 'subject'))
+        for subject, date in (('b', '2'), ('a', '1'), ('b', '1'), ('d', '1')):
+            self._btree[(subject, date, '<%s%s@dom.ain>' % (subject, date))] \
+                = subject + date
+
+    def tearDown(self):
+        self._btree.close()
+        shutil.rmtree(self._tmpdir)
+
+    def test_set_location_hit(self):
+        btree = self._btree
+        self.assertEqual(btree.set_location('b'),
+                         (('b', '1', '<b1@dom.ain>'), 'b1'))
+        # Iteration carries on from there.
+        self.assertEqual(next(btree), (('b', '1', '<b1@dom.ain>'), 'b1'))
+        self.assertEqual(next(btree), (('b', '2', '<b2@dom.ain>'), 'b2'))
+        self.assertEqual(next(btree), (('d', '1', '<d1@dom.ain>'), 'd1'))
+
+    def test_set_location_miss(self):
+        for loc in ('c', '0', 'e'):
+            self.assertRaises(KeyError, self._btree.set_location, loc)
+
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestQuoteBodyLines))
+    suite.addTest(unittest.makeSuite(TestSearchIndex))
+    suite.addTest(unittest.makeSuite(TestThreadGraph))
+    suite.addTest(unittest.makeSuite(TestArticleCache))
+    suite.addTest(unittest.makeSuite(TestDumbBTree))
+    return suite
+
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
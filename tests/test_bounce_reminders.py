@@ -8,6 +8,7 @@
 """Test membership reminder bounce handling."""
 
 import os
+import time
 import pickle
 import unittest
 import email
@@ -115,27 +116,70 @@ class ReminderBounceQueueTest(unittest.TestCase):
             Utils.list_names = old_list_names
             br_mod.MailList = old_mail_list
 
-        runner._bounce_events_fp.seek(0)
-        events = []
-        while True:
-            try:
-                events.append(pickle.load(runner._bounce_events_fp))
-            except EOFError:
-                break
-        self.assertEqual(len(events), 1)
-        self.assertEqual(events[0][0], 'mylist')
-        self.assertEqual(events[0][1], 'user@example.com')
+        events, getmsg = runner._read_bounce_events()
+        self.assertEqual(list(events.keys()), ['mylist'])
+        self.assertEqual(len(events['mylist']), 1)
+        addr, day, msgnum = events['mylist'][0]
+        self.assertEqual(addr, 'user@example.com')
+        self.assertEqual(getmsg(msgnum)['subject'], 'bounce')
         runner._bounce_events_fp.close()
         os.unlink(runner._bounce_events_file)
         runner._bounce_events_fp = None
         runner._bouncecnt = 0
 
 
+class BounceJournalTest(unittest.TestCase):
+    def setUp(self):
+        from Mailman.Queue.BounceRunner import BounceMixin
+        class TestMixin(BounceMixin):
+            pass
+        self._runner = TestMixin()
+
+    def tearDown(self):
+        runner = self._runner
+        if runner._bounce_events_fp is not None:
+            runner._bounce_events_fp.close()
+            os.unlink(runner._bounce_events_file)
+
+    def test_message_stored_once(self):
+        from Mailman.Queue import BounceRunner
+        runner = self._runner
+        msg = email.message_from_string('Subject: first\n\nbody\n')
+        addrs = ['user%d@example.com' % i for i in range(100)]
+        runner._queue_bounces('mylist', addrs, msg)
+        # One message record, then one address record per address.
+        header = BounceRunner.EVENT_HEADER.size
+        expected = header + len(pickle.dumps(msg, 1))
+        for addr in addrs:
+            expected += header + len('mylist\0' + addr)
+        self.assertEqual(os.path.getsize(runner._bounce_events_file),
+                         expected)
+        runner._queue_bounces('other', ['a@example.com'],
+                              email.message_from_string('Subject: 2nd\n\n'))
+        self.assertEqual(runner._bouncecnt, 101)
+        events, getmsg = runner._read_bounce_events()
+        self.assertEqual(sorted(events.keys()), ['mylist', 'other'])
+        self.assertEqual([e[0] for e in events['mylist']], addrs)
+        self.assertEqual(events['mylist'][0][1], time.localtime()[:3])
+        self.assertEqual(getmsg(events['mylist'][0][2])['subject'], 'first')
+        self.assertEqual(getmsg(events['other'][0][2])['subject'], '2nd')
+
+    def test_truncated_journal(self):
+        runner = self._runner
+        runner._queue_bounces('mylist', ['a@example.com'],
+                              email.message_from_string('Subject: x\n\n'))
+        runner._bounce_events_fp.write(b'A\0\0')
+        events, getmsg = runner._read_bounce_events()
+        self.assertEqual([e[0] for e in events['mylist']], ['a@example.com'])
+
+
+
 
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(ReminderBounceTest))
     suite.addTest(unittest.makeSuite(ReminderBounceQueueTest))
+    suite.addTest(unittest.makeSuite(BounceJournalTest))
     return suite
 
 
@@ -0,0 +1,286 @@
+# Copyright (C) 2026 by the Free Software Foundation, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+
+"""Unit tests for bounce registration."""
+
+import os
+import sys
+import time
+import types
+import email
+import shutil
+import tempfile
+import unittest
+try:
+    from Mailman import __init__
+except ImportError:
+    import paths
+
+from importlib.machinery import SourceFileLoader
+
+from Mailman import mm_cfg
+from Mailman import MailList
+from Mailman import MemberAdaptor
+from Mailman import BounceIndex
+
+from TestBase import TestBase
+
+CRON_DISABLED = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir, 'cron', 'disabled')
+
+
+
+def run_disabled(*args):
+    # Run cron/disabled in this process.  It imports paths, which only exists
+    # once installed; the Mailman package is already importable here anyway.
+    sys.modules.setdefault('paths', types.ModuleType('paths'))
+    module = SourceFileLoader('cron_disabled', CRON_DISABLED).load_module()
+    argv = sys.argv
+    sys.argv = [CRON_DISABLED] + list(args)
+    try:
+        module.main()
+    finally:
+        sys.argv = argv
+
+
+
+class TestRegisterBounces(TestBase):
+    def setUp(self):
+        TestBase.setUp(self)
+        self._mlist.bounce_notify_owner_on_bounce_increment = 0
+        for i in range(3):
+            self._mlist.addNewMember('person%d@dom.ain' % i,
+                                     password='xxXXxx')
+        self._mlist.Save()
+        self._msg = email.message_from_string('Subject: bounce\n\n')
+        self._day = time.localtime()[:3]
+        self._slice = mm_cfg.REGISTER_BOUNCES_SLICE
+        self._pause = mm_cfg.REGISTER_BOUNCES_PAUSE
+
+    def tearDown(self):
+        mm_cfg.REGISTER_BOUNCES_SLICE = self._slice
+        mm_cfg.REGISTER_BOUNCES_PAUSE = self._pause
+        TestBase.tearDown(self)
+
+    def test_register_bounces(self):
+        mlist = self._mlist
+        mlist.registerBounces([('person0@dom.ain', self._msg, self._day),
+                               ('person1@dom.ain', self._msg, self._day),
+                               ('nobody@dom.ain', self._msg, self._day),
+                               ])
+        # The list was saved.
+        mlist.Load()
+        self.assertEqual(mlist.getBounceInfo('person0@dom.ain').score, 1.0)
+        self.assertEqual(mlist.getBounceInfo('person1@dom.ain').date,
+                         self._day)
+        self.assertEqual(mlist.getBounceInfo('person2@dom.ain'), None)
+
+    def test_time_slices(self):
+        mlist = self._mlist
+        mm_cfg.REGISTER_BOUNCES_SLICE = 1e-9
+        mm_cfg.REGISTER_BOUNCES_PAUSE = 0
+        pauses = []
+        def sleep(seconds):
+            # The list is released while registration pauses.
+            pauses.append(mlist.Locked())
+        def events():
+            for i in range(3):
+                yield 'person%d@dom.ain' % i, self._msg, self._day
+        realsleep = time.sleep
+        time.sleep = sleep
+        try:
+            mlist.registerBounces(events())
+        finally:
+            time.sleep = realsleep
+        self.assertEqual(pauses, [False, False, False])
+        self.assertTrue(mlist.Locked())
+        # Bounces registered before the list was released survive reloading.
+        for i in range(3):
+            info = mlist.getBounceInfo('person%d@dom.ain' % i)
+            self.assertEqual(info.score, 1.0)
+
+    def test_sibling_lists(self):
+        # New lists are created under the same lock, so release the test list
+        # while creating the sibling.
+        self._mlist.Unlock()
+        sibling = MailList.MailList()
+        sibling.Create('_xtest2', 'test@dom.ain', 'xxxxx')
+        try:
+            sibling.bounce_notify_owner_on_bounce_increment = 0
+            sibling.addNewMember('other@dom.ain', password='xxXXxx')
+            sibling.Save()
+            sibling.Unlock()
+            mlist = self._mlist = MailList.MailList('_xtest')
+            mlist.regular_include_lists = ['_xtest2@dom.ain']
+            mlist.registerBounces([('other@dom.ain', self._msg, self._day),
+                                   ('person0@dom.ain', self._msg, self._day),
+                                   ])
+            sibling.Load()
+            info = sibling.getBounceInfo('other@dom.ain')
+            self.assertEqual(info.score, 1.0)
+            self.assertFalse(mlist.isMember('other@dom.ain'))
+            self.assertFalse(sibling.Locked())
+        finally:
+            shutil.rmtree(os.path.join(mm_cfg.LIST_DATA_DIR, '_xtest2'))
+
+
+
+class TestBounceIndex(TestBase):
+    def setUp(self):
+        TestBase.setUp(self)
+        self._mlist.bounce_notify_owner_on_bounce_increment = 0
+        self._mlist.bounce_notify_owner_on_disable = 0
+        self._mlist.addNewMember('person@dom.ain', password='xxXXxx')
+        self._datadir = mm_cfg.DATA_DIR
+        self._enabled = mm_cfg.BOUNCE_DUE_INDEX
+        mm_cfg.DATA_DIR = tempfile.mkdtemp()
+        mm_cfg.BOUNCE_DUE_INDEX = 1
+        self._fullsweep = mm_cfg.BOUNCE_DUE_INDEX_FULL_SWEEP
+        mm_cfg.BOUNCE_DUE_INDEX_FULL_SWEEP = 0
+        BounceIndex.close()
+        self._msg = email.message_from_string('Subject: bounce\n\n')
+
+    def tearDown(self):
+        BounceIndex.close()
+        shutil.rmtree(mm_cfg.DATA_DIR)
+        # Disabling the member queued notices.
+        for f in os.listdir(mm_cfg.VIRGINQUEUE_DIR):
+            os.unlink(os.path.join(mm_cfg.VIRGINQUEUE_DIR, f))
+        mm_cfg.DATA_DIR = self._datadir
+        mm_cfg.BOUNCE_DUE_INDEX = self._enabled
+        mm_cfg.BOUNCE_DUE_INDEX_FULL_SWEEP = self._fullsweep
+        TestBase.tearDown(self)
+
+    def test_register_bounce(self):
+        mlist = self._mlist
+        day = time.localtime()[:3]
+        mlist.registerBounce('person@dom.ain', self._msg, day=day)
+        stale = time.mktime(day + (0,) * 6) + mlist.bounce_info_stale_after
+        self.assertEqual(BounceIndex.due(stale - 1), {})
+        self.assertEqual(BounceIndex.due(stale),
+                         {'_xtest': ['person@dom.ain']})
+
+    def test_disabled_notices(self):
+        mlist = self._mlist
+        mlist.bounce_score_threshold = 1.0
+        mlist.registerBounce('person@dom.ain', self._msg)
+        self.assertEqual(mlist.getDeliveryStatus('person@dom.ain'),
+                         MemberAdaptor.BYBOUNCE)
+        # The first notice went out on disabling, so the next one is due
+        # after the warnings interval.
+        info = mlist.getBounceInfo('person@dom.ain')
+        nextnotice = (time.mktime(info.lastnotice + (0,) * 6) +
+                      mlist.bounce_you_are_disabled_warnings_interval)
+        self.assertEqual(BounceIndex.due(nextnotice - 1), {})
+        self.assertEqual(BounceIndex.due(nextnotice),
+                         {'_xtest': ['person@dom.ain']})
+        # Once the notices are exhausted the member is removed, and so is
+        # their index entry.
+        info.noticesleft = 0
+        mlist.sendNextNotification('person@dom.ain')
+        self.assertFalse(mlist.isMember('person@dom.ain'))
+        self.assertEqual(BounceIndex.due(nextnotice), {})
+
+    def test_reindex(self):
+        mlist = self._mlist
+        mlist.registerBounce('person@dom.ain', self._msg)
+        BounceIndex.set_due('_xtest', 'gone@dom.ain', 0)
+        BounceIndex.reindex(mlist)
+        self.assertEqual(BounceIndex.due(time.time() + mm_cfg.days(365)),
+                         {'_xtest': ['person@dom.ain']})
+
+    def test_unindexed_list_swept(self):
+        # A list is swept in full until the index covers it, even once other
+        # lists' bounces have created the index.
+        self._mlist.Save()
+        self._mlist.Unlock()
+        sibling = MailList.MailList()
+        sibling.Create('_xtest2', 'test@dom.ain', 'xxxxx')
+        try:
+            # A member disabled before the index was turned on, and due their
+            # next notice.
+            mm_cfg.BOUNCE_DUE_INDEX = 0
+            sibling.bounce_notify_owner_on_disable = 0
+            sibling.bounce_score_threshold = 1.0
+            sibling.addNewMember('other@dom.ain', password='xxXXxx')
+            sibling.registerBounce('other@dom.ain', self._msg)
+            info = sibling.getBounceInfo('other@dom.ain')
+            info.lastnotice = (2000, 1, 1)
+            noticesleft = info.noticesleft
+            sibling.Save()
+            sibling.Unlock()
+            mm_cfg.BOUNCE_DUE_INDEX = 1
+            self._mlist.Lock()
+            self._mlist.registerBounce('person@dom.ain', self._msg)
+            self._mlist.Save()
+            self._mlist.Unlock()
+            self.assertEqual(BounceIndex.due(time.time() + mm_cfg.days(365)),
+                             {'_xtest': ['person@dom.ain']})
+            run_disabled('-l', '_xtest', '-l', '_xtest2')
+            sibling.Load()
+            info = sibling.getBounceInfo('other@dom.ain')
+            self.assertEqual(info.noticesleft, noticesleft - 1)
+            self.assertEqual(info.lastnotice, time.localtime()[:3])
+            # Now both lists are indexed.
+            self.assertEqual(BounceIndex.indexed(), set(['_xtest', '_xtest2']))
+            self.assertEqual(
+                BounceIndex.due(time.time() + mm_cfg.days(365)),
+                {'_xtest': ['person@dom.ain'], '_xtest2': ['other@dom.ain']})
+        finally:
+            shutil.rmtree(os.path.join(mm_cfg.LIST_DATA_DIR, '_xtest2'))
+            self._mlist.Lock()
+
+    def test_forget(self):
+        mlist = self._mlist
+        mlist.registerBounce('person@dom.ain', self._msg)
+        BounceIndex.reindex(mlist)
+        self.assertEqual(BounceIndex.indexed(), set(['_xtest']))
+        BounceIndex.forget('_xtest')
+        self.assertEqual(BounceIndex.indexed(), set())
+        self.assertEqual(BounceIndex.due(time.time() + mm_cfg.days(365)), {})
+
+    def test_forked(self):
+        # A forked child opens its own connection, and closing it leaves the
+        # parent's alone.
+        conn = BounceIndex._connect()
+        pid = os.fork()
+        if not pid:
+            status = 1
+            try:
+                if BounceIndex._connect() is not conn:
+                    BounceIndex.set_due('_xtest', 'child@dom.ain', 0)
+                    BounceIndex.close()
+                    status = 0
+            finally:
+                os._exit(status)
+        pid, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+        self.assertTrue(BounceIndex._connect() is conn)
+        self.assertEqual(BounceIndex.due(1), {'_xtest': ['child@dom.ain']})
+
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestRegisterBounces))
+    suite.addTest(unittest.makeSuite(TestBounceIndex))
+    return suite
+
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -28,6 +28,7 @@ try:
 except ImportError:
     import paths
 
+from Mailman.Bouncers import BouncerAPI
 from Mailman.Bouncers.BouncerAPI import Stop
 
 
@@ -211,6 +212,68 @@ class BounceTest(unittest.TestCase):
                 foundaddrs.sort()
             self.assertEqual(addrs, foundaddrs)
 
+    def _bounces(self):
+        for file in sorted(os.listdir(os.path.join(_TESTDIR, 'bounces'))):
+            fp = open(os.path.join(_TESTDIR, 'bounces', file), 'rb')
+            try:
+                yield file, email.message_from_binary_file(fp)
+            finally:
+                fp.close()
+
+    def test_context(self):
+        # Every detector finds the same thing with a shared bounce context
+        # as it does on its own.
+        for file, msg in self._bounces():
+            context = BouncerAPI.BounceContext(msg)
+            for modname in BouncerAPI.BOUNCE_PIPELINE:
+                module = 'Mailman.Bouncers.' + modname
+                __import__(module)
+                process = sys.modules[module].process
+                try:
+                    withcontext = process(msg, context=context)
+                except TypeError:
+                    continue
+                self.assertEqual(process(msg), withcontext,
+                                 '%s: %s' % (modname, file))
+
+    def test_scan_messages(self):
+        # The engine returns what running the pipeline in order does.
+        for file, msg in self._bounces():
+            expected = []
+            for modname in BouncerAPI.BOUNCE_PIPELINE:
+                module = 'Mailman.Bouncers.' + modname
+                __import__(module)
+                addrs = sys.modules[module].process(msg)
+                if addrs:
+                    expected = addrs
+                    break
+            self.assertEqual(expected, BouncerAPI.ScanMessages(None, msg),
+                             file)
+        stats = BouncerAPI.DetectorStats()
+        self.assertTrue(stats['SimpleMatch'][0] > 0)
+
+    def test_simplematch_scan(self):
+        from Mailman.Bouncers import SimpleMatch
+        # One pass over all the triples finds what one pass per triple does.
+        for file, msg in self._bounces():
+            lines = list(SimpleMatch._body_line_iterator(msg))
+            found = SimpleMatch.scan(lines, SimpleMatch.PATTERNS)
+            for triple, addrs in zip(SimpleMatch.PATTERNS, found):
+                scre, ecre, acre = triple
+                expected = {}
+                state = 0
+                for line in lines:
+                    if state == 0 and scre.search(line):
+                        state = 1
+                    if state == 1:
+                        mo = acre.search(line)
+                        if mo:
+                            if mo.group('addr'):
+                                expected[mo.group('addr').strip('<>')] = 1
+                        elif ecre.search(line):
+                            break
+                self.assertEqual(list(expected), list(addrs), file)
+
     def test_SMTP32_failure(self):
         from Mailman.Bouncers import SMTP32
         # This file has no X-Mailer: header
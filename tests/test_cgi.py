@@ -0,0 +1,136 @@
+# Copyright (C) 2026 by the Free Software Foundation, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+
+"""Unit tests for the CGI scripts' request header parsing."""
+
+import os
+import unittest
+try:
+    from Mailman import __init__
+except ImportError:
+    import paths
+
+from Mailman.Cgi import private
+
+HEADERS = ('HTTP_ACCEPT_ENCODING', 'HTTP_IF_NONE_MATCH',
+           'HTTP_IF_MODIFIED_SINCE')
+
+# Fri, 16 Oct 2026 12:00:00 GMT
+MTIME = 1792152000
+
+
+
+class FakeStat(object):
+    st_ino = 0x1234
+    st_size = 0x100
+    st_mtime = MTIME + 0.5
+
+
+
+class TestPrivate(unittest.TestCase):
+    def setUp(self):
+        self._environ = {}
+        for name in HEADERS:
+            self._environ[name] = os.environ.pop(name, None)
+
+    def tearDown(self):
+        for name, value in self._environ.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    def _accepts(self, value):
+        os.environ['HTTP_ACCEPT_ENCODING'] = value
+        return private.accepts_gzip()
+
+    def _not_modified(self, etag, inm=None, ims=None):
+        for name, value in (('HTTP_IF_NONE_MATCH', inm),
+                            ('HTTP_IF_MODIFIED_SINCE', ims)):
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        return private.not_modified(etag, MTIME)
+
+    def test_accepts_gzip(self):
+        self.assertFalse(private.accepts_gzip())
+        self.assertTrue(self._accepts('gzip'))
+        self.assertTrue(self._accepts('deflate, GZip'))
+        self.assertTrue(self._accepts('x-gzip'))
+        self.assertTrue(self._accepts('br;q=1.0, gzip;q=0.5'))
+        self.assertTrue(self._accepts('gzip; q=1'))
+
+    def test_refuses_gzip(self):
+        self.assertFalse(self._accepts(''))
+        self.assertFalse(self._accepts('deflate, br'))
+        self.assertFalse(self._accepts('identity;q=1, *;q=0'))
+        self.assertFalse(self._accepts('gzip;q=0'))
+        self.assertFalse(self._accepts('x-gzip;q=0.000'))
+        self.assertFalse(self._accepts('gzip;q=bogus'))
+        # gzipped is not gzip.
+        self.assertFalse(self._accepts('gzipped'))
+
+    def test_etag(self):
+        self.assertEqual(private.etag_for(FakeStat()),
+                         '"1234-100-%x"' % MTIME)
+        self.assertEqual(private.etag_for(FakeStat(), '-gz'),
+                         '"1234-100-%x-gz"' % MTIME)
+
+    def test_if_none_match(self):
+        etag = private.etag_for(FakeStat())
+        self.assertFalse(self._not_modified(etag))
+        self.assertTrue(self._not_modified(etag, etag))
+        self.assertTrue(self._not_modified(etag, '"other", %s' % etag))
+        self.assertTrue(self._not_modified(etag, 'W/%s' % etag))
+        self.assertTrue(self._not_modified(etag, ' * '))
+        self.assertFalse(self._not_modified(etag, '"other", W/"another"'))
+        # The gzipped variant has its own tag.
+        self.assertFalse(self._not_modified(
+            private.etag_for(FakeStat(), '-gz'), etag))
+
+    def test_if_none_match_takes_precedence(self):
+        etag = private.etag_for(FakeStat())
+        since = 'Sat, 17 Oct 2026 12:00:00 GMT'
+        self.assertTrue(self._not_modified(etag, ims=since))
+        self.assertFalse(self._not_modified(etag, '"other"', since))
+        self.assertTrue(self._not_modified(etag, etag,
+                                           'Thu, 01 Jan 1970 00:00:00 GMT'))
+
+    def test_if_modified_since(self):
+        etag = private.etag_for(FakeStat())
+        self.assertTrue(self._not_modified(
+            etag, ims='Fri, 16 Oct 2026 12:00:00 GMT'))
+        self.assertFalse(self._not_modified(
+            etag, ims='Fri, 16 Oct 2026 11:59:59 GMT'))
+
+    def test_bad_if_modified_since(self):
+        etag = private.etag_for(FakeStat())
+        for since in ('yesterday', 'Fri, 99 Foo 2026 12:00:00 GMT', ' '):
+            self.assertFalse(self._not_modified(etag, ims=since))
+
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestPrivate))
+    return suite
+
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -22,12 +22,20 @@ from __future__ import print_function
 from builtins import str
 from builtins import range
 import os
+import re
 import time
 import email
+import io
 import errno
+import hashlib
+import shutil
 import pickle
+import tempfile
 import unittest
 from email.generator import Generator
+from email.mime.application import MIMEApplication
+from email.header import decode_header, make_header
+from unicodedata import normalize
 try:
     from Mailman import __init__
 except ImportError:
@@ -38,6 +46,10 @@ from Mailman.MailList import MailList
 from Mailman import Message
 from Mailman import Errors
 from Mailman import Pending
+from Mailman import MemberAdaptor
+from Mailman import Utils
+from Mailman import DMARCCache
+from Mailman.SafeDict import SafeDict
 from Mailman.Queue.Switchboard import Switchboard
 
 from Mailman.Handlers import Acknowledge
@@ -52,6 +64,7 @@ from Mailman.Handlers import Hold
 from Mailman.Handlers import MimeDel
 from Mailman.Handlers import Moderate
 from Mailman.Handlers import Replybot
+from Mailman.Handlers import Scrubber
 # Don't test handlers such as SMTPDirect and Sendmail here
 from Mailman.Handlers import SpamDetect
 from Mailman.Handlers import Tagger
@@ -869,6 +882,49 @@ From: aperson@dom.ain
         eq(msg['list-post'], '<mailto:_xtest@dom.ain>')
 
 
+
+def reference_decorate(mlist, template, extradict=None):
+    # Decorate.decorate() as it was before decorations were compiled.
+    if len(re.sub(r'\s', '', template)) == 0:
+        return ''
+    d = SafeDict(Decorate.list_attributes(mlist))
+    if extradict is not None:
+        d.update(extradict)
+    if getattr(mlist, 'use_dollar_strings', 0):
+        template = Utils.to_percent(template)
+    try:
+        text = re.sub(r'(?m)(?<!^--) +(?=\n)', '',
+                      re.sub(r'\r\n', r'\n', template % d))
+    except (ValueError, TypeError) as e:
+        text = template
+    if not text.endswith('\n'):
+        text += '\n'
+    return text
+
+
+DECORATIONS = [
+    '',
+    ' \n \n',
+    'footer',
+    '%(real_name)s footer\n',
+    '%(real_name)s %(user_address)s %(user_name)s   \r\n-- \nsig  ',
+    'options: %(user_optionsurl)s %(unknown)s',
+    '%%(real_name)s is 100%% %(list_name)s',
+    '% silly %(real_name)s',
+    'discount 100%',
+    '%(real_name)d',
+    '%(a(b)c)s',
+    '$real_name ${list_name} costs $$5, %(host_name)s $user_address',
+    ]
+
+EXTRADICTS = [
+    None,
+    {},
+    {'user_address': 'aperson@dom.ain', 'user_name': b'A. Person'},
+    {'real_name': 'Overridden', 'user_address': 'aperson@dom.ain'},
+    ]
+
+
 
 class TestDecorate(TestBase):
     def test_short_circuit(self):
@@ -1043,6 +1099,63 @@ IMAGEDATAIMAGEDATAIMAGEDATA
                self._mlist, None, {'personalize': 1,
                                    'recips': [1, 2, 3]})
 
+    def test_compiled_matches_reference(self):
+        mlist = self._mlist
+        mlist.real_name = 'XTest %(not a slot)s'
+        for dollars in (0, 1):
+            mlist.use_dollar_strings = dollars
+            for template in DECORATIONS:
+                for extradict in EXTRADICTS:
+                    self.assertEqual(
+                        Decorate.decorate(mlist, template, 'test', extradict),
+                        reference_decorate(mlist, template, extradict),
+                        (dollars, template, extradict))
+
+    def test_compiled_once(self):
+        mlist = self._mlist
+        template = '%(real_name)s for %(user_address)s'
+        decoration = Decorate.get_decoration(mlist, template)
+        self.assertEqual(decoration.names, frozenset(['user_address']))
+        self.assertTrue(Decorate.get_decoration(mlist, template) is decoration)
+        # Changing the list's attributes compiles it again.
+        mlist.real_name = 'Renamed'
+        self.assertFalse(
+            Decorate.get_decoration(mlist, template) is decoration)
+        self.assertEqual(Decorate.get_decoration(mlist, '100%'), None)
+
+    def test_personalize_needed_only(self):
+        mlist = self._mlist
+        mlist.addNewMember('aperson@dom.ain', password='xxXXxx')
+        mlist.msg_header = ''
+        mlist.msg_footer = 'footer for %(user_address)s'
+        def no_lookup(member):
+            raise AssertionError('looked up an unused slot')
+        mlist.GetOptionsURL = no_lookup
+        msg = email.message_from_string("""\
+From: aperson@dom.ain
+
+Here is a message.
+""")
+        Decorate.process(mlist, msg, {'personalize': 1,
+                                      'recips': ['aperson@dom.ain']})
+        self.assertEqual(msg.get_payload(), """\
+Here is a message.
+footer for aperson@dom.ain
+""")
+        mlist.msg_footer = 'options at %(user_optionsurl)s'
+        del mlist.GetOptionsURL
+        msg = email.message_from_string("""\
+From: aperson@dom.ain
+
+Here is a message.
+""")
+        Decorate.process(mlist, msg, {'personalize': 1,
+                                      'recips': ['aperson@dom.ain']})
+        self.assertEqual(msg.get_payload(), """\
+Here is a message.
+options at %s
+""" % mlist.GetOptionsURL('aperson@dom.ain'))
+
 
 
 class TestFileRecips(TestBase):
@@ -1784,7 +1897,142 @@ class TestReplybot(TestBase):
     pass
 
 
+
+class TestScrubber(TestBase):
+    def setUp(self):
+        TestBase.setUp(self)
+        self._storedir = mm_cfg.ATTACHMENT_STORE_DIR
+        self._dedup = mm_cfg.SCRUBBER_DEDUPLICATE_ATTACHMENTS
+        self._tmpdir = tempfile.mkdtemp()
+        mm_cfg.ATTACHMENT_STORE_DIR = os.path.join(self._tmpdir, 'store')
+        mm_cfg.SCRUBBER_DEDUPLICATE_ATTACHMENTS = True
+        self._archdir = self._mlist.archive_dir()
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpdir)
+        mm_cfg.ATTACHMENT_STORE_DIR = self._storedir
+        mm_cfg.SCRUBBER_DEDUPLICATE_ATTACHMENTS = self._dedup
+        TestBase.tearDown(self)
+
+    def _save(self, data, dir='2026-October/000001'):
+        part = MIMEApplication(data, 'pdf')
+        url = Scrubber.save_attachment(self._mlist, part, dir)
+        filename = url.rstrip('>').split('/')[-1]
+        return os.path.join(self._archdir, dir, filename)
+
+    def _stored(self):
+        files = []
+        for dirpath, dirnames, filenames in os.walk(
+                mm_cfg.ATTACHMENT_STORE_DIR):
+            files.extend(os.path.join(dirpath, f) for f in filenames)
+        return files
+
+    def test_deduplicated(self):
+        eq = self.assertEqual
+        data = b'%PDF-1.4 the same document'
+        path1 = self._save(data)
+        path2 = self._save(data, '2026-October/000002')
+        path3 = self._save(data)
+        eq(os.path.basename(path1), 'attachment.pdf')
+        eq(os.path.basename(path2), 'attachment.pdf')
+        eq(os.path.basename(path3), 'attachment-0001.pdf')
+        stored = self._stored()
+        eq(stored, [Scrubber.store_path(hashlib.sha256(data).hexdigest())])
+        for path in (path1, path2, path3):
+            with open(path, 'rb') as fp:
+                eq(fp.read(), data)
+            self.assertTrue(os.path.samefile(path, stored[0]))
+        eq(os.stat(stored[0]).st_nlink, 4)
+        # Different contents get their own file.
+        path4 = self._save(b'%PDF-1.4 another document')
+        eq(os.path.basename(path4), 'attachment-0002.pdf')
+        eq(len(self._stored()), 2)
+
+    def test_prune(self):
+        eq = self.assertEqual
+        path1 = self._save(b'kept')
+        path2 = self._save(b'removed')
+        os.unlink(path2)
+        eq(Scrubber.prune_store(), 1)
+        stored = self._stored()
+        eq(len(stored), 1)
+        self.assertTrue(os.path.samefile(path1, stored[0]))
+        # The pruned attachment is stored again when it's next posted.
+        self._save(b'removed')
+        eq(len(self._stored()), 2)
+        eq(Scrubber.prune_store(), 0)
+
+    def test_disabled(self):
+        mm_cfg.SCRUBBER_DEDUPLICATE_ATTACHMENTS = False
+        path1 = self._save(b'data')
+        path2 = self._save(b'data')
+        self.assertEqual(os.path.basename(path2), 'attachment-0001.pdf')
+        for path in (path1, path2):
+            self.assertEqual(os.stat(path).st_nlink, 1)
+        self.assertEqual(self._stored(), [])
+        # No temporary files are left behind.
+        self.assertEqual(sorted(os.listdir(os.path.dirname(path1))),
+                         ['attachment-0001.pdf', 'attachment.pdf'])
+
+    def test_store_unavailable(self):
+        # Attachments are still archived if the store can't be written.
+        open(mm_cfg.ATTACHMENT_STORE_DIR, 'w').close()
+        path = self._save(b'data')
+        with open(path, 'rb') as fp:
+            self.assertEqual(fp.read(), b'data')
+        self.assertEqual(os.stat(path).st_nlink, 1)
+        self.assertEqual(sorted(os.listdir(os.path.dirname(path))),
+                         ['attachment.pdf'])
+
+
 
+def reference_header_filter(rules, headers, lcset):
+    # The header_filter_rules loop SpamDetect.process() used before the rules
+    # were compiled.  Returns the action and pattern of the first match.
+    for patterns, action, empty in rules:
+        if action == mm_cfg.DEFER:
+            continue
+        for pattern in patterns.splitlines():
+            if pattern.startswith('#'):
+                continue
+            if not pattern.strip():
+                continue
+            pattern = Utils.xml_to_unicode(pattern, lcset)
+            pattern = normalize(mm_cfg.NORMALIZE_FORM, pattern)
+            try:
+                mo = re.search(pattern, headers,
+                               re.IGNORECASE|re.MULTILINE|re.UNICODE)
+            except (re.error, TypeError):
+                continue
+            if mo:
+                return action, pattern
+    return None
+
+
+FILTER_RULES = [
+    ('^subject: .*viagra\n# a comment\n\n^x-spam-flag: yes',
+     mm_cfg.DISCARD, False),
+    ('^from: .*@spam\\.example', mm_cfg.DEFER, False),
+    ('^to: (\\w+)@.*\\n^cc: \\1@', mm_cfg.HOLD, False),
+    ('(?i)^x-mailer: bulk', mm_cfg.REJECT, False),
+    ('^subject: .*(unclosed\n^(?P<tag>list)-id: .*(?P=tag)',
+     mm_cfg.HOLD, False),
+    ('^received: .*\n^from: .*@spam\\.example', mm_cfg.ACCEPT, False),
+    ]
+
+FILTER_HEADERS = [
+    'From: a@dom.ain\nSubject: hello\n',
+    'From: a@spam.example\nSubject: hello\n',
+    'From: a@dom.ain\nSubject: cheap VIAGRA\nX-Spam-Flag: YES\n',
+    'From: a@dom.ain\nX-Spam-Flag: yes\nSubject: hello\n',
+    'To: joe@dom.ain\nCc: joe@other.dom.ain\n',
+    'To: joe@dom.ain\nCc: ann@dom.ain\n',
+    'X-Mailer: Bulk Mailer 1.0\n',
+    'List-Id: <list.dom.ain>\nSubject: hi\n',
+    'Received: from x\nFrom: a@spam.example\n',
+    ]
+
+
 class TestSpamDetect(TestBase):
     def test_short_circuit(self):
         msgdata = {'approved': 1}
@@ -1814,6 +2062,197 @@ A message.
         finally:
             mm_cfg.KNOWN_SPAMMERS = spammers
 
+    def test_header_filter_matches_reference(self):
+        headerfilter = SpamDetect.HeaderFilter(FILTER_RULES, 'us-ascii')
+        for headers in FILTER_HEADERS:
+            self.assertEqual(
+                headerfilter.match(headers),
+                reference_header_filter(FILTER_RULES, headers, 'us-ascii'),
+                headers)
+
+    def test_header_filter_cache(self):
+        mlist = self._mlist
+        mlist.header_filter_rules = FILTER_RULES[:1]
+        headerfilter = SpamDetect.get_header_filter(mlist, 'us-ascii')
+        self.assertTrue(
+            SpamDetect.get_header_filter(mlist, 'us-ascii') is headerfilter)
+        mlist.header_filter_rules = FILTER_RULES[:2]
+        self.assertFalse(
+            SpamDetect.get_header_filter(mlist, 'us-ascii') is headerfilter)
+        mlist.header_filter_rules = []
+        self.assertFalse(SpamDetect.get_header_filter(mlist, 'us-ascii'))
+
+    def test_header_filter_rules(self):
+        self._mlist.header_filter_rules = FILTER_RULES
+        msg = email.message_from_string("""\
+From: aperson@dom.ain
+Subject: cheap viagra
+
+A message.
+""", Message.Message)
+        self.assertRaises(Errors.DiscardMessage,
+                          SpamDetect.process, self._mlist, msg, {})
+        msg = email.message_from_string("""\
+From: aperson@dom.ain
+X-Mailer: bulk
+
+A message.
+""", Message.Message)
+        self.assertRaises(Errors.RejectMessage,
+                          SpamDetect.process, self._mlist, msg, {})
+        msg = email.message_from_string("""\
+From: aperson@dom.ain
+Subject: hello
+
+A message.
+""", Message.Message)
+        self.assertEqual(SpamDetect.process(self._mlist, msg, {}), None)
+
+
+
+PSL = b"""\
+// A few rules in the format of the public suffix list.
+com
+ck
+*.ck
+!www.ck
+jp
+kawasaki.jp
+*.kawasaki.jp
+!city.kawasaki.jp
+uk
+co.uk
+"""
+
+ORG_DOMAINS = [
+    ('example.com', 'example.com'),
+    ('a.b.Example.COM', 'example.com'),
+    ('com', 'com'),
+    ('a.example.co.uk', 'example.co.uk'),
+    ('co.uk', 'co.uk'),
+    ('a.b.ck', 'a.b.ck'),
+    ('x.www.ck', 'www.ck'),
+    ('a.b.kawasaki.jp', 'a.b.kawasaki.jp'),
+    ('x.city.kawasaki.jp', 'city.kawasaki.jp'),
+    ('a.example.unknown', 'example.unknown'),
+    ]
+
+
+class FakeAnswer(object):
+    def __init__(self, rrsets, ttl):
+        self.response = self
+        self.answer = rrsets
+        self.expiration = time.time() + ttl
+
+
+class FakeResolver(object):
+    def __init__(self, records):
+        # Maps names to their TXT records, or None to raise NXDOMAIN.
+        self.records = records
+        self.queries = []
+
+    def query(self, name, rdtype):
+        import dns.rrset
+        import dns.resolver
+        self.queries.append(name)
+        txts = self.records.get(name)
+        if txts is None:
+            raise dns.resolver.NXDOMAIN
+        rrset = dns.rrset.from_text(name + '.', 300, 'IN', 'TXT',
+                                    *['"%s"' % txt for txt in txts])
+        return FakeAnswer([rrset], 300)
+
+
+class TestDMARC(TestBase):
+    def setUp(self):
+        TestBase.setUp(self)
+        self._datadir = mm_cfg.DATA_DIR
+        mm_cfg.DATA_DIR = tempfile.mkdtemp()
+        DMARCCache.close()
+        self._urlopen = Utils.safe_urlopen
+        self._trie = Utils.s_trie
+        self._resolver = Utils._resolver
+        self._urls = []
+        def urlopen(url):
+            self._urls.append(url)
+            return io.BytesIO(PSL)
+        Utils.safe_urlopen = urlopen
+        Utils.s_trie = {}
+        Utils._psl_mtime = Utils._psl_failed = None
+        self._fake = Utils._resolver = FakeResolver({
+            '_dmarc.dom.ain': ['v=DMARC1; p=reject'],
+            '_dmarc.example.com': ['v=DMARC1; p=none; sp=quarantine'],
+            })
+
+    def tearDown(self):
+        DMARCCache.close()
+        shutil.rmtree(mm_cfg.DATA_DIR)
+        mm_cfg.DATA_DIR = self._datadir
+        Utils.safe_urlopen = self._urlopen
+        Utils.s_trie = self._trie
+        Utils._resolver = self._resolver
+        Utils._psl_mtime = Utils._psl_failed = None
+        TestBase.tearDown(self)
+
+    def test_org_dom(self):
+        for domain, orgdom in ORG_DOMAINS:
+            self.assertEqual(Utils.get_org_dom(domain), orgdom)
+        # The list was retrieved once, and compiled for the other processes.
+        self.assertEqual(len(self._urls), 1)
+        self.assertTrue(os.path.exists(
+            os.path.join(mm_cfg.DATA_DIR, Utils.PSL_FILE)))
+
+    def test_compiled_list(self):
+        Utils.save_suffixes(Utils.parse_suffixes(PSL.splitlines()))
+        for domain, orgdom in ORG_DOMAINS:
+            self.assertEqual(Utils.get_org_dom(domain), orgdom)
+        self.assertEqual(self._urls, [])
+        # A refreshed list is picked up.
+        Utils.save_suffixes(Utils.parse_suffixes([b'uk']))
+        os.utime(os.path.join(mm_cfg.DATA_DIR, Utils.PSL_FILE),
+                 (time.time() + 10, time.time() + 10))
+        self.assertEqual(Utils.get_org_dom('a.example.co.uk'), 'co.uk')
+
+    def test_retrieval_failure(self):
+        def urlopen(url):
+            self._urls.append(url)
+            raise ValueError('no network')
+        Utils.safe_urlopen = urlopen
+        for i in range(3):
+            self.assertEqual(Utils.get_org_dom('a.example.co.uk'), 'co.uk')
+        # Retrieval isn't retried for every lookup.
+        self.assertEqual(len(self._urls), 1)
+
+    def test_cached_policy(self):
+        mlist = self._mlist
+        for i in range(3):
+            self.assertTrue(Utils.IsDMARCProhibited(mlist, 'a@dom.ain'))
+        self.assertEqual(self._fake.queries, ['_dmarc.dom.ain'])
+        hit, records = DMARCCache.get('_dmarc.dom.ain')
+        self.assertTrue(hit)
+        self.assertEqual(records,
+                         [('_dmarc.dom.ain.', ['v=DMARC1; p=reject'])])
+        hit, records = DMARCCache.get('_dmarc.dom.ain', time.time() + 301)
+        self.assertFalse(hit)
+
+    def test_negative_caching(self):
+        mlist = self._mlist
+        for i in range(2):
+            self.assertFalse(Utils.IsDMARCProhibited(mlist, 'a@x.co.uk'))
+        self.assertEqual(self._fake.queries, ['_dmarc.x.co.uk'])
+        self.assertEqual(DMARCCache.get('_dmarc.x.co.uk'), (True, None))
+
+    def test_org_policy(self):
+        # The organizational domain's sp= applies to its subdomains, and the
+        # lists' own settings are applied to the cached records.
+        mlist = self._mlist
+        mlist.dmarc_quarantine_moderation_action = 0
+        self.assertFalse(Utils.IsDMARCProhibited(mlist, 'a@b.example.com'))
+        mlist.dmarc_quarantine_moderation_action = 1
+        self.assertTrue(Utils.IsDMARCProhibited(mlist, 'a@b.example.com'))
+        self.assertEqual(self._fake.queries,
+                         ['_dmarc.b.example.com', '_dmarc.example.com'])
+
 
 
 class TestTagger(TestBase):
@@ -1978,9 +2417,10 @@ It rocks!
         files = self._sb.files()
         eq(len(files), 1)
         msg2, data = self._sb.dequeue(files[0])
-        eq(len(data), 3)
+        eq(len(data), 4)
         eq(data['_parsemsg'], False)
         eq(data['version'], 3)
+        eq(len(data['hops']), 1)
         # Clock skew makes this unreliable
         #self.assertTrue(data['received_time'] <= time.time())
         eq(msg.as_string(unixfrom=0), msg2.as_string(unixfrom=0))
@@ -1999,6 +2439,9 @@ Here is message %(i)d
 
     def setUp(self):
         TestBase.setUp(self)
+        self._mlist.addNewMember('mime@dom.ain', digest=1, password='xxXXxx')
+        self._mlist.addNewMember('plain@dom.ain', digest=1, password='xxXXxx')
+        self._mlist.setMemberOption('plain@dom.ain', mm_cfg.DisableMime, 1)
         self._path = os.path.join(self._mlist.fullpath(), 'digest.mbox')
         fp = open(self._path, 'w')
         g = Generator(fp)
@@ -2058,7 +2501,8 @@ Here is message %(i)d
         eq(rfc1153msg.get_content_type(), 'text/plain')
         eq(mimemsg.get_content_type(), 'multipart/mixed')
         eq(mimemsg['from'], mlist.GetRequestEmail())
-        eq(mimemsg['subject'],
+        # The MIME digest is queued as text, with the subject encoded.
+        eq(str(make_header(decode_header(mimemsg['subject']))),
            '%(realname)s Digest, Vol %(volume)d, Issue %(issue)d' % {
             'realname': mlist.real_name,
             'volume'  : mlist.volume,
@@ -2067,6 +2511,137 @@ Here is message %(i)d
         eq(mimemsg['to'], mlist.GetListEmail())
         # BAW: this test is incomplete...
 
+    def _send_spooled(self, count):
+        mlist = self._mlist
+        mlist.digest_size_threshhold = 1000
+        for i in range(count):
+            ToDigest.process(mlist, self._makemsg(i), {})
+        mlist.digest_size_threshhold = 0.001
+        ToDigest.process(mlist, self._makemsg(count), {})
+        digests = {}
+        for filebase in self._sb.files():
+            qmsg, qdata = self._sb.dequeue(filebase)
+            digests[qmsg.get_content_type()] = qmsg
+        return digests['multipart/mixed'], digests['text/plain']
+
+    def test_no_recipients(self):
+        mlist = self._mlist
+        mlist.setDeliveryStatus('mime@dom.ain', MemberAdaptor.BYUSER)
+        mlist.setDeliveryStatus('plain@dom.ain', MemberAdaptor.BYBOUNCE)
+        mlist.digest_size_threshhold = 0.001
+        ToDigest.process(mlist, self._makemsg(99), {})
+        self.assertEqual(self._sb.files(), [])
+        self.assertEqual(mlist.next_digest_number, 2)
+
+    def test_member_languages(self):
+        eq = self.assertEqual
+        mlist = self._mlist
+        mlist.available_languages = ['en', 'fr']
+        mlist.addNewMember('french@dom.ain', digest=1, password='xxXXxx',
+                           language='fr')
+        mlist.digest_size_threshhold = 0.001
+        ToDigest.process(mlist, self._makemsg(99), {})
+        digests = {}
+        for filebase in self._sb.files():
+            qmsg, qdata = self._sb.dequeue(filebase)
+            for recip in qdata['recips']:
+                digests[recip] = qmsg
+        eq(sorted(digests), ['french@dom.ain', 'mime@dom.ain',
+                             'plain@dom.ain'])
+        english = digests['mime@dom.ain'].get_payload(0)
+        french = digests['french@dom.ain'].get_payload(0)
+        self.assertTrue('Send _xtest mailing list submissions to' in
+                        english.get_payload(decode=True).decode('utf-8'))
+        self.assertTrue('Envoyez vos messages' in
+                        french.get_payload(decode=True).decode('utf-8'))
+        # The messages in the digest are the same.
+        eq(digests['mime@dom.ain'].get_payload(3).as_string(),
+           digests['french@dom.ain'].get_payload(3).as_string())
+
+    def test_digest_recipients(self):
+        eq = self.assertEqual
+        mlist = self._mlist
+        mlist.available_languages = ['en', 'fr']
+        mlist.addNewMember('French@dom.ain', digest=1, password='xxXXxx',
+                           language='fr')
+        mlist.addNewMember('regular@dom.ain', password='xxXXxx')
+        mlist.setDeliveryStatus('mime@dom.ain', MemberAdaptor.BYADMIN)
+        members = ['mime@dom.ain', 'plain@dom.ain', 'french@dom.ain',
+                   'regular@dom.ain', 'nobody@dom.ain']
+        recips = mlist.getDigestRecipients(members)
+        eq(recips, {('en', False): ['plain@dom.ain'],
+                    ('fr', True): ['French@dom.ain'],
+                    ('en', True): ['regular@dom.ain']})
+        # The generic version agrees.
+        eq(MemberAdaptor.MemberAdaptor.getDigestRecipients(mlist, members),
+           recips)
+
+    def test_spool(self):
+        eq = self.assertEqual
+        mlist = self._mlist
+        os.unlink(self._path)
+        mlist.digest_size_threshhold = 1000
+        for i in range(2):
+            ToDigest.process(mlist, self._makemsg(i), {})
+        state = ToDigest.read_spool(mlist)
+        eq(state['count'], 2)
+        eq(state['mboxsize'], os.path.getsize(self._path))
+        fp = open(os.path.join(mlist.fullpath(), ToDigest.SPOOL_TOC))
+        toc = fp.read()
+        fp.close()
+        self.assertTrue(toc.startswith('   1. message number 0'))
+        self.assertTrue('   2. message number 1' in toc)
+
+    def test_spool_not_started_midway(self):
+        # The digest.mbox already has messages the spool doesn't cover.
+        ToDigest.process(self._mlist, self._makemsg(99), {})
+        eq = self.assertEqual
+        eq(ToDigest.read_spool(self._mlist), None)
+        eq(os.path.exists(os.path.join(self._mlist.fullpath(),
+                                       ToDigest.SPOOL_TOC)), False)
+
+    def test_send_spooled_digest(self):
+        eq = self.assertEqual
+        mlist = self._mlist
+        os.unlink(self._path)
+        mimemsg, rfc1153msg = self._send_spooled(3)
+        subject = make_header(decode_header(mimemsg['subject']))
+        eq(str(subject), '_xtest Digest, Vol 1, Issue 1')
+        parts = mimemsg.get_payload()
+        eq([part.get_content_type() for part in parts],
+           ['text/plain', 'text/plain', 'multipart/digest', 'text/plain'])
+        self.assertTrue('(4 messages)' in parts[1]['content-description'])
+        messages = parts[2].get_payload()
+        eq(len(messages), 4)
+        for i, part in enumerate(messages):
+            eq(part.get_content_type(), 'message/rfc822')
+            inner = part.get_payload(0)
+            eq(inner['subject'], 'message number %d' % i)
+            eq(inner['message'], str(i + 1))
+        eq(mimemsg.epilogue.strip(), 'End of _xtest Digest, Vol 1, Issue 1')
+        plain = rfc1153msg.get_payload(decode=True).decode('utf-8')
+        for i in range(4):
+            self.assertTrue('Here is message %d' % i in plain)
+        self.assertTrue(plain.rstrip().endswith('*' * 10))
+        # The spool was cleared for the next digest.
+        eq(ToDigest.read_spool(mlist), None)
+        for name in ToDigest.SPOOL_FILES:
+            eq(os.path.exists(os.path.join(mlist.fullpath(), name)), False)
+
+    def test_spool_out_of_step(self):
+        eq = self.assertEqual
+        mlist = self._mlist
+        os.unlink(self._path)
+        ToDigest.process(mlist, self._makemsg(0), {})
+        # Something else added a message to the mbox, so the digest is built
+        # from the mbox instead.
+        fp = open(self._path, 'a')
+        Generator(fp).flatten(self._makemsg(1), unixfrom=1)
+        fp.close()
+        mimemsg, rfc1153msg = self._send_spooled(0)
+        eq(len(mimemsg.get_payload()[2].get_payload()), 3)
+        eq(ToDigest.read_spool(mlist), None)
+
 
 
 class TestToOutgoing(TestBase):
@@ -2168,7 +2743,9 @@ def suite():
     suite.addTest(unittest.makeSuite(TestMimeDel))
     suite.addTest(unittest.makeSuite(TestModerate))
     suite.addTest(unittest.makeSuite(TestReplybot))
+    suite.addTest(unittest.makeSuite(TestScrubber))
     suite.addTest(unittest.makeSuite(TestSpamDetect))
+    suite.addTest(unittest.makeSuite(TestDMARC))
     suite.addTest(unittest.makeSuite(TestTagger))
     suite.addTest(unittest.makeSuite(TestToArchive))
     suite.addTest(unittest.makeSuite(TestToDigest))
@@ -0,0 +1,206 @@
+# Copyright (C) 2026 by the Free Software Foundation, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+
+"""Unit tests for string translation and interpolation."""
+
+import os
+import shutil
+import struct
+import gettext
+import tempfile
+import unittest
+try:
+    from Mailman import __init__
+except ImportError:
+    import paths
+
+from Mailman import mm_cfg
+from Mailman import i18n
+from Mailman import Metrics
+from Mailman.i18n import _
+
+gvar = 'global'
+shadowed = 'global'
+
+
+
+class French(gettext.NullTranslations):
+    catalog = {'Hello %(lvar)s': 'Bonjour %(lvar)s'}
+
+    def gettext(self, message):
+        self.lookups = getattr(self, 'lookups', 0) + 1
+        return self.catalog.get(message, message)
+
+
+
+class TestTranslate(unittest.TestCase):
+    def setUp(self):
+        self._translation = i18n.get_translation()
+        i18n.set_translation(gettext.NullTranslations())
+
+    def tearDown(self):
+        i18n.set_translation(self._translation)
+
+    def test_interpolation(self):
+        lvar = 'local'
+        shadowed = 'local'
+        bvar = b'bytes'
+        self.assertEqual(_('%(lvar)s %(gvar)s %(shadowed)s %(bvar)s'),
+                         'local global local bytes')
+
+    def test_missing(self):
+        self.assertEqual(_('%(nosuchname)s'), '%(nosuchname)s')
+
+    def test_escapes(self):
+        lvar = 'local'
+        self.assertEqual(_('100%%'), '100%')
+        self.assertEqual(_('100%% %(lvar)s'), '100% local')
+        self.assertEqual(_('%(gvar)s %%s'), 'global %s')
+
+    def test_bad_format(self):
+        lvar = 'local'
+        self.assertEqual(_('100% %(lvar)s'), '100% %(lvar)s')
+        self.assertEqual(_('%(lvar)d'), '%(lvar)d')
+
+    def test_nested_key(self):
+        # Strings with keys the cache can't parse are interpolated as before.
+        self.assertEqual(_('%(a(b))s'), '%(a(b))s')
+
+    def test_frame(self):
+        lvar = 'outer'
+        def translate():
+            lvar = 'inner'
+            return _('%(lvar)s', 2)
+        self.assertEqual(translate(), 'outer')
+
+    def test_cached_per_translation(self):
+        lvar = 'local'
+        translation = French()
+        i18n.set_translation(translation)
+        self.assertEqual(_('Hello %(lvar)s'), 'Bonjour local')
+        self.assertEqual(_('Hello %(lvar)s'), 'Bonjour local')
+        self.assertEqual(translation.lookups, 1)
+        i18n.set_translation(gettext.NullTranslations())
+        self.assertEqual(_('Hello %(lvar)s'), 'Hello local')
+
+    def test_bounded(self):
+        maxcached = i18n.MAXCACHED
+        i18n.MAXCACHED = 2
+        try:
+            for s in ('one', 'two', 'three'):
+                _(s)
+            self.assertTrue(
+                len(i18n._compiled[i18n.get_translation()]) <= 2)
+        finally:
+            i18n.MAXCACHED = maxcached
+
+
+
+def write_mo(path, catalog):
+    # Write catalog as a GNU .mo file.
+    catalog = dict(catalog)
+    catalog[''] = 'Content-Type: text/plain; charset=UTF-8\n'
+    keys = sorted(catalog)
+    ids = b''
+    strs = b''
+    offsets = []
+    for key in keys:
+        msgid = key.encode('utf-8')
+        msgstr = catalog[key].encode('utf-8')
+        offsets.append((len(ids), len(msgid), len(strs), len(msgstr)))
+        ids += msgid + b'\0'
+        strs += msgstr + b'\0'
+    start = 7 * 4 + 16 * len(keys)
+    table = []
+    for idoff, idlen, stroff, strlen in offsets:
+        table.extend([idlen, start + idoff])
+    for idoff, idlen, stroff, strlen in offsets:
+        table.extend([strlen, start + len(ids) + stroff])
+    os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as fp:
+        fp.write(struct.pack('Iiiiiii', 0x950412de, 0, len(keys), 7 * 4,
+                             7 * 4 + 8 * len(keys), 0, 0))
+        fp.write(struct.pack('%di' % len(table), *table))
+        fp.write(ids + strs)
+
+
+
+class TestLanguages(unittest.TestCase):
+    def setUp(self):
+        self._translation = i18n.get_translation()
+        self._translations = i18n._translations.copy()
+        self._messagesdir = mm_cfg.MESSAGES_DIR
+        self._languages = mm_cfg.LC_DESCRIPTIONS
+        mm_cfg.MESSAGES_DIR = tempfile.mkdtemp()
+        mm_cfg.LC_DESCRIPTIONS = {'en': ('English', 'us-ascii', 'ltr'),
+                                  'fr': ('French', 'utf-8', 'ltr')}
+        write_mo(os.path.join(mm_cfg.MESSAGES_DIR, 'fr', 'LC_MESSAGES',
+                              'mailman.mo'),
+                 {'Hello %(lvar)s': 'Bonjour %(lvar)s'})
+        i18n._translations.clear()
+        Metrics.reset()
+
+    def tearDown(self):
+        shutil.rmtree(mm_cfg.MESSAGES_DIR)
+        mm_cfg.MESSAGES_DIR = self._messagesdir
+        mm_cfg.LC_DESCRIPTIONS = self._languages
+        i18n._translations.clear()
+        i18n._translations.update(self._translations)
+        i18n.set_translation(self._translation)
+        Metrics.reset()
+
+    def test_switching(self):
+        lvar = 'local'
+        for i in range(3):
+            i18n.set_language('fr')
+            self.assertEqual(_('Hello %(lvar)s'), 'Bonjour local')
+            french = i18n.get_translation()
+            i18n.set_language('en')
+            self.assertEqual(_('Hello %(lvar)s'), 'Hello local')
+        # Each catalog was loaded once, and then reused.
+        i18n.set_language('fr')
+        self.assertTrue(i18n.get_translation() is french)
+        self.assertEqual(
+            Metrics.get('mailman_translation_loads_total', language='fr'), 1)
+        self.assertEqual(
+            Metrics.get('mailman_translation_hits_total', language='fr'), 3)
+        self.assertEqual(
+            Metrics.get('mailman_translation_loads_total', language='en'), 1)
+
+    def test_preload(self):
+        i18n.preload_languages()
+        self.assertEqual(sorted(i18n._translations), ['en', 'fr'])
+        i18n.set_language('fr')
+        self.assertEqual(
+            Metrics.get('mailman_translation_loads_total', language='fr'), 1)
+        self.assertEqual(
+            Metrics.get('mailman_translation_hits_total', language='fr'), 1)
+        self.assertTrue(isinstance(i18n._translations['en'],
+                                   gettext.NullTranslations))
+
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestTranslate))
+    suite.addTest(unittest.makeSuite(TestLanguages))
+    return suite
+
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
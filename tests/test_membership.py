@@ -19,6 +19,8 @@
 
 import os
 import time
+import shutil
+import tempfile
 import unittest
 try:
     from Mailman import __init__
@@ -29,6 +31,8 @@ from Mailman import mm_cfg
 from Mailman import Utils
 from Mailman import MailList
 from Mailman import MemberAdaptor
+from Mailman import AddressPatterns
+from Mailman import RateStore
 from Mailman.Errors import NotAMemberError
 from Mailman.UserDesc import UserDesc
 
@@ -373,11 +377,157 @@ class TestMembers(TestBase):
         eq(mlist.getBouncingMembers(), [])
 
 
+
+class TestGetPattern(TestBase):
+    def setUp(self):
+        TestBase.setUp(self)
+        # New lists are created under the same lock, so release the test list
+        # while creating the sibling.
+        self._mlist.Unlock()
+        sibling = MailList.MailList()
+        sibling.Create('_xtest2', 'test@dom.ain', 'xxxxx')
+        sibling.addNewMember('anne@dom.ain', password='xxXXxx')
+        sibling.Save()
+        sibling.Unlock()
+        self._mlist.Lock()
+
+    def tearDown(self):
+        shutil.rmtree(os.path.join(mm_cfg.LIST_DATA_DIR, '_xtest2'))
+        TestBase.tearDown(self)
+
+    def test_addresses_and_regexps(self):
+        eq = self.assertEqual
+        patterns = ['Plain@Dom.Ain',
+                    '^.*@spam\\.example$',
+                    '^(\\w+)\\.\\1@dom\\.ain$',
+                    '^bad[',
+                    '@_xtest2',
+                    ]
+        mlist = self._mlist
+        eq(mlist.GetPattern('plain@dom.ain', patterns), 'plain@dom.ain')
+        eq(mlist.GetPattern('x@SPAM.example', patterns),
+           '^.*@spam\\.example$')
+        eq(mlist.GetPattern('jo.jo@dom.ain', patterns),
+           '^(\\w+)\\.\\1@dom\\.ain$')
+        eq(mlist.GetPattern('jo.ann@dom.ain', patterns), None)
+        # @listname entries only count with at_list.
+        eq(mlist.GetPattern('anne@dom.ain', patterns), None)
+        eq(mlist.GetPattern('Anne@dom.ain', patterns, at_list='test'),
+           '@_xtest2')
+
+    def test_order(self):
+        eq = self.assertEqual
+        mlist = self._mlist
+        eq(mlist.GetPattern('anne@dom.ain', ['^anne@', '@_xtest2'],
+                            at_list='test'), '^anne@')
+        eq(mlist.GetPattern('anne@dom.ain', ['@_xtest2', '^anne@'],
+                            at_list='test'), '@_xtest2')
+        eq(mlist.GetPattern('anne@dom.ain', ['@_xtest', '@_xtest3', '^an'],
+                            at_list='test'), '^an')
+
+    def test_cache(self):
+        eq = self.assertEqual
+        patterns = ['^.*@spam\\.example$', '@_xtest2']
+        matcher = AddressPatterns.get_patterns('_xtest', patterns, 'test')
+        self.assertTrue(AddressPatterns.get_patterns(
+            '_xtest', list(patterns), 'test') is matcher)
+        patterns.append('bob@dom.ain')
+        self.assertFalse(AddressPatterns.get_patterns(
+            '_xtest', patterns, 'test') is matcher)
+        eq(self._mlist.GetPattern('bob@dom.ain', patterns, 'test'),
+           'bob@dom.ain')
+        # The member index follows changes to the referenced list.
+        eq(self._mlist.GetPattern('carl@dom.ain', patterns, 'test'), None)
+        sibling = MailList.MailList('_xtest2')
+        try:
+            sibling.addNewMember('carl@dom.ain', password='xxXXxx')
+            sibling.Save()
+        finally:
+            sibling.Unlock()
+        eq(self._mlist.GetPattern('carl@dom.ain', patterns, 'test'),
+           '@_xtest2')
+
+
+
+
+class TestVerboseMembers(TestBase):
+    def setUp(self):
+        TestBase.setUp(self)
+        self._mlist.addNewMember('person@dom.ain', password='xxXXxx')
+        self._mlist.member_verbosity_threshold = 2
+        self._mlist.member_verbosity_interval = 300
+        self._datadir = mm_cfg.DATA_DIR
+        mm_cfg.DATA_DIR = tempfile.mkdtemp()
+        RateStore.close()
+
+    def tearDown(self):
+        RateStore.close()
+        shutil.rmtree(mm_cfg.DATA_DIR)
+        mm_cfg.DATA_DIR = self._datadir
+        TestBase.tearDown(self)
+
+    def test_threshold(self):
+        mlist = self._mlist
+        self.assertFalse(Utils.IsVerboseMember(mlist, 'person@dom.ain'))
+        self.assertFalse(Utils.IsVerboseMember(mlist, 'Person@dom.ain'))
+        self.assertTrue(Utils.IsVerboseMember(mlist, 'person@dom.ain'))
+        # Nonmembers' posts are counted but never reported.
+        for i in range(3):
+            self.assertFalse(Utils.IsVerboseMember(mlist, 'other@dom.ain'))
+        self.assertEqual(RateStore.count('verbose _xtest other@dom.ain'), 3)
+
+    def test_disabled(self):
+        mlist = self._mlist
+        mlist.member_verbosity_threshold = 0
+        for i in range(3):
+            self.assertFalse(Utils.IsVerboseMember(mlist, 'person@dom.ain'))
+        self.assertEqual(RateStore.count('verbose _xtest person@dom.ain'), 0)
+
+    def test_shared_between_processes(self):
+        # A post counted by another qrunner slice counts here too.
+        pid = os.fork()
+        if not pid:
+            try:
+                RateStore.hit('verbose _xtest person@dom.ain', 300)
+                RateStore.hit('verbose _xtest person@dom.ain', 300)
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertTrue(Utils.IsVerboseMember(self._mlist, 'person@dom.ain'))
+
+    def test_window(self):
+        now = time.time()
+        key = 'test'
+        self.assertEqual(RateStore.hit(key, 10, now), 1)
+        self.assertEqual(RateStore.hit(key, 10, now + 5), 2)
+        self.assertEqual(RateStore.count(key, now + 9), 2)
+        self.assertEqual(RateStore.hit(key, 10, now + 12), 2)
+        self.assertEqual(RateStore.count(key, now + 16), 1)
+        self.assertEqual(RateStore.count('other', now), 0)
+
+    def test_clean(self):
+        limit = mm_cfg.VERBOSE_CLEAN_LIMIT
+        mm_cfg.VERBOSE_CLEAN_LIMIT = 2
+        RateStore._hits = 0
+        try:
+            now = time.time()
+            RateStore.hit('idle', 10, now)
+            RateStore.hit('busy', 10, now + 20)
+            RateStore.hit('busy', 10, now + 20)
+        finally:
+            mm_cfg.VERBOSE_CLEAN_LIMIT = limit
+        conn = RateStore._connect()
+        self.assertEqual(
+            conn.execute('SELECT COUNT(*) FROM events').fetchone()[0], 2)
+
+
 
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestNoMembers))
     suite.addTest(unittest.makeSuite(TestMembers))
+    suite.addTest(unittest.makeSuite(TestGetPattern))
+    suite.addTest(unittest.makeSuite(TestVerboseMembers))
     return suite
 
 
@@ -0,0 +1,192 @@
+# Copyright (C) 2026 by the Free Software Foundation, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+
+"""Unit tests for the metrics registry."""
+
+import io
+import os
+import email
+import shutil
+import tempfile
+import unittest
+try:
+    from Mailman import __init__
+except ImportError:
+    import paths
+
+from Mailman import mm_cfg
+from Mailman import Metrics
+from Mailman import Message
+from Mailman.Queue.Switchboard import Switchboard
+from Mailman.Queue.Switchboard import MAXHOPS
+
+from TestBase import TestBase
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        Metrics.reset()
+
+    def tearDown(self):
+        Metrics.reset()
+
+    def test_counters_and_gauges(self):
+        Metrics.inc('bounces_total', list='a')
+        Metrics.inc('bounces_total', 2, list='a')
+        Metrics.inc('bounces_total', list='b')
+        Metrics.gauge('queued', 7)
+        self.assertEqual(Metrics.get('bounces_total', list='a'), 3)
+        self.assertEqual(Metrics.get('queued'), 7)
+        self.assertEqual(Metrics.get('bounces_total', list='c'), None)
+
+    def test_histogram(self):
+        for value in (0.00005, 0.0001, 0.002, 100):
+            Metrics.observe('seconds', value, detector='DSN')
+        histogram = Metrics.get('seconds', detector='DSN')
+        self.assertEqual(histogram.count, 4)
+        # The bucket bounds are inclusive.
+        self.assertEqual(histogram.counts[0], 2)
+        self.assertEqual(histogram.counts[-1], 1)
+
+    def test_format_and_parse(self):
+        Metrics.describe('bounces_total', 'Bounces')
+        Metrics.inc('bounces_total', list='we"ird\\list')
+        Metrics.observe('seconds', 0.002)
+        text = Metrics.format(runner='BounceRunner')
+        self.assertTrue('# HELP bounces_total Bounces\n' in text)
+        self.assertTrue('# TYPE seconds histogram\n' in text)
+        samples = Metrics.parse(io.StringIO(text))
+        self.assertTrue(('bounces_total',
+                         {'list': 'we"ird\\list', 'runner': 'BounceRunner'},
+                         1.0) in samples)
+        buckets = [(labels['le'], value) for name, labels, value in samples
+                   if name == 'seconds_bucket']
+        self.assertEqual(buckets[-1], ('+Inf', 1.0))
+        self.assertEqual(dict(buckets)['0.001'], 0.0)
+        self.assertEqual(dict(buckets)['0.005'], 1.0)
+        self.assertTrue(('seconds_count', {'runner': 'BounceRunner'}, 1.0)
+                        in samples)
+
+    def test_buckets(self):
+        Metrics.describe('latency_seconds', 'Latency', Metrics.LATENCY_BUCKETS)
+        Metrics.observe('latency_seconds', 7200)
+        histogram = Metrics.get('latency_seconds')
+        self.assertEqual(histogram.buckets, Metrics.LATENCY_BUCKETS)
+        self.assertEqual(histogram.counts[-1], 0)
+
+
+
+class TestStageMetrics(TestBase):
+    def setUp(self):
+        TestBase.setUp(self)
+        Metrics.reset()
+        self._enabled = mm_cfg.STAGE_METRICS
+        mm_cfg.STAGE_METRICS = 1
+        self._qdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._qdir)
+        mm_cfg.STAGE_METRICS = self._enabled
+        Metrics.reset()
+        TestBase.tearDown(self)
+
+    def test_hops(self):
+        switchboard = Switchboard(self._qdir)
+        msg = email.message_from_string('Subject: hop\n\n')
+        queue = os.path.basename(self._qdir)
+        msgdata = {}
+        for i in range(MAXHOPS + 1):
+            filebase = switchboard.enqueue(msg, msgdata, listname='_xtest')
+            msg, msgdata = switchboard.dequeue(filebase)
+            switchboard.finish(filebase)
+            if i == 0:
+                self.assertEqual(len(msgdata['hops']), 1)
+                self.assertEqual(msgdata['hops'][0][0], queue)
+                self.assertEqual(msgdata['hops'][0][1],
+                                 msgdata['received_time'])
+        self.assertEqual(len(msgdata['hops']), MAXHOPS)
+        mm_cfg.STAGE_METRICS = 0
+        filebase = switchboard.enqueue(msg, listname='_xtest')
+        msg, msgdata = switchboard.dequeue(filebase)
+        switchboard.finish(filebase)
+        self.assertFalse('hops' in msgdata)
+
+    def test_pipeline(self):
+        from Mailman.Queue.IncomingRunner import IncomingRunner
+        runner = IncomingRunner()
+        self._mlist.Unlock()
+        msg = email.message_from_string("""\
+From: aperson@dom.ain
+To: _xtest@dom.ain
+Subject: timed
+
+A message
+""", Message.Message)
+        msgdata = {'pipeline': ['Cleanse', 'CookHeaders']}
+        runner._dispose(self._mlist, msg, msgdata)
+        self._mlist.Lock()
+        for handler in ('Cleanse', 'CookHeaders'):
+            histogram = Metrics.get('mailman_handler_seconds',
+                                    handler=handler)
+            self.assertEqual(histogram.count, 1)
+        for name in ('mailman_list_lock_wait_seconds',
+                     'mailman_list_save_seconds'):
+            self.assertEqual(Metrics.get(name, list='_xtest').count, 1)
+
+
+
+class TestDetectorOrder(unittest.TestCase):
+    def setUp(self):
+        from Mailman.Bouncers import BouncerAPI
+        self._timings = BouncerAPI._timings.copy()
+        self._reorder = mm_cfg.BOUNCE_PIPELINE_AUTO_REORDER
+
+    def tearDown(self):
+        from Mailman.Bouncers import BouncerAPI
+        BouncerAPI._timings.clear()
+        BouncerAPI._timings.update(self._timings)
+        mm_cfg.BOUNCE_PIPELINE_AUTO_REORDER = self._reorder
+
+    def test_auto_reorder(self):
+        from Mailman.Bouncers import BouncerAPI
+        msg = email.message_from_string('Subject: bounce\n\n')
+        context = BouncerAPI.BounceContext(msg)
+        BouncerAPI._timings.clear()
+        BouncerAPI._timings['Yale'] = [10, 5, 0.0]
+        BouncerAPI._timings['Qmail'] = [10, 2, 0.0]
+        mm_cfg.BOUNCE_PIPELINE_AUTO_REORDER = 0
+        pipeline = BouncerAPI._pipeline(context)
+        self.assertEqual(pipeline[:2], ['Qmail', 'Postfix'])
+        mm_cfg.BOUNCE_PIPELINE_AUTO_REORDER = 1
+        pipeline = BouncerAPI._pipeline(context)
+        self.assertEqual(pipeline[:3], ['Yale', 'Qmail', 'Postfix'])
+        # No delivery-status parts, so DSN isn't tried.
+        self.assertFalse('DSN' in pipeline)
+
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestMetrics))
+    suite.addTest(unittest.makeSuite(TestDetectorOrder))
+    suite.addTest(unittest.makeSuite(TestStageMetrics))
+    return suite
+
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -17,6 +17,10 @@
 """Unit tests for the various Mailman/Queue/*Runner.py modules
 """
 
+import os
+import time
+import shutil
+import tempfile
 import unittest
 import email
 try:
@@ -25,6 +29,8 @@ except ImportError:
     import paths
 
 from Mailman.Queue.NewsRunner import prepare_message
+from Mailman.Queue.Switchboard import Switchboard
+from Mailman.Queue.Switchboard import percentile
 
 from TestBase import TestBase
 
@@ -112,10 +118,48 @@ A message
            ['no', 'maybe'])
 
 
+
+class TestSwitchboardStats(unittest.TestCase):
+    def setUp(self):
+        self._qdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._qdir)
+
+    def test_stats(self):
+        sb = Switchboard(self._qdir)
+        now = time.time()
+        for i in range(10):
+            msg = email.message_from_string('Subject: %d\n\n' % i)
+            sb.enqueue(msg, listname='_xtest', received_time=now - i)
+        sb.dequeue(sb.files()[0])
+        open(os.path.join(self._qdir, 'junk.tmp'), 'w').close()
+        ages = sb.stats(now=now)
+        self.assertEqual(sorted(ages), [(0, '.bak'), (0, '.pck')])
+        self.assertEqual(ages[(0, '.bak')], [9.0])
+        self.assertEqual(ages[(0, '.pck')], [float(i) for i in range(9)])
+        self.assertEqual(percentile(ages[(0, '.pck')], 50), 4.0)
+        self.assertEqual(percentile(ages[(0, '.pck')], 100), 8.0)
+        self.assertEqual(percentile([], 50), None)
+
+    def test_slices(self):
+        sb = Switchboard(self._qdir)
+        for i in range(20):
+            msg = email.message_from_string('Subject: %d\n\n' % i)
+            sb.enqueue(msg, listname='_xtest')
+        ages = sb.stats(numslices=4)
+        # Each slice's entries are the ones its runner would process.
+        for slice in range(4):
+            files = Switchboard(self._qdir, slice, 4).files()
+            self.assertEqual(len(ages.get((slice, '.pck'), [])), len(files))
+
+
+
 
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestPrepMessage))
+    suite.addTest(unittest.makeSuite(TestSwitchboardStats))
     return suite
 
 
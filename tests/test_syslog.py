@@ -0,0 +1,165 @@
+# Copyright (C) 2026 by the Free Software Foundation, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+
+"""Unit tests for the buffered logger."""
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+try:
+    from Mailman import __init__
+except ImportError:
+    import paths
+
+from Mailman import mm_cfg
+from Mailman.Logging import Syslog
+
+
+
+class Unformattable(object):
+    def __str__(self):
+        raise AssertionError('formatted a disabled message')
+
+
+
+class TestSyslog(unittest.TestCase):
+    def setUp(self):
+        self._saved = (mm_cfg.LOG_DIR, mm_cfg.LOG_DISABLED_CATEGORIES,
+                       mm_cfg.LOG_IMMEDIATE_CATEGORIES,
+                       mm_cfg.LOG_FLUSH_INTERVAL, mm_cfg.LOG_WRITER_THREAD)
+        mm_cfg.LOG_DIR = tempfile.mkdtemp()
+        mm_cfg.LOG_DISABLED_CATEGORIES = ['debug']
+        mm_cfg.LOG_IMMEDIATE_CATEGORIES = ['error']
+        mm_cfg.LOG_FLUSH_INTERVAL = mm_cfg.hours(1)
+        mm_cfg.LOG_WRITER_THREAD = 0
+        self._syslog = None
+
+    def tearDown(self):
+        if self._syslog is not None:
+            self._syslog.shutdown()
+            self._syslog.close()
+        shutil.rmtree(mm_cfg.LOG_DIR)
+        (mm_cfg.LOG_DIR, mm_cfg.LOG_DISABLED_CATEGORIES,
+         mm_cfg.LOG_IMMEDIATE_CATEGORIES, mm_cfg.LOG_FLUSH_INTERVAL,
+         mm_cfg.LOG_WRITER_THREAD) = self._saved
+
+    def _make(self):
+        self._syslog = Syslog._Syslog()
+        return self._syslog
+
+    def _read(self, kind):
+        path = os.path.join(mm_cfg.LOG_DIR, kind)
+        if not os.path.exists(path):
+            return ''
+        with open(path) as fp:
+            return fp.read()
+
+    def test_disabled(self):
+        syslog = self._make()
+        self.assertFalse(syslog.enabled('debug'))
+        self.assertTrue(syslog.enabled('post'))
+        syslog('debug', 'never %s', Unformattable())
+        syslog.flush()
+        self.assertFalse(os.path.exists(os.path.join(mm_cfg.LOG_DIR,
+                                                     'debug')))
+
+    def test_buffered(self):
+        syslog = self._make()
+        syslog('post', 'post to %s', '_xtest')
+        self.assertEqual(self._read('post'), '')
+        syslog.flush()
+        self.assertTrue(self._read('post').endswith(
+            '(%d) post to _xtest\n' % os.getpid()))
+
+    def test_timestamp(self):
+        # Buffered lines are stamped with the time they were logged.
+        syslog = self._make()
+        realtime = time.time
+        time.time = lambda: 0.0
+        try:
+            syslog('post', 'long ago')
+        finally:
+            time.time = realtime
+        syslog.flush()
+        stamp = time.strftime('%b %d %H:%M:%S %Y', time.localtime(0))
+        self.assertTrue(self._read('post').startswith(stamp))
+
+    def test_immediate(self):
+        syslog = self._make()
+        syslog('error', 'oops')
+        self.assertTrue(self._read('error').endswith(' oops\n'))
+        mm_cfg.LOG_FLUSH_INTERVAL = 0
+        syslog = self._make()
+        syslog('post', 'unbuffered')
+        self.assertTrue(self._read('post').endswith(' unbuffered\n'))
+
+    def test_max_pending(self):
+        syslog = self._make()
+        for i in range(Syslog.MAX_PENDING):
+            syslog('post', 'line %d', i)
+        self.assertEqual(len(self._read('post').splitlines()),
+                         Syslog.MAX_PENDING)
+
+    def test_flush_if_due(self):
+        syslog = self._make()
+        syslog('post', 'waiting')
+        syslog.flush_if_due()
+        self.assertEqual(self._read('post'), '')
+        # E.g. a qrunner finishing a message long after it logged this.
+        syslog._lastflush -= mm_cfg.LOG_FLUSH_INTERVAL
+        syslog.flush_if_due()
+        self.assertTrue(self._read('post').endswith(' waiting\n'))
+
+    def test_close(self):
+        # Closing, e.g. to reopen rotated logs, writes out the buffered lines
+        # first.
+        syslog = self._make()
+        syslog('post', 'before')
+        syslog.close()
+        self.assertTrue(self._read('post').endswith(' before\n'))
+        os.rename(os.path.join(mm_cfg.LOG_DIR, 'post'),
+                  os.path.join(mm_cfg.LOG_DIR, 'post.1'))
+        syslog('post', 'after')
+        syslog.flush()
+        self.assertTrue(self._read('post').endswith(' after\n'))
+        self.assertEqual(len(self._read('post').splitlines()), 1)
+
+    def test_writer_thread(self):
+        mm_cfg.LOG_FLUSH_INTERVAL = 0.1
+        mm_cfg.LOG_WRITER_THREAD = 1
+        syslog = self._make()
+        syslog('post', 'threaded')
+        deadline = time.time() + 10
+        while not self._read('post') and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertTrue(self._read('post').endswith(' threaded\n'))
+        syslog.shutdown()
+        self.assertEqual(syslog._thread, None)
+
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestSyslog))
+    return suite
+
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,130 @@
+# Copyright (C) 2026 by the Free Software Foundation, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+
+"""Unit tests for template lookup."""
+
+import os
+import time
+import errno
+import unittest
+try:
+    from Mailman import __init__
+except ImportError:
+    import paths
+
+from Mailman import mm_cfg
+from Mailman import Utils
+
+from TestBase import TestBase
+
+
+
+class TestFindText(TestBase):
+    def setUp(self):
+        TestBase.setUp(self)
+        self._size = mm_cfg.TEMPLATE_CACHE_SIZE
+        Utils._template_paths.clear()
+        Utils._template_texts.clear()
+        self._langdir = os.path.join(self._mlist.fullpath(), 'en')
+        self._default = Utils.maketext('postack.txt', raw=True)
+
+    def tearDown(self):
+        mm_cfg.TEMPLATE_CACHE_SIZE = self._size
+        TestBase.tearDown(self)
+
+    def _write(self, text, delay=0):
+        if not os.path.isdir(self._langdir):
+            os.mkdir(self._langdir)
+        filename = os.path.join(self._langdir, 'postack.txt')
+        with open(filename, 'w') as fp:
+            fp.write(text)
+        if delay:
+            # Make the change visible however coarse the file system's
+            # timestamps are.
+            mtime = time.time() + delay
+            os.utime(filename, (mtime, mtime))
+            os.utime(self._langdir, (mtime, mtime))
+
+    def test_cached(self):
+        mlist = self._mlist
+        text, filename = Utils.findtext('postack.txt', raw=True, mlist=mlist)
+        self.assertEqual(text, self._default)
+        self.assertEqual(filename,
+                         os.path.join(mm_cfg.TEMPLATE_DIR, 'en', 'postack.txt'))
+        self.assertEqual(len(Utils._template_paths), 2)
+        self.assertEqual(list(Utils._template_texts), [filename])
+        self.assertEqual(
+            Utils.findtext('postack.txt', raw=True, mlist=mlist)[1], filename)
+        self.assertEqual(len(Utils._template_paths), 2)
+
+    def test_list_template_added(self):
+        mlist = self._mlist
+        Utils.maketext('postack.txt', raw=True, mlist=mlist)
+        self._write('list specific %(x)s', 1)
+        self.assertEqual(
+            Utils.maketext('postack.txt', {'x': 'one'}, raw=True, mlist=mlist),
+            'list specific one')
+        # Edits are picked up too.
+        self._write('edited %(x)s', 2)
+        self.assertEqual(
+            Utils.maketext('postack.txt', {'x': 'two'}, raw=True, mlist=mlist),
+            'edited two')
+        os.unlink(os.path.join(self._langdir, 'postack.txt'))
+        self.assertEqual(
+            Utils.maketext('postack.txt', raw=True, mlist=mlist),
+            self._default)
+
+    def test_bounded(self):
+        mm_cfg.TEMPLATE_CACHE_SIZE = 2
+        for name in ('postack.txt', 'postheld.txt', 'verify.txt'):
+            Utils.maketext(name, raw=True)
+        self.assertTrue(len(Utils._template_paths) <= 2)
+        self.assertTrue(len(Utils._template_texts) <= 2)
+
+    def test_disabled(self):
+        Utils._template_paths.clear()
+        Utils._template_texts.clear()
+        mm_cfg.TEMPLATE_CACHE_SIZE = 0
+        self.assertEqual(Utils.maketext('postack.txt', raw=True),
+                         self._default)
+        self.assertEqual(Utils._template_paths, {})
+        self.assertEqual(Utils._template_texts, {})
+
+    def test_missing(self):
+        try:
+            Utils.maketext('nonexistent.txt', mlist=self._mlist)
+        except IOError as e:
+            self.assertEqual(e.errno, errno.ENOENT)
+        else:
+            self.fail('IOError not raised')
+
+    def test_warm(self):
+        Utils.warm_templates()
+        self.assertTrue(os.path.join(mm_cfg.TEMPLATE_DIR, 'en', 'postack.txt')
+                        in Utils._template_texts)
+
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestFindText))
+    return suite
+
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -18,8 +18,9 @@
 
 import unittest
 
-MODULES = ('bounces', 'handlers', 'membership', 'safedict',
-           'security_mgr', 'runners', 'lockfile', 'smtp',
+MODULES = ('archiver', 'bounces', 'bouncer', 'handlers', 'membership',
+           'metrics', 'safedict', 'security_mgr', 'runners', 'lockfile',
+           'smtp', 'syslog', 'templates', 'i18n', 'cgi',
            )
 
 # test_message.py can only be run when mailmanctl is running, but mailmanctl